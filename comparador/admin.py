@@ -1,3 +1,274 @@
-from django.contrib import admin
+from contextlib import contextmanager
 
-# Register your models here.
+from django.contrib import admin, messages
+from django.core.paginator import Paginator
+from django.db import connection
+from django.utils.functional import cached_property
+
+from .models import (
+    AliasCompeticion, AliasEquipo, CasaApuestas, Competicion, Cuota, Deporte, EstadisticaMargen,
+    EstadisticasCasa, Equipo, Evento, MargenMercado, TipoCuota, VersionDatos,
+)
+from .cambios import compactar
+from .estadisticas import contar_cuotas_abiertas, registrar_cambio_cuotas, registrar_finalizacion
+from .margenes import actualizar_margenes
+from .referencias import CLAVE_REFERENCIAS
+from .versiones import incrementar_version, lote_escritura
+
+
+class PaginadorEstimado(Paginator):
+    """Paginador que estima el total de filas de las tablas grandes sin COUNT(*)"""
+
+    @cached_property
+    def count(self):
+        query = getattr(self.object_list, 'query', None)
+        if query is not None and not query.where:
+            estimado = estimar_filas(self.object_list.model)
+            if estimado is not None:
+                return estimado
+        return super().count
+
+
+def estimar_filas(modelo):
+    """Número aproximado de filas de la tabla de un modelo según las estadísticas del motor"""
+    tabla = modelo._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE relname = %s', [tabla])
+        elif connection.vendor == 'mysql':
+            cursor.execute(
+                'SELECT table_rows FROM information_schema.tables '
+                'WHERE table_schema = DATABASE() AND table_name = %s',
+                [tabla],
+            )
+        elif connection.vendor == 'sqlite':
+            # MAX(rowid) se resuelve con el índice de la clave primaria
+            cursor.execute(f'SELECT MAX(rowid) FROM {connection.ops.quote_name(tabla)}')
+        else:
+            return None
+        fila = cursor.fetchone()
+    if fila is None or fila[0] is None or fila[0] < 0:
+        return None
+    return int(fila[0])
+
+
+class AdminTablaGrande(admin.ModelAdmin):
+    """Valores por defecto para tablas que crecen sin límite"""
+    paginator = PaginadorEstimado
+    show_full_result_count = False
+    list_per_page = 50
+
+
+class AdminEscrituraAgrupada(admin.ModelAdmin):
+    """
+    Los borrados, con sus cascadas, aplican un solo incremento de versión y una sola
+    compactación del registro de cambios, y las estadísticas por casa descuentan las
+    cuotas borradas.
+    """
+
+    def cuotas_afectadas(self, queryset):
+        """Cuotas que se borran con los objetos del queryset, o None si no cuentan en las estadísticas"""
+        return None
+
+    @contextmanager
+    def descontar_cuotas(self, queryset):
+        cuotas = self.cuotas_afectadas(queryset)
+        borradas = contar_cuotas_abiertas(cuotas) if cuotas is not None else {}
+        yield
+        registrar_cambio_cuotas(bajas=borradas)
+        # Las cuotas no emiten señales de borrado: se cubre aquí el borrado directo
+        incrementar_version()
+        compactar()
+
+    def delete_model(self, request, obj):
+        with lote_escritura(), self.descontar_cuotas(self.model.objects.filter(pk=obj.pk)):
+            super().delete_model(request, obj)
+
+    def delete_queryset(self, request, queryset):
+        with lote_escritura(), self.descontar_cuotas(queryset):
+            super().delete_queryset(request, queryset)
+
+
+@admin.register(CasaApuestas)
+class CasaApuestasAdmin(AdminEscrituraAgrupada):
+    list_display = ['nombre', 'url', 'activa', 'fecha_creacion']
+    list_filter = ['activa']
+    search_fields = ['nombre']
+    actions = ['activar_casas', 'desactivar_casas']
+
+    @admin.action(description='Activar casas seleccionadas')
+    def activar_casas(self, request, queryset):
+        with lote_escritura():
+            actualizadas = queryset.update(activa=True)
+            incrementar_version()
+            incrementar_version(CLAVE_REFERENCIAS)
+        self.message_user(request, f'{actualizadas} casas activadas', messages.SUCCESS)
+
+    @admin.action(description='Desactivar casas seleccionadas')
+    def desactivar_casas(self, request, queryset):
+        with lote_escritura():
+            actualizadas = queryset.update(activa=False)
+            incrementar_version()
+            incrementar_version(CLAVE_REFERENCIAS)
+        self.message_user(request, f'{actualizadas} casas desactivadas', messages.SUCCESS)
+
+
+@admin.register(Deporte)
+class DeporteAdmin(AdminEscrituraAgrupada):
+    list_display = ['nombre', 'slug', 'icono']
+    search_fields = ['nombre', 'slug']
+    prepopulated_fields = {'slug': ['nombre']}
+
+    def cuotas_afectadas(self, queryset):
+        return Cuota.objects.filter(evento__deporte__in=queryset)
+
+
+@admin.register(TipoCuota)
+class TipoCuotaAdmin(AdminEscrituraAgrupada):
+    list_display = ['nombre', 'codigo']
+    search_fields = ['nombre', 'codigo']
+
+    def cuotas_afectadas(self, queryset):
+        return Cuota.objects.filter(tipo_cuota__in=queryset)
+
+
+class AliasEquipoInline(admin.TabularInline):
+    model = AliasEquipo
+    fields = ['deporte', 'alias']
+    extra = 0
+
+
+class AliasCompeticionInline(admin.TabularInline):
+    model = AliasCompeticion
+    fields = ['deporte', 'alias']
+    extra = 0
+
+
+@admin.register(Equipo)
+class EquipoAdmin(admin.ModelAdmin):
+    list_display = ['nombre', 'deporte', 'nombre_normalizado']
+    list_select_related = ['deporte']
+    list_filter = ['deporte']
+    search_fields = ['nombre', 'nombre_normalizado']
+    inlines = [AliasEquipoInline]
+
+
+@admin.register(Competicion)
+class CompeticionAdmin(admin.ModelAdmin):
+    list_display = ['nombre', 'deporte', 'pais', 'nombre_normalizado']
+    list_select_related = ['deporte']
+    list_filter = ['deporte']
+    search_fields = ['nombre', 'nombre_normalizado']
+    inlines = [AliasCompeticionInline]
+
+
+@admin.register(Evento)
+class EventoAdmin(AdminEscrituraAgrupada, AdminTablaGrande):
+    list_display = ['id', 'equipo_local', 'equipo_visitante', 'deporte', 'liga', 'fecha_evento', 'finalizado']
+    list_select_related = ['deporte']
+    list_filter = ['finalizado', 'deporte']
+    date_hierarchy = 'fecha_evento'
+    # Búsqueda por prefijo con índice propio por columna (migración 0009): LIKE 'x%' en
+    # lugar de LIKE '%x%' sobre toda la tabla
+    search_fields = ['^equipo_local', '^equipo_visitante', '=id']
+    autocomplete_fields = ['deporte', 'local', 'visitante', 'competicion']
+    ordering = ['-fecha_evento']
+    actions = ['finalizar_eventos', 'reabrir_eventos']
+
+    def cuotas_afectadas(self, queryset):
+        return Cuota.objects.filter(evento__in=queryset)
+
+    def cambiar_estado(self, queryset, finalizados):
+        """Finaliza o reabre los eventos que cambian de estado y ajusta lo que solo cubre eventos abiertos"""
+        with lote_escritura():
+            eventos_ids = list(queryset.filter(finalizado=not finalizados).values_list('id', flat=True))
+            Evento.objects.filter(id__in=eventos_ids).update(finalizado=finalizados)
+            registrar_finalizacion(eventos_ids, finalizados)
+            # Los márgenes solo cubren eventos abiertos: se retiran al finalizar y se recalculan al reabrir
+            actualizar_margenes(eventos_ids)
+            incrementar_version()
+        return len(eventos_ids)
+
+    @admin.action(description='Marcar eventos seleccionados como finalizados')
+    def finalizar_eventos(self, request, queryset):
+        actualizados = self.cambiar_estado(queryset, finalizados=True)
+        self.message_user(request, f'{actualizados} eventos finalizados', messages.SUCCESS)
+
+    @admin.action(description='Reabrir eventos seleccionados')
+    def reabrir_eventos(self, request, queryset):
+        actualizados = self.cambiar_estado(queryset, finalizados=False)
+        self.message_user(request, f'{actualizados} eventos reabiertos', messages.SUCCESS)
+
+    def save_model(self, request, obj, form, change):
+        with lote_escritura():
+            super().save_model(request, obj, form, change)
+            if change and 'finalizado' in form.changed_data:
+                registrar_finalizacion([obj.id], obj.finalizado)
+                actualizar_margenes([obj.id])
+
+
+@admin.register(Cuota)
+class CuotaAdmin(AdminEscrituraAgrupada, AdminTablaGrande):
+    list_display = [
+        'id', 'evento', 'casa_apuestas', 'tipo_cuota', 'opcion', 'valor', 'valor_anterior', 'fecha_actualizacion',
+    ]
+    # Una sola consulta por página en lugar de tres relaciones por fila
+    list_select_related = ['evento', 'casa_apuestas', 'tipo_cuota']
+    list_filter = ['casa_apuestas', 'tipo_cuota']
+    search_fields = ['=evento__id']
+    raw_id_fields = ['evento']
+    autocomplete_fields = ['casa_apuestas', 'tipo_cuota']
+    readonly_fields = ['fecha_actualizacion', 'fecha_creacion']
+    ordering = ['-id']
+
+    def cuotas_afectadas(self, queryset):
+        return queryset
+
+    def save_model(self, request, obj, form, change):
+        # Un alta, o un cambio de casa o de evento, mueve la cuota entre contadores
+        anterior = contar_cuotas_abiertas(Cuota.objects.filter(pk=obj.pk)) if change else {}
+        with lote_escritura():
+            super().save_model(request, obj, form, change)
+            actual = contar_cuotas_abiertas(Cuota.objects.filter(pk=obj.pk))
+            if actual != anterior:
+                registrar_cambio_cuotas(altas=actual, bajas=anterior)
+
+
+class AdminSoloLectura(admin.ModelAdmin):
+    """Datos derivados: se recalculan con sus comandos, no se editan a mano"""
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(MargenMercado)
+class MargenMercadoAdmin(AdminSoloLectura, AdminTablaGrande):
+    list_display = ['id', 'evento', 'casa_apuestas', 'tipo_cuota', 'deporte', 'opciones', 'margen']
+    list_select_related = ['evento', 'casa_apuestas', 'tipo_cuota', 'deporte']
+    list_filter = ['casa_apuestas', 'deporte']
+    raw_id_fields = ['evento']
+    ordering = ['-id']
+
+
+@admin.register(EstadisticaMargen)
+class EstadisticaMargenAdmin(AdminSoloLectura):
+    list_display = ['casa_apuestas', 'deporte', 'mercados', 'margen_medio', 'margen_p50', 'margen_p90']
+    list_select_related = ['casa_apuestas', 'deporte']
+    list_filter = ['casa_apuestas']
+
+
+@admin.register(EstadisticasCasa)
+class EstadisticasCasaAdmin(AdminSoloLectura):
+    list_display = ['casa_apuestas', 'total_cuotas', 'eventos_cubiertos', 'ultima_actualizacion']
+    list_select_related = ['casa_apuestas']
+
+
+@admin.register(VersionDatos)
+class VersionDatosAdmin(AdminSoloLectura):
+    list_display = ['clave', 'version', 'fecha_actualizacion']
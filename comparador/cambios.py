@@ -0,0 +1,77 @@
+"""
+Registro de cambios de cuotas para clientes que consultan por sondeo (?desde=<secuencia>)
+
+Cada escritura de una cuota la marca con el siguiente número de una secuencia global
+(el contador CLAVE_CAMBIOS de VersionDatos), reservado en la transacción de la propia
+escritura. El registro es la tabla de cuotas: solo conserva el último cambio de cada
+una, así que ponerse al día cuesta lo que los cambios y no lo que el catálogo. Los
+borrados no dejan rastro: reservan un número nuevo de la secuencia y mueven hasta él
+la marca de compactación, así que todo cliente anterior al borrado debe resincronizar.
+Los borrados en cascada compactan con el objeto padre; quien borre cuotas directamente
+llama a compactar().
+"""
+from django.db import transaction
+
+from .models import CLAVE_CAMBIOS, Cuota, VersionDatos
+from .referencias import referencias_con
+from .versiones import diferir, fijar_version
+
+CLAVE_COMPACTACION = 'cambios_compactados'
+
+
+class ResincronizacionNecesaria(Exception):
+    """La secuencia del cliente (distinta de 0) es anterior a la última compactación, o posterior a la actual"""
+
+
+def compactar():
+    """Invalida las secuencias anteriores al borrado de cuotas; en un lote de escritura, una vez al final"""
+    diferir(_compactar)
+
+
+def _compactar():
+    # Un número nuevo: la marca en la secuencia actual no alcanzaría al cliente que ya está en ella
+    with transaction.atomic():
+        fijar_version(CLAVE_COMPACTACION, VersionDatos.reservar(CLAVE_CAMBIOS))
+
+
+def cambios_desde(desde, limite):
+    """Cuotas escritas después de `desde`, en orden de secuencia y como mucho `limite`"""
+    # Marca y secuencia en una sola lectura de la base de datos, compartida entre procesos
+    contadores = dict(VersionDatos.objects.filter(
+        clave__in=[CLAVE_COMPACTACION, CLAVE_CAMBIOS]
+    ).values_list('clave', 'version'))
+    minimo, actual = contadores.get(CLAVE_COMPACTACION, 0), contadores.get(CLAVE_CAMBIOS, 0)
+    # desde=0 es una resincronización completa: la tabla solo guarda cuotas vigentes,
+    # así que recorrerla desde el principio nunca devuelve cuotas ya borradas
+    if desde > actual or 0 < desde < minimo:
+        raise ResincronizacionNecesaria(minimo, actual)
+
+    # limite + 1 filas para saber si quedan más sin contarlas
+    filas = list(Cuota.objects.filter(secuencia__gt=desde).order_by('secuencia').values_list(
+        'secuencia', 'evento_id', 'casa_apuestas_id', 'tipo_cuota_id', 'opcion', 'valor', 'valor_anterior'
+    )[:limite + 1])
+    completo = len(filas) <= limite
+    filas = filas[:limite]
+
+    referencias = referencias_con({fila[2] for fila in filas}, {fila[3] for fila in filas})
+    casas, tipos = referencias.casas_por_id, referencias.tipos_por_id
+    return {
+        'desde': desde,
+        'siguiente': filas[-1][0] if filas else desde,
+        'actual': actual,
+        'completo': completo,
+        'cambios': [
+            {
+                'secuencia': secuencia,
+                'evento': evento_id,
+                'casa': casas[casa_id].nombre,
+                'tipo': tipos[tipo_id].codigo,
+                'opcion': opcion,
+                'valor': valor,
+                'valor_anterior': valor_anterior,
+            }
+            for secuencia, evento_id, casa_id, tipo_id, opcion, valor, valor_anterior in filas
+            # Casa o tipo borrados entre ambas lecturas: sus cuotas ya no existen
+            if casa_id in casas and tipo_id in tipos
+        ],
+    }
@@ -0,0 +1,156 @@
+"""
+Generador de carga HTTP asíncrono para medir cuántas peticiones por segundo aguanta la app
+
+Cada trabajador mantiene su propia conexión keep-alive (asyncio.open_connection, sin
+dependencias externas) y lanza peticiones GET en bucle cerrado sobre una mezcla
+ponderada de URLs sacadas de los datos cargados. Las latencias del calentamiento no
+cuentan en el informe.
+"""
+import asyncio
+import random
+import time
+from collections import Counter, defaultdict
+from urllib.parse import quote
+
+import numpy as np
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import Equipo, Evento
+from .referencias import obtener_referencias
+
+# Peso relativo de cada vista en la mezcla por defecto
+MEZCLA_POR_DEFECTO = {
+    'index': 20,
+    'evento_detalle': 40,
+    'eventos_por_deporte': 15,
+    'mejores_cuotas': 15,
+    'buscar': 10,
+}
+PERCENTILES = (50, 95, 99)
+
+
+def urls_de_prueba(eventos=200, busquedas=50):
+    """Rutas por vista a partir de los datos: próximos eventos, deportes, tipos y equipos"""
+    referencias = obtener_referencias()
+    proximos = Evento.objects.filter(
+        finalizado=False, fecha_evento__gte=timezone.now()
+    ).order_by('fecha_evento').values_list('id', flat=True)[:eventos]
+    mejores = reverse('comparador:mejores_cuotas')
+    return {
+        'index': [reverse('comparador:index')],
+        'evento_detalle': [reverse('comparador:evento_detalle', args=[evento_id]) for evento_id in proximos],
+        'eventos_por_deporte': [
+            reverse('comparador:eventos_por_deporte', args=[deporte.slug]) for deporte in referencias.deportes
+        ],
+        'mejores_cuotas': [mejores] + [f'{mejores}?tipo={quote(tipo.codigo)}' for tipo in referencias.tipos_cuota],
+        'buscar': [
+            f"{reverse('comparador:buscar')}?q={quote(nombre.split()[0])}"
+            for nombre in Equipo.objects.order_by('id').values_list('nombre', flat=True)[:busquedas]
+        ],
+    }
+
+
+async def _leer_respuesta(lector):
+    """Consume una respuesta completa; retorna (estado, si la conexión puede reutilizarse)"""
+    linea = await lector.readline()
+    if not linea:
+        raise ConnectionError('Conexión cerrada por el servidor')
+    estado = int(linea.split()[1])
+    cabeceras = {}
+    while (linea := await lector.readline()) not in (b'\r\n', b'\n', b''):
+        nombre, _, valor = linea.decode('latin-1').partition(':')
+        cabeceras[nombre.strip().lower()] = valor.strip().lower()
+
+    reutilizable = cabeceras.get('connection') != 'close'
+    if 'content-length' in cabeceras:
+        await lector.readexactly(int(cabeceras['content-length']))
+    elif cabeceras.get('transfer-encoding') == 'chunked':
+        while tamano := int((await lector.readline()).split(b';')[0], 16):
+            await lector.readexactly(tamano + 2)
+        await lector.readline()
+    elif estado not in (204, 304):
+        # Sin longitud: el cuerpo termina al cerrar la conexión
+        await lector.read()
+        reutilizable = False
+    return estado, reutilizable
+
+
+async def ejecutar_carga(host, puerto, urls, mezcla, concurrencia=20, duracion=30, calentamiento=5,
+                         tiempo_espera=10, cabeceras=None, semilla=None):
+    """Lanza la carga y retorna (latencias por vista, errores por vista, segundos medidos)"""
+    vistas = [vista for vista in mezcla if mezcla[vista] > 0 and urls.get(vista)]
+    pesos = [mezcla[vista] for vista in vistas]
+    extra = ''.join(f'{nombre}: {valor}\r\n' for nombre, valor in (cabeceras or {}).items())
+    latencias = defaultdict(list)
+    errores = defaultdict(Counter)
+
+    inicio_medida = time.perf_counter() + calentamiento
+    fin = inicio_medida + duracion
+
+    async def trabajador(numero):
+        aleatorio = random.Random(None if semilla is None else semilla + numero)
+        conexion = None
+        while (inicio := time.perf_counter()) < fin:
+            vista = aleatorio.choices(vistas, pesos)[0]
+            ruta = aleatorio.choice(urls[vista])
+            error = None
+            try:
+                if conexion is None:
+                    conexion = await asyncio.wait_for(asyncio.open_connection(host, puerto), tiempo_espera)
+                lector, escritor = conexion
+                escritor.write(
+                    f'GET {ruta} HTTP/1.1\r\nHost: {host}:{puerto}\r\nConnection: keep-alive\r\n{extra}\r\n'.encode()
+                )
+                estado, reutilizable = await asyncio.wait_for(_leer_respuesta(lector), tiempo_espera)
+                if estado >= 400:
+                    error = f'http_{estado}'
+            except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError, IndexError) as exc:
+                error = type(exc).__name__
+                reutilizable = False
+            transcurrido = time.perf_counter() - inicio
+
+            if not reutilizable and conexion is not None:
+                conexion[1].close()
+                conexion = None
+            if inicio >= inicio_medida:
+                latencias[vista].append(transcurrido)
+                if error:
+                    errores[vista][error] += 1
+        if conexion is not None:
+            conexion[1].close()
+
+    await asyncio.gather(*(trabajador(numero) for numero in range(concurrencia)))
+    return latencias, errores, time.perf_counter() - inicio_medida
+
+
+def _resumen(latencias, errores, segundos):
+    latencias = np.asarray(latencias) * 1000
+    fallidas = sum(errores.values())
+    resumen = {
+        'peticiones': len(latencias),
+        'por_segundo': round(len(latencias) / segundos, 1) if segundos > 0 else 0.0,
+        'errores': fallidas,
+        'tasa_error': round(fallidas / len(latencias), 4) if len(latencias) else 0.0,
+        'detalle_errores': dict(errores),
+    }
+    if len(latencias):
+        resumen['latencia_ms'] = {
+            **{f'p{p}': round(float(valor), 2) for p, valor in zip(PERCENTILES, np.percentile(latencias, PERCENTILES))},
+            'media': round(float(latencias.mean()), 2),
+            'max': round(float(latencias.max()), 2),
+        }
+    return resumen
+
+
+def informe(latencias, errores, segundos):
+    """Rendimiento, percentiles de latencia y errores, en total y por vista"""
+    total_errores = Counter()
+    for por_tipo in errores.values():
+        total_errores.update(por_tipo)
+    todas = [latencia for valores in latencias.values() for latencia in valores]
+    return {
+        'segundos': round(segundos, 2),
+        'total': _resumen(todas, total_errores, segundos),
+        'vistas': {vista: _resumen(latencias[vista], errores[vista], segundos) for vista in sorted(latencias)},
+    }
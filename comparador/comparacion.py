@@ -0,0 +1,91 @@
+"""
+Comparación de cuotas de varios eventos a la vez (listas de seguimiento)
+
+La comparación de cada evento se guarda en caché bajo la versión de datos vigente y
+la respuesta se monta con un único get_many; los eventos que faltan se calculan juntos
+con una consulta para los eventos y otra para sus cuotas, sea cual sea su número.
+"""
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Cuota, Evento
+from .referencias import referencias_con
+from .versiones import obtener_version
+
+
+def _clave(version, evento_id):
+    return f'comparador:comparacion:{version}:{evento_id}'
+
+
+def calcular_comparaciones(eventos_ids):
+    """Comparación por mercado y opción de cada evento existente, indexada por id"""
+    comparaciones = {
+        evento.id: {
+            'id': evento.id,
+            'local': evento.equipo_local,
+            'visitante': evento.equipo_visitante,
+            'deporte': evento.deporte.slug,
+            'liga': evento.liga,
+            'fecha_evento': evento.fecha_evento.isoformat(),
+            'finalizado': evento.finalizado,
+            'mercados': {},
+        }
+        for evento in Evento.objects.filter(id__in=eventos_ids).select_related('deporte')
+    }
+
+    filas = list(Cuota.objects.filter(
+        evento_id__in=list(comparaciones), casa_apuestas__activa=True
+    ).order_by('evento_id', 'tipo_cuota_id', 'opcion', '-valor').values_list(
+        'evento_id', 'casa_apuestas_id', 'tipo_cuota_id', 'opcion', 'valor', 'valor_anterior'
+    ))
+    # Casas o tipos creados en otro proceso sin pasar por las señales: una recarga
+    referencias = referencias_con({fila[1] for fila in filas}, {fila[2] for fila in filas})
+
+    opciones = defaultdict(list)
+    for evento_id, casa_id, tipo_id, opcion, valor, anterior in filas:
+        casa = referencias.casas_por_id.get(casa_id)
+        if casa is None or tipo_id not in referencias.tipos_por_id:
+            continue
+        opciones[(evento_id, tipo_id, opcion)].append(
+            {'casa': casa.nombre, 'valor': valor, 'valor_anterior': anterior}
+        )
+
+    for (evento_id, tipo_id, opcion), cuotas in opciones.items():
+        tipo = referencias.tipos_por_id[tipo_id]
+        mercado = comparaciones[evento_id]['mercados'].setdefault(tipo.codigo, {'nombre': tipo.nombre, 'opciones': {}})
+        # Ordenadas de mayor a menor: la primera es la mejor
+        mercado['opciones'][opcion] = {'mejor': cuotas[0], 'cuotas': cuotas}
+    return comparaciones
+
+
+def obtener_comparaciones(eventos_ids, tipos=None, version=None):
+    """(comparaciones en el orden pedido, ids inexistentes), desde la caché de la versión vigente"""
+    if version is None:
+        version, _ = obtener_version()
+    claves = {evento_id: _clave(version, evento_id) for evento_id in eventos_ids}
+    en_cache = cache.get_many(claves.values())
+    comparaciones = {evento_id: en_cache[clave] for evento_id, clave in claves.items() if clave in en_cache}
+
+    faltan = [evento_id for evento_id in eventos_ids if evento_id not in comparaciones]
+    if faltan:
+        nuevas = calcular_comparaciones(faltan)
+        cache.set_many(
+            {claves[evento_id]: comparacion for evento_id, comparacion in nuevas.items()},
+            timeout=settings.COMPARADOR_CACHE_COMPARACION,
+        )
+        comparaciones.update(nuevas)
+
+    resultado = []
+    for evento_id in eventos_ids:
+        comparacion = comparaciones.get(evento_id)
+        if comparacion is None:
+            continue
+        if tipos:
+            comparacion = {
+                **comparacion,
+                'mercados': {codigo: mercado for codigo, mercado in comparacion['mercados'].items() if codigo in tipos},
+            }
+        resultado.append(comparacion)
+    return resultado, [evento_id for evento_id in eventos_ids if evento_id not in comparaciones]
@@ -0,0 +1,139 @@
+"""
+Probabilidades justas por consenso del mercado y detección de apuestas de valor
+"""
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.utils import timezone
+
+from .models import Cuota
+from .referencias import obtener_referencias
+from .versiones import obtener_version
+
+TAMANO_BLOQUE = 10000
+
+
+def cargar_cuotas_consenso(tamano_bloque=TAMANO_BLOQUE):
+    """Cuotas de eventos abiertos y por jugar en casas activas: (ids, matriz[evento, casa, tipo, opcion], valores)"""
+    # Los eventos ya empezados no se muestran: no cuentan para el consenso ni el ranking
+    consulta = Cuota.objects.filter(
+        evento__finalizado=False, evento__fecha_evento__gte=timezone.now(), casa_apuestas__activa=True, valor__gt=0
+    ).order_by().values_list('id', 'evento_id', 'casa_apuestas_id', 'tipo_cuota_id', 'opcion', 'valor')
+    # Filas crudas del cursor por bloques: cada bloque pasa a arrays antes de leer el siguiente,
+    # sin un Decimal ni una tupla por cuota para todo el resultado
+    sql, params = consulta.query.sql_with_params()
+    codigos_opcion = {}
+    ids, matrices, valores = [], [], []
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        while filas := cursor.fetchmany(tamano_bloque):
+            ids_bloque, eventos, casas, tipos, opciones, valores_bloque = zip(*filas)
+            # Las opciones son texto: se sustituyen por un código entero por opción distinta
+            codigos = [codigos_opcion.setdefault(opcion, len(codigos_opcion)) for opcion in opciones]
+            ids.append(np.array(ids_bloque, dtype=np.int64))
+            matrices.append(np.column_stack([eventos, casas, tipos, codigos]).astype(np.int64))
+            valores.append(np.array(valores_bloque, dtype=np.float64))
+    if not ids:
+        return np.empty(0, dtype=np.int64), np.empty((0, 4), dtype=np.int64), np.empty(0)
+    return np.concatenate(ids), np.concatenate(matrices), np.concatenate(valores)
+
+
+def agrupar(*columnas):
+    """Identificador denso de grupo por combinación de columnas enteras (más rápido que np.unique(axis=0))"""
+    combinada = np.zeros(len(columnas[0]), dtype=np.int64)
+    for columna in columnas:
+        valores, codigos = np.unique(columna, return_inverse=True)
+        combinada = combinada * len(valores) + codigos.ravel()
+    return np.unique(combinada, return_inverse=True)[1].ravel()
+
+
+def pesos_casas(pesos_por_nombre=None):
+    """Resuelve {nombre de casa: peso} a {id: peso}; las casas no indicadas pesan 1"""
+    if pesos_por_nombre is None:
+        pesos_por_nombre = settings.COMPARADOR_PESOS_CONSENSO
+    casas = obtener_referencias().casas_por_nombre
+    return {
+        casas[nombre].id: float(peso)
+        for nombre, peso in pesos_por_nombre.items()
+        if nombre in casas
+    }
+
+
+def calcular_consenso(matriz, valores, pesos=None, minimo_casas=2):
+    """
+    Probabilidad justa de cada cuota según el consenso de las casas y su valor esperado.
+
+    Cada casa aporta las probabilidades sin margen de sus mercados completos
+    (mismas opciones que el máximo ofrecido para ese evento y tipo, al menos dos).
+    La probabilidad justa de una selección es la media ponderada de esos aportes,
+    renormalizada para que el mercado sume 1. Las selecciones con menos de
+    `minimo_casas` aportes quedan sin probabilidad (NaN).
+    Retorna (probabilidades, valor_esperado, casas) alineados con las filas.
+    """
+    if not len(matriz):
+        vacio = np.empty(0)
+        return vacio, vacio, np.empty(0, dtype=np.int64)
+
+    casas = matriz[:, 1]
+    implicitas = 1.0 / valores
+
+    # Mercado de una casa (evento, casa, tipo) y mercado global (evento, tipo)
+    mercado_casa = agrupar(matriz[:, 0], matriz[:, 1], matriz[:, 2])
+    mercado = agrupar(matriz[:, 0], matriz[:, 2])
+
+    suma_implicitas = np.bincount(mercado_casa, weights=implicitas)
+    opciones_casa = np.bincount(mercado_casa)
+    maximo = np.zeros(mercado.max() + 1, dtype=np.int64)
+    np.maximum.at(maximo, mercado, opciones_casa[mercado_casa])
+    completas = (opciones_casa[mercado_casa] == maximo[mercado]) & (opciones_casa[mercado_casa] >= 2)
+
+    sin_margen = implicitas / suma_implicitas[mercado_casa]
+    peso = np.ones(len(matriz))
+    for casa_id, valor in (pesos or {}).items():
+        peso[casas == casa_id] = valor
+    peso = peso * completas
+
+    # Selección (evento, tipo, opción): media ponderada entre casas
+    seleccion = agrupar(matriz[:, 0], matriz[:, 2], matriz[:, 3])
+    suma_pesos = np.bincount(seleccion, weights=peso)
+    aportes = np.bincount(seleccion, weights=completas)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        justa = np.bincount(seleccion, weights=peso * sin_margen) / suma_pesos
+
+        mercado_seleccion = np.empty(len(justa), dtype=np.int64)
+        mercado_seleccion[seleccion] = mercado
+        total_mercado = np.bincount(mercado_seleccion, weights=np.nan_to_num(justa))
+        justa = justa / total_mercado[mercado_seleccion]
+
+    justa[aportes < minimo_casas] = np.nan
+    probabilidades = justa[seleccion]
+    return probabilidades, probabilidades * valores - 1, aportes[seleccion].astype(np.int64)
+
+
+def detectar_apuestas_valor(umbral=None, pesos=None, minimo_casas=None, limite=None):
+    """Cuotas con valor esperado >= umbral, ordenadas por ventaja: [(cuota_id, prob_justa, ventaja, casas)]"""
+    umbral = settings.COMPARADOR_UMBRAL_VALOR if umbral is None else umbral
+    minimo_casas = settings.COMPARADOR_MINIMO_CASAS_CONSENSO if minimo_casas is None else minimo_casas
+    pesos = pesos_casas() if pesos is None else pesos
+
+    ids, matriz, valores = cargar_cuotas_consenso()
+    probabilidades, ventajas, casas = calcular_consenso(matriz, valores, pesos, minimo_casas)
+
+    seleccion = np.flatnonzero(ventajas >= umbral)
+    seleccion = seleccion[np.argsort(-ventajas[seleccion], kind='stable')][:limite]
+    return [
+        (int(ids[i]), float(probabilidades[i]), float(ventajas[i]), int(casas[i]))
+        for i in seleccion
+    ]
+
+
+def obtener_apuestas_valor():
+    """Apuestas de valor de la versión actual de los datos: se calculan una vez por ciclo de actualización"""
+    version, _ = obtener_version()
+    clave = f'comparador:apuestas_valor:{version}'
+    resultado = cache.get(clave)
+    if resultado is None:
+        resultado = detectar_apuestas_valor(limite=settings.COMPARADOR_MAXIMO_APUESTAS_VALOR)
+        cache.set(clave, resultado, timeout=settings.COMPARADOR_CACHE_APUESTAS_VALOR)
+    return resultado
@@ -0,0 +1,138 @@
+"""
+Mantenimiento de EstadisticasCasa mediante deltas acumulados por lote
+
+Los contadores cubren solo las cuotas de eventos abiertos (finalizado=False): finalizar
+un evento descuenta sus cuotas y reabrirlo las vuelve a sumar.
+"""
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Count, F
+from django.utils import timezone
+
+from .models import CasaApuestas, Cuota, EstadisticasCasa
+from .versiones import incrementar_version
+
+TAMANO_LOTE = 500
+
+
+class AcumuladorEstadisticas:
+    """Acumula deltas por casa durante un lote de escrituras y los aplica de una vez"""
+
+    def __init__(self):
+        self.deltas = defaultdict(lambda: {'cuotas': 0, 'eventos': 0})
+
+    def __bool__(self):
+        return bool(self.deltas)
+
+    def registrar_cuotas(self, casa_id, nuevas=0, eventos_nuevos=0):
+        """Registra cuotas creadas (o eliminadas, con valores negativos) de una casa"""
+        delta = self.deltas[casa_id]
+        delta['cuotas'] += nuevas
+        delta['eventos'] += eventos_nuevos
+
+    def registrar_actualizacion(self, casa_id):
+        """Registra que la casa tuvo cambios de cuotas sin altas ni bajas"""
+        self.registrar_cuotas(casa_id)
+
+    def aplicar(self):
+        """Aplica los deltas pendientes con un UPDATE por casa afectada"""
+        if not self.deltas:
+            return 0
+
+        ahora = timezone.now()
+        with transaction.atomic():
+            EstadisticasCasa.objects.bulk_create(
+                [EstadisticasCasa(casa_apuestas_id=casa_id) for casa_id in self.deltas],
+                ignore_conflicts=True,
+            )
+            for casa_id, delta in self.deltas.items():
+                EstadisticasCasa.objects.filter(casa_apuestas_id=casa_id).update(
+                    total_cuotas=F('total_cuotas') + delta['cuotas'],
+                    eventos_cubiertos=F('eventos_cubiertos') + delta['eventos'],
+                    ultima_actualizacion=ahora,
+                )
+            incrementar_version()
+
+        aplicadas = len(self.deltas)
+        self.deltas.clear()
+        return aplicadas
+
+
+def contar_cuotas_abiertas(cuotas):
+    """{(casa_id, evento_id): cuotas} de un queryset de cuotas, solo las de eventos abiertos"""
+    return {
+        (casa_id, evento_id): total
+        for casa_id, evento_id, total in cuotas.filter(evento__finalizado=False).order_by().values(
+            'casa_apuestas_id', 'evento_id'
+        ).annotate(total=Count('id')).values_list('casa_apuestas_id', 'evento_id', 'total')
+    }
+
+
+def registrar_cambio_cuotas(altas=None, bajas=None):
+    """
+    Aplica altas y bajas sueltas de cuotas, ya escritas, contadas por (casa_id, evento_id).
+
+    Una casa empieza a cubrir un evento si todas sus cuotas en él son altas, y deja de
+    cubrirlo si ya no le queda ninguna.
+    """
+    altas, bajas = altas or {}, bajas or {}
+    pares = set(altas) | set(bajas)
+    if not pares:
+        return 0
+    restantes = contar_cuotas_abiertas(Cuota.objects.filter(
+        casa_apuestas_id__in={casa_id for casa_id, _ in pares}, evento_id__in={evento_id for _, evento_id in pares}
+    ))
+    acumulador = AcumuladorEstadisticas()
+    for par, total in bajas.items():
+        acumulador.registrar_cuotas(par[0], nuevas=-total, eventos_nuevos=-int(par not in restantes))
+    for par, total in altas.items():
+        acumulador.registrar_cuotas(par[0], nuevas=total, eventos_nuevos=int(restantes.get(par, 0) == total))
+    return acumulador.aplicar()
+
+
+def registrar_finalizacion(eventos_ids, finalizados=True):
+    """Descuenta de las estadísticas las cuotas de eventos recién finalizados (o las suma al reabrirlos)"""
+    signo = -1 if finalizados else 1
+    eventos_ids = sorted(set(eventos_ids))
+    acumulador = AcumuladorEstadisticas()
+    for inicio in range(0, len(eventos_ids), TAMANO_LOTE):
+        for casa_id, cuotas, eventos in Cuota.objects.filter(
+            evento_id__in=eventos_ids[inicio:inicio + TAMANO_LOTE]
+        ).order_by().values('casa_apuestas_id').annotate(
+            cuotas=Count('id'), eventos=Count('evento_id', distinct=True)
+        ).values_list('casa_apuestas_id', 'cuotas', 'eventos'):
+            acumulador.registrar_cuotas(casa_id, nuevas=signo * cuotas, eventos_nuevos=signo * eventos)
+    return acumulador.aplicar()
+
+
+def recalcular_estadisticas():
+    """Recalcula desde cero las estadísticas de todas las casas para corregir desvíos"""
+    totales = {
+        fila['casa_apuestas']: fila
+        for fila in Cuota.objects.filter(evento__finalizado=False).order_by().values('casa_apuestas').annotate(
+            total=Count('id'),
+            eventos=Count('evento', distinct=True),
+        )
+    }
+
+    ahora = timezone.now()
+    estadisticas = []
+    for casa_id in CasaApuestas.objects.values_list('id', flat=True):
+        fila = totales.get(casa_id, {'total': 0, 'eventos': 0})
+        estadisticas.append(EstadisticasCasa(
+            casa_apuestas_id=casa_id,
+            total_cuotas=fila['total'],
+            eventos_cubiertos=fila['eventos'],
+            ultima_actualizacion=ahora,
+        ))
+
+    with transaction.atomic():
+        EstadisticasCasa.objects.bulk_create(
+            estadisticas,
+            update_conflicts=True,
+            unique_fields=['casa_apuestas'],
+            update_fields=['total_cuotas', 'eventos_cubiertos', 'ultima_actualizacion'],
+        )
+        incrementar_version()
+    return estadisticas
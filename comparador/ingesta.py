@@ -0,0 +1,242 @@
+"""
+Ingesta en streaming de cuotas externas (NDJSON o array JSON) con upsert por lotes
+
+El cuerpo se lee de forma incremental y se procesa en lotes de tamaño fijo, cada
+uno en su propia transacción, así que la memoria no depende del tamaño de la subida.
+"""
+import codecs
+import json
+from collections import Counter
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from .estadisticas import AcumuladorEstadisticas
+from .instantaneas import upsert_cuotas
+from .margenes import actualizar_margenes
+from .models import Cuota, Evento
+from .referencias import obtener_referencias, recargar_referencias
+from .versiones import lote_escritura
+
+TAMANO_LECTURA = 64 * 1024
+TAMANO_MAXIMO_ELEMENTO = 1024 * 1024
+VALOR_MINIMO = Decimal('1.01')
+VALOR_MAXIMO = Decimal('9999.99')
+EJEMPLOS_ERROR = 5
+REFERENCIA_DESCONOCIDA = {'casa_desconocida', 'tipo_desconocido'}
+
+
+class RegistroInvalido(Exception):
+    """Registro rechazado; el mensaje es el motivo agregado en la respuesta"""
+
+
+def leer_ndjson(flujo):
+    """Un registro (o RegistroInvalido) por línea no vacía"""
+    for linea in flujo:
+        linea = linea.strip()
+        if not linea:
+            continue
+        try:
+            yield json.loads(linea)
+        except ValueError:
+            yield RegistroInvalido('json_invalido')
+
+
+def leer_array_json(flujo, tamano_lectura=TAMANO_LECTURA, tamano_maximo=TAMANO_MAXIMO_ELEMENTO):
+    """Elementos de un array JSON de nivel superior, decodificados a medida que llegan"""
+    decodificador = json.JSONDecoder()
+    # Incremental: un carácter multibyte puede quedar partido entre dos lecturas
+    utf8 = codecs.getincrementaldecoder('utf-8')()
+    pendiente = ''
+    inicio = False
+    while True:
+        bloque = flujo.read(tamano_lectura)
+        fin = not bloque
+        pendiente += utf8.decode(bloque, final=fin) if isinstance(bloque, bytes) else bloque
+        posicion = 0
+        while True:
+            # Saltar separadores entre elementos
+            while posicion < len(pendiente) and pendiente[posicion] in ' \t\r\n,':
+                posicion += 1
+            if posicion == len(pendiente):
+                break
+            if not inicio:
+                if pendiente[posicion] != '[':
+                    raise ValueError('Se esperaba un array JSON')
+                inicio = True
+                posicion += 1
+                continue
+            if pendiente[posicion] == ']':
+                return
+            try:
+                elemento, posicion = decodificador.raw_decode(pendiente, posicion)
+            except ValueError:
+                if fin:
+                    raise ValueError('Array JSON incompleto')
+                if len(pendiente) - posicion > tamano_maximo:
+                    # Elemento mal formado o desmedido: no se acumula el resto del cuerpo en memoria
+                    raise ValueError(f'Elemento del array mayor de {tamano_maximo} caracteres o mal formado')
+                # Elemento partido entre dos lecturas: esperar a la siguiente
+                break
+            yield elemento
+        pendiente = pendiente[posicion:]
+        if fin:
+            if pendiente.strip() or inicio:
+                raise ValueError('Array JSON incompleto')
+            return
+
+
+def es_identificador(valor):
+    """Id entero de JSON (bool es subclase de int, pero no es un id)"""
+    return isinstance(valor, int) and not isinstance(valor, bool)
+
+
+def normalizar_registro(registro, referencias):
+    """(evento_id, casa_id, tipo_id, opcion, valor) de un registro, o RegistroInvalido"""
+    if isinstance(registro, RegistroInvalido):
+        raise registro
+    if not isinstance(registro, dict):
+        raise RegistroInvalido('registro_no_es_objeto')
+    try:
+        evento, casa, tipo = registro['evento'], registro['casa'], registro['tipo']
+        opcion, valor = registro['opcion'], registro['valor']
+    except KeyError:
+        raise RegistroInvalido('campo_ausente')
+
+    if not es_identificador(evento):
+        raise RegistroInvalido('evento_invalido')
+    # Listas u objetos no se pueden buscar en los índices de referencias
+    if not isinstance(casa, str) and not es_identificador(casa):
+        raise RegistroInvalido('casa_invalida')
+    if not isinstance(tipo, str) and not es_identificador(tipo):
+        raise RegistroInvalido('tipo_invalido')
+
+    # Casa por nombre o id y tipo por código o id, desde la instantánea de referencias
+    casa = referencias.casas_por_nombre.get(casa) if isinstance(casa, str) else referencias.casas_por_id.get(casa)
+    if casa is None or not casa.activa:
+        raise RegistroInvalido('casa_desconocida')
+    tipo = referencias.tipo_cuota(tipo) if isinstance(tipo, str) else referencias.tipos_por_id.get(tipo)
+    if tipo is None:
+        raise RegistroInvalido('tipo_desconocido')
+
+    if not isinstance(opcion, str) or not opcion or len(opcion) > Cuota._meta.get_field('opcion').max_length:
+        raise RegistroInvalido('opcion_invalida')
+    try:
+        valor = Decimal(str(valor))
+        # NaN no se puede comparar con el rango e infinito no se puede redondear
+        if not valor.is_finite():
+            raise RegistroInvalido('valor_invalido')
+        valor = valor.quantize(Decimal('0.01'))
+    except (InvalidOperation, ValueError):
+        raise RegistroInvalido('valor_invalido')
+    if not VALOR_MINIMO <= valor <= VALOR_MAXIMO:
+        raise RegistroInvalido('valor_fuera_de_rango')
+
+    return evento, casa.id, tipo.id, opcion, valor
+
+
+def procesar_lote(numero, registros, primera_linea, estadisticas):
+    """Valida y escribe un lote en una transacción; retorna su resumen y los eventos modificados"""
+    referencias = obtener_referencias()
+    errores = Counter()
+    ejemplos = []
+    validas = {}
+    repeticiones = Counter()
+    recargadas = False
+    for desplazamiento, registro in enumerate(registros):
+        try:
+            try:
+                fila = normalizar_registro(registro, referencias)
+            except RegistroInvalido as error:
+                if recargadas or str(error) not in REFERENCIA_DESCONOCIDA:
+                    raise
+                # Casa o tipo creados sin señales o en otro proceso: como mucho una recarga por lote
+                referencias, recargadas = recargar_referencias(), True
+                fila = normalizar_registro(registro, referencias)
+        except RegistroInvalido as error:
+            errores[str(error)] += 1
+            if len(ejemplos) < EJEMPLOS_ERROR:
+                ejemplos.append({'registro': primera_linea + desplazamiento, 'motivo': str(error)})
+            continue
+        # Dentro de un lote, el último valor de una misma cuota prevalece
+        validas[fila[:4]] = fila[4]
+        repeticiones[fila[:4]] += 1
+
+    # Una consulta por lote para los eventos y otra para sus cuotas actuales
+    eventos_ids = {clave[0] for clave in validas}
+    abiertos = set(Evento.objects.filter(id__in=eventos_ids, finalizado=False).values_list('id', flat=True))
+    actuales = {}
+    casas_con_cuotas = set()
+    for evento_id, casa_id, tipo_id, opcion, valor, anterior in Cuota.objects.filter(
+        evento_id__in=abiertos
+    ).order_by().values_list('evento_id', 'casa_apuestas_id', 'tipo_cuota_id', 'opcion', 'valor', 'valor_anterior'):
+        actuales[(evento_id, casa_id, tipo_id, opcion)] = (valor, anterior)
+        casas_con_cuotas.add((evento_id, casa_id))
+
+    filas = []
+    sin_cambios = 0
+    for clave, valor in validas.items():
+        if clave[0] not in abiertos:
+            errores['evento_desconocido'] += repeticiones[clave]
+            continue
+        actual = actuales.get(clave)
+        if actual is None:
+            filas.append(clave + (valor, None))
+            evento_nuevo = (clave[0], clave[1]) not in casas_con_cuotas
+            casas_con_cuotas.add((clave[0], clave[1]))
+            estadisticas.registrar_cuotas(clave[1], nuevas=1, eventos_nuevos=int(evento_nuevo))
+        elif actual[0] != valor:
+            filas.append(clave + (valor, actual[0]))
+            estadisticas.registrar_actualizacion(clave[1])
+        else:
+            sin_cambios += 1
+
+    upsert_cuotas(filas)
+    rechazadas = sum(errores.values())
+    resumen = {
+        'lote': numero,
+        'recibidas': len(registros),
+        'aceptadas': len(registros) - rechazadas,
+        'escritas': len(filas),
+        'sin_cambios': sin_cambios,
+        'rechazadas': rechazadas,
+        'motivos': dict(errores),
+        'ejemplos': ejemplos,
+    }
+    return resumen, {fila[0] for fila in filas}
+
+
+def ingerir(registros, tamano_lote=5000):
+    """Procesa un flujo de registros por lotes; retorna el resumen global con el detalle por lote"""
+    estadisticas = AcumuladorEstadisticas()
+    lotes = []
+    eventos_modificados = set()
+    error = None
+    registros = iter(registros)
+    # Toda la subida publica una única versión nueva de los datos
+    with lote_escritura():
+        linea = 1
+        try:
+            while bloque := list(islice(registros, tamano_lote)):
+                resumen, eventos = procesar_lote(len(lotes) + 1, bloque, linea, estadisticas)
+                lotes.append(resumen)
+                eventos_modificados |= eventos
+                linea += len(bloque)
+        except ValueError as exc:
+            # Cuerpo mal formado: los lotes anteriores ya están confirmados y se conservan
+            error = str(exc)
+
+        estadisticas.aplicar()
+        if eventos_modificados:
+            actualizar_margenes(eventos_modificados)
+
+    resultado = {
+        'recibidas': sum(lote['recibidas'] for lote in lotes),
+        'aceptadas': sum(lote['aceptadas'] for lote in lotes),
+        'escritas': sum(lote['escritas'] for lote in lotes),
+        'rechazadas': sum(lote['rechazadas'] for lote in lotes),
+        'eventos_modificados': len(eventos_modificados),
+        'lotes': lotes,
+    }
+    if error:
+        resultado['error'] = error
+    return resultado
@@ -0,0 +1,337 @@
+"""
+Instantáneas columnares de cuotas en formato NumPy .npz
+
+El archivo es un zip con un array .npy por columna. Casa, tipo, opción y deporte
+se guardan codificados contra diccionarios; eventos y cuotas se escriben en
+bloques (eventos_00000_*, cuotas_00000_*) para que exportar e importar trabajen
+con memoria acotada por el tamaño de bloque.
+"""
+import json
+import zipfile
+from contextlib import contextmanager
+from datetime import datetime, timezone as dt_timezone
+from itertools import islice
+
+import numpy as np
+from django.db import connection, transaction
+from django.db.models.constants import OnConflict
+from django.utils import timezone
+
+from .margenes import actualizar_margenes, recalcular_estadisticas_margen
+from .models import CLAVE_CAMBIOS, CasaApuestas, Cuota, Deporte, Evento, TipoCuota, VersionDatos
+from .normalizacion import IndiceCompeticiones, IndiceEquipos, vincular_eventos
+from .referencias import CLAVE_REFERENCIAS
+from .versiones import incrementar_version
+
+FORMATO = 1
+TAMANO_BLOQUE = 100_000
+
+COLUMNAS_EVENTO = ['id', 'deporte', 'local', 'visitante', 'fecha', 'liga', 'pais', 'finalizado']
+COLUMNAS_CUOTA = ['evento', 'casa', 'tipo', 'opcion', 'valor', 'anterior']
+
+CAMPOS_INSERCION_CUOTA = [
+    'evento', 'casa_apuestas', 'tipo_cuota', 'opcion', 'valor', 'valor_anterior',
+    'fecha_creacion', 'fecha_actualizacion', 'secuencia',
+]
+CAMPOS_UNICOS_CUOTA = ['evento', 'casa_apuestas', 'tipo_cuota', 'opcion']
+CAMPOS_ACTUALIZABLES_CUOTA = ['valor', 'valor_anterior', 'fecha_actualizacion', 'secuencia']
+
+
+def _escribir_array(archivo, nombre, array):
+    with archivo.open(f'{nombre}.npy', 'w', force_zip64=True) as destino:
+        np.lib.format.write_array(destino, np.asarray(array), allow_pickle=False)
+
+
+def _bloques(iterable, tamano):
+    iterador = iter(iterable)
+    while bloque := list(islice(iterador, tamano)):
+        yield bloque
+
+
+def _a_microsegundos(fecha):
+    return int(fecha.timestamp() * 1_000_000)
+
+
+def _desde_microsegundos(valor):
+    return datetime.fromtimestamp(int(valor) / 1_000_000, tz=dt_timezone.utc)
+
+
+def _centimos(valor):
+    return -1 if valor is None else int(round(valor * 100))
+
+
+@contextmanager
+def _lectura_consistente():
+    """Transacción en la que todas las consultas ven la misma instantánea de la base de datos"""
+    externa = connection.in_atomic_block
+    with transaction.atomic():
+        if connection.vendor == 'postgresql' and not externa:
+            # READ COMMITTED toma una instantánea por consulta; SQLite y MySQL (InnoDB) ya
+            # leen de una sola instantánea durante toda la transacción
+            with connection.cursor() as cursor:
+                cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ')
+        yield
+
+
+def exportar_instantanea(ruta, tamano_bloque=TAMANO_BLOQUE, comprimir=False, solo_abiertos=False, progreso=None):
+    """
+    Escribe eventos y cuotas en `ruta`; retorna (eventos, cuotas) exportados.
+
+    Diccionarios, eventos y cuotas se leen en una sola transacción: una cuota cuyo evento
+    (o casa, o tipo) se crea entre dos lecturas no puede quedar en el archivo sin él. En
+    SQLite sin WAL la transacción bloquea las escrituras hasta que termina la exportación.
+    """
+    with _lectura_consistente():
+        return _exportar(ruta, tamano_bloque, comprimir, solo_abiertos, progreso)
+
+
+def _exportar(ruta, tamano_bloque, comprimir, solo_abiertos, progreso):
+    compresion = zipfile.ZIP_DEFLATED if comprimir else zipfile.ZIP_STORED
+
+    casas = list(CasaApuestas.objects.order_by('id').values_list('id', 'nombre', 'url'))
+    tipos = list(TipoCuota.objects.order_by('id').values_list('id', 'codigo', 'nombre'))
+    deportes = list(Deporte.objects.order_by('id').values_list('id', 'slug', 'nombre'))
+    codigo_casa = {casa_id: i for i, (casa_id, _, _) in enumerate(casas)}
+    codigo_tipo = {tipo_id: i for i, (tipo_id, _, _) in enumerate(tipos)}
+    codigo_deporte = {deporte_id: i for i, (deporte_id, _, _) in enumerate(deportes)}
+    codigo_opcion = {}
+
+    eventos = Evento.objects.order_by('id')
+    cuotas = Cuota.objects.order_by('id')
+    if solo_abiertos:
+        eventos = eventos.filter(finalizado=False)
+        cuotas = cuotas.filter(evento__finalizado=False)
+
+    total_eventos = total_cuotas = 0
+    with zipfile.ZipFile(ruta, 'w', compression=compresion, allowZip64=True) as archivo:
+        filas = eventos.values_list(
+            'id', 'deporte_id', 'equipo_local', 'equipo_visitante', 'fecha_evento', 'liga', 'pais', 'finalizado'
+        ).iterator(chunk_size=tamano_bloque)
+        bloques_eventos = 0
+        for bloques_eventos, bloque in enumerate(_bloques(filas, tamano_bloque), start=1):
+            ids, deporte_ids, locales, visitantes, fechas, ligas, paises, finalizados = zip(*bloque)
+            prefijo = f'eventos_{bloques_eventos - 1:05d}'
+            _escribir_array(archivo, f'{prefijo}_id', np.array(ids, dtype=np.int64))
+            _escribir_array(archivo, f'{prefijo}_deporte', np.array([codigo_deporte[d] for d in deporte_ids], dtype=np.int32))
+            _escribir_array(archivo, f'{prefijo}_local', np.array(locales, dtype=str))
+            _escribir_array(archivo, f'{prefijo}_visitante', np.array(visitantes, dtype=str))
+            _escribir_array(archivo, f'{prefijo}_fecha', np.array([_a_microsegundos(f) for f in fechas], dtype=np.int64))
+            _escribir_array(archivo, f'{prefijo}_liga', np.array(ligas, dtype=str))
+            _escribir_array(archivo, f'{prefijo}_pais', np.array(paises, dtype=str))
+            _escribir_array(archivo, f'{prefijo}_finalizado', np.array(finalizados, dtype=bool))
+            total_eventos += len(bloque)
+
+        filas = cuotas.values_list(
+            'evento_id', 'casa_apuestas_id', 'tipo_cuota_id', 'opcion', 'valor', 'valor_anterior'
+        ).iterator(chunk_size=tamano_bloque)
+        bloques_cuotas = 0
+        for bloques_cuotas, bloque in enumerate(_bloques(filas, tamano_bloque), start=1):
+            evento_ids, casa_ids, tipo_ids, opciones, valores, anteriores = zip(*bloque)
+            prefijo = f'cuotas_{bloques_cuotas - 1:05d}'
+            _escribir_array(archivo, f'{prefijo}_evento', np.array(evento_ids, dtype=np.int64))
+            _escribir_array(archivo, f'{prefijo}_casa', np.array([codigo_casa[c] for c in casa_ids], dtype=np.int32))
+            _escribir_array(archivo, f'{prefijo}_tipo', np.array([codigo_tipo[t] for t in tipo_ids], dtype=np.int32))
+            _escribir_array(archivo, f'{prefijo}_opcion', np.array(
+                [codigo_opcion.setdefault(o, len(codigo_opcion)) for o in opciones], dtype=np.int32
+            ))
+            _escribir_array(archivo, f'{prefijo}_valor', np.array([_centimos(v) for v in valores], dtype=np.int32))
+            _escribir_array(archivo, f'{prefijo}_anterior', np.array([_centimos(v) for v in anteriores], dtype=np.int32))
+            total_cuotas += len(bloque)
+            if progreso:
+                progreso(total_cuotas)
+
+        # Diccionarios
+        _escribir_array(archivo, 'casas_nombre', np.array([c[1] for c in casas], dtype=str))
+        _escribir_array(archivo, 'casas_url', np.array([c[2] for c in casas], dtype=str))
+        _escribir_array(archivo, 'tipos_codigo', np.array([t[1] for t in tipos], dtype=str))
+        _escribir_array(archivo, 'tipos_nombre', np.array([t[2] for t in tipos], dtype=str))
+        _escribir_array(archivo, 'deportes_slug', np.array([d[1] for d in deportes], dtype=str))
+        _escribir_array(archivo, 'deportes_nombre', np.array([d[2] for d in deportes], dtype=str))
+        _escribir_array(archivo, 'opciones', np.array(list(codigo_opcion), dtype=str))
+
+        _escribir_array(archivo, 'meta', np.array(json.dumps({
+            'formato': FORMATO,
+            'eventos': total_eventos,
+            'cuotas': total_cuotas,
+            'bloques_eventos': bloques_eventos,
+            'bloques_cuotas': bloques_cuotas,
+            'exportado': datetime.now(dt_timezone.utc).isoformat(),
+        })))
+
+    return total_eventos, total_cuotas
+
+
+def _resolver_por_clave(modelo, campo_clave, filas):
+    """Mapea cada fila (clave, defaults) a su id, creando en bloque las que no existen"""
+    existentes = dict(modelo.objects.filter(
+        **{f'{campo_clave}__in': [clave for clave, _ in filas]}
+    ).values_list(campo_clave, 'id'))
+    nuevos = [modelo(**{campo_clave: clave}, **defaults) for clave, defaults in filas if clave not in existentes]
+    if nuevos:
+        modelo.objects.bulk_create(nuevos)
+        incrementar_version(CLAVE_REFERENCIAS)
+        existentes = dict(modelo.objects.filter(
+            **{f'{campo_clave}__in': [clave for clave, _ in filas]}
+        ).values_list(campo_clave, 'id'))
+    return np.array([existentes[clave] for clave, _ in filas], dtype=np.int64)
+
+
+def _sql_upsert_cuotas():
+    """INSERT ... ON CONFLICT para Cuota, construido con las operaciones del backend"""
+    opciones = Cuota._meta
+    columnas = [opciones.get_field(nombre).column for nombre in CAMPOS_INSERCION_CUOTA]
+    sufijo = connection.ops.on_conflict_suffix_sql(
+        [opciones.get_field(nombre) for nombre in CAMPOS_INSERCION_CUOTA],
+        OnConflict.UPDATE,
+        [opciones.get_field(nombre).column for nombre in CAMPOS_ACTUALIZABLES_CUOTA],
+        [opciones.get_field(nombre).column for nombre in CAMPOS_UNICOS_CUOTA],
+    )
+    return 'INSERT INTO %s (%s) VALUES (%s) %s' % (
+        connection.ops.quote_name(opciones.db_table),
+        ', '.join(map(connection.ops.quote_name, columnas)),
+        ', '.join(['%s'] * len(columnas)),
+        sufijo,
+    )
+
+
+def upsert_cuotas(filas, tamano_lote=5000):
+    """
+    Inserta o actualiza cuotas en una transacción sin instanciar modelos.
+
+    `filas` es un iterable de (evento_id, casa_id, tipo_id, opcion, valor, valor_anterior);
+    se consume por lotes de `tamano_lote`. Retorna el número de filas escritas.
+    """
+    sql = _sql_upsert_cuotas()
+    ahora = connection.ops.adapt_datetimefield_value(timezone.now())
+    total = 0
+    with transaction.atomic(), connection.cursor() as cursor:
+        for lote in _bloques(filas, tamano_lote):
+            # Cada fila escrita recibe su propio número de la secuencia de cambios
+            primera = VersionDatos.reservar(CLAVE_CAMBIOS, len(lote))
+            cursor.executemany(sql, [fila + (ahora, ahora, primera + i) for i, fila in enumerate(lote)])
+            total += len(lote)
+    return total
+
+
+def _claves_eventos(columnas, equipos):
+    """(id de origen, clave, fila) de un bloque de eventos; la clave es (deporte, local, visitante, fecha)"""
+    filas = list(zip(*(columnas[columna].tolist() for columna in COLUMNAS_EVENTO)))
+    locales = equipos.resolver_lote([(fila[1], fila[2]) for fila in filas])
+    visitantes = equipos.resolver_lote([(fila[1], fila[3]) for fila in filas])
+    return [
+        (fila[0], (fila[1], local_id, visitante_id, fila[4]), fila)
+        for fila, local_id, visitante_id in zip(filas, locales, visitantes)
+    ]
+
+
+def _eventos_existentes(claves, tamano_consulta=1000):
+    """{clave: id} de los eventos ya guardados entre las claves de un bloque"""
+    # Por fecha y en tramos: pocos parámetros por consulta y un rango de fechas estrecho
+    claves = sorted(set(claves), key=lambda clave: clave[3])
+    existentes = {}
+    for inicio in range(0, len(claves), tamano_consulta):
+        tramo = claves[inicio:inicio + tamano_consulta]
+        buscadas = set(tramo)
+        for evento_id, deporte_id, local_id, visitante_id, fecha in Evento.objects.filter(
+            local_id__in={clave[1] for clave in tramo},
+            fecha_evento__range=(_desde_microsegundos(tramo[0][3]), _desde_microsegundos(tramo[-1][3])),
+        ).values_list('id', 'deporte_id', 'local_id', 'visitante_id', 'fecha_evento'):
+            clave = (deporte_id, local_id, visitante_id, _a_microsegundos(fecha))
+            if clave in buscadas:
+                existentes[clave] = evento_id
+    return existentes
+
+
+def importar_instantanea(ruta, tamano_lote=5000, progreso=None):
+    """
+    Carga eventos y cuotas de una instantánea (upsert); retorna (eventos_creados, cuotas).
+
+    Los eventos se resuelven por bloques contra la base de datos: la memoria depende del
+    tamaño de bloque y no del número de eventos. Se recalculan los márgenes de los
+    eventos importados; las estadísticas por casa quedan a cargo de quien llama.
+    """
+    with np.load(ruta, allow_pickle=False) as datos:
+        meta = json.loads(str(datos['meta']))
+        if meta['formato'] != FORMATO:
+            raise ValueError(f"Formato de instantánea no soportado: {meta['formato']}")
+
+        casas = _resolver_por_clave(CasaApuestas, 'nombre', [
+            (nombre, {'url': url}) for nombre, url in zip(datos['casas_nombre'].tolist(), datos['casas_url'].tolist())
+        ])
+        tipos = _resolver_por_clave(TipoCuota, 'codigo', [
+            (codigo, {'nombre': nombre}) for codigo, nombre in zip(datos['tipos_codigo'].tolist(), datos['tipos_nombre'].tolist())
+        ])
+        deportes = _resolver_por_clave(Deporte, 'slug', [
+            (slug, {'nombre': nombre}) for slug, nombre in zip(datos['deportes_slug'].tolist(), datos['deportes_nombre'].tolist())
+        ])
+        opciones = datos['opciones'].tolist()
+
+        def bloque_eventos(bloque):
+            prefijo = f'eventos_{bloque:05d}'
+            columnas = {columna: datos[f'{prefijo}_{columna}'] for columna in COLUMNAS_EVENTO}
+            columnas['deporte'] = deportes[columnas['deporte']]
+            return columnas
+
+        # Los eventos se identifican por (deporte, local, visitante, fecha) con los equipos
+        # normalizados, para no duplicarlos aunque cambie la grafía de los nombres
+        equipos = IndiceEquipos()
+        competiciones = IndiceCompeticiones()
+        # Rango de ids de origen de cada bloque: las cuotas solo releen los bloques que citan
+        rangos = []
+        eventos_creados = 0
+        for bloque in range(meta['bloques_eventos']):
+            columnas = bloque_eventos(bloque)
+            rangos.append((int(columnas['id'].min()), int(columnas['id'].max())) if len(columnas['id']) else (0, -1))
+            filas = _claves_eventos(columnas, equipos)
+            existentes = _eventos_existentes([clave for _, clave, _ in filas])
+
+            nuevos = {}
+            for _, clave, (_, deporte_id, local, visitante, fecha, liga, pais, finalizado) in filas:
+                if clave not in existentes and clave not in nuevos:
+                    nuevos[clave] = Evento(
+                        deporte_id=deporte_id, equipo_local=local, equipo_visitante=visitante,
+                        fecha_evento=_desde_microsegundos(fecha), liga=liga, pais=pais, finalizado=finalizado,
+                    )
+
+            with transaction.atomic():
+                vincular_eventos(list(nuevos.values()), equipos, competiciones)
+                creados = Evento.objects.bulk_create(nuevos.values(), batch_size=tamano_lote)
+            eventos_creados += len(creados)
+
+        total_cuotas = 0
+        for bloque in range(meta['bloques_cuotas']):
+            prefijo = f'cuotas_{bloque:05d}'
+            columnas = {columna: datos[f'{prefijo}_{columna}'] for columna in COLUMNAS_CUOTA}
+
+            # Ids locales de los eventos citados en el bloque, releídos de sus bloques de origen
+            citados = np.unique(columnas['evento'])
+            id_evento = {}
+            for bloque_evento, (minimo, maximo) in enumerate(rangos):
+                if not ((citados >= minimo) & (citados <= maximo)).any():
+                    continue
+                eventos = bloque_eventos(bloque_evento)
+                seleccion = np.isin(eventos['id'], citados)
+                filas = _claves_eventos({columna: eventos[columna][seleccion] for columna in COLUMNAS_EVENTO}, equipos)
+                existentes = _eventos_existentes([clave for _, clave, _ in filas])
+                id_evento.update((id_origen, existentes[clave]) for id_origen, clave, _ in filas)
+
+            evento_ids = [id_evento[evento] for evento in columnas['evento'].tolist()]
+            # Carga masiva sin instanciar modelos: los valores ya vienen tipados desde NumPy
+            cuotas = upsert_cuotas(zip(
+                evento_ids,
+                casas[columnas['casa']].tolist(),
+                tipos[columnas['tipo']].tolist(),
+                [opciones[opcion] for opcion in columnas['opcion'].tolist()],
+                (columnas['valor'] / 100).tolist(),
+                [None if anterior < 0 else anterior / 100 for anterior in columnas['anterior'].tolist()],
+            ), tamano_lote)
+            # Los márgenes de un evento se recalculan con todas sus cuotas guardadas: si sus
+            # cuotas llegan en varios bloques, el último recálculo es el completo
+            actualizar_margenes(set(evento_ids), agregados=False)
+            total_cuotas += cuotas
+            if progreso:
+                progreso(total_cuotas)
+
+    if total_cuotas:
+        recalcular_estadisticas_margen()
+    return eventos_creados, total_cuotas
@@ -1,13 +1,33 @@
-from django.core.management.base import BaseCommand
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
 from django.utils import timezone
+from collections import Counter, defaultdict
 from datetime import timedelta
+from itertools import islice
+import json
+import os
 import random
-from comparador.models import CasaApuestas, Deporte, Evento, TipoCuota, Cuota
+import signal
+import threading
+import time
+from comparador.estadisticas import AcumuladorEstadisticas
+from comparador.instantaneas import upsert_cuotas
+from comparador.margenes import actualizar_margenes
+from comparador.models import Evento, Cuota
+from comparador.referencias import obtener_referencias
+from comparador.planificador import LimitadorTasa, PlanificadorRefresco
+from comparador.prerenderizado import prerenderizar
+from comparador.versiones import incrementar_version, lote_escritura
 
 
 class Command(BaseCommand):
     help = 'Actualiza las cuotas de apuestas de forma simulada'
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.estadisticas = AcumuladorEstadisticas()
+
     def add_arguments(self, parser):
         parser.add_argument(
             '--dry-run',
@@ -20,6 +40,46 @@ class Command(BaseCommand):
             default=7,
             help='Número de días de eventos a actualizar (por defecto: 7)',
         )
+        parser.add_argument(
+            '--tamano-bloque',
+            type=int,
+            default=500,
+            help='Eventos leídos y escritos por bloque en la ejecución única (por defecto: 500)',
+        )
+        parser.add_argument(
+            '--daemon',
+            action='store_true',
+            help='Ejecuta de forma continua priorizando los eventos más próximos',
+        )
+        parser.add_argument(
+            '--tasa',
+            type=float,
+            default=5.0,
+            help='Máximo de eventos refrescados por segundo en modo daemon (por defecto: 5)',
+        )
+        parser.add_argument(
+            '--jitter',
+            type=float,
+            default=0.1,
+            help='Variación aleatoria relativa de los intervalos de refresco (por defecto: 0.1)',
+        )
+        parser.add_argument(
+            '--recarga',
+            type=int,
+            default=60,
+            help='Segundos entre recargas de la lista de eventos en modo daemon (por defecto: 60)',
+        )
+        parser.add_argument(
+            '--prerenderizar',
+            action='store_true',
+            help='Pre-renderiza las páginas más visitadas al cerrar cada ciclo de actualización',
+        )
+        parser.add_argument(
+            '--intervalo-metricas',
+            type=int,
+            default=30,
+            help='Segundos entre publicaciones de métricas en modo daemon (por defecto: 30)',
+        )
 
     def handle(self, *args, **options):
         dry_run = options['dry_run']
@@ -34,13 +94,12 @@ class Command(BaseCommand):
                 self.style.WARNING('MODO PRUEBA: No se guardarán cambios en la base de datos')
             )
 
+        if options['daemon']:
+            self.ejecutar_daemon(options)
+            return
+
         # Obtener eventos activos
-        fecha_limite = timezone.now() + timedelta(days=dias)
-        eventos = Evento.objects.filter(
-            finalizado=False,
-            fecha_evento__lte=fecha_limite,
-            fecha_evento__gte=timezone.now()
-        ).select_related('deporte')
+        eventos = self.obtener_eventos_abiertos(dias)
 
         if not eventos.exists():
             self.stdout.write(
@@ -49,16 +108,26 @@ class Command(BaseCommand):
             return
 
         total_actualizaciones = 0
-
-        for evento in eventos:
-            actualizaciones_evento = self.actualizar_cuotas_evento(evento, dry_run)
-            total_actualizaciones += actualizaciones_evento
-
-            if actualizaciones_evento > 0:
+        eventos_actualizados = []
+
+        # Toda la ejecución publica una única versión nueva de los datos
+        with lote_escritura():
+            for evento_id, nombre, actualizaciones_evento in self.actualizar_en_bloques(
+                eventos, options['tamano_bloque'], dry_run
+            ):
+                total_actualizaciones += actualizaciones_evento
+                eventos_actualizados.append(evento_id)
                 self.stdout.write(
-                    f'✓ {evento}: {actualizaciones_evento} cuotas actualizadas'
+                    f'✓ {nombre}: {actualizaciones_evento} cuotas actualizadas'
                 )
 
+            if not dry_run:
+                self.cerrar_lote(eventos_actualizados)
+
+        # Fuera del lote: la nueva versión de los datos ya está publicada
+        if options['prerenderizar'] and not dry_run:
+            self.prerenderizar()
+
         if dry_run:
             self.stdout.write(
                 self.style.SUCCESS(f'PRUEBA COMPLETADA: {total_actualizaciones} cuotas serían actualizadas')
@@ -68,6 +137,160 @@ class Command(BaseCommand):
                 self.style.SUCCESS(f'ACTUALIZACIÓN COMPLETADA: {total_actualizaciones} cuotas actualizadas')
             )
 
+    def obtener_eventos_abiertos(self, dias):
+        """Eventos no finalizados que comienzan dentro de la ventana indicada"""
+        ahora = timezone.now()
+        return Evento.objects.filter(
+            finalizado=False,
+            fecha_evento__lte=ahora + timedelta(days=dias),
+            fecha_evento__gte=ahora
+        ).select_related('deporte')
+
+    def ejecutar_daemon(self, options):
+        """Refresca eventos de forma continua según su cercanía al inicio"""
+        dry_run = options['dry_run']
+        parada = threading.Event()
+
+        def detener(signum, frame):
+            self.stdout.write(self.style.WARNING('Señal recibida, finalizando tras el evento en curso...'))
+            parada.set()
+
+        for senal in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(senal, detener)
+
+        if options['tasa'] <= 0:
+            raise CommandError('--tasa debe ser positiva')
+
+        planificador = PlanificadorRefresco(jitter=options['jitter'])
+        limitador = LimitadorTasa(options['tasa'])
+        proxima_recarga = proximas_metricas = 0.0
+        total_actualizaciones = 0
+        eventos_actualizados = set()
+
+        while not parada.is_set():
+            ahora = time.monotonic()
+            if ahora >= proxima_recarga:
+                close_old_connections()
+                planificador.sincronizar(
+                    list(self.obtener_eventos_abiertos(options['dias'])),
+                    timezone.now()
+                )
+                proxima_recarga = ahora + options['recarga']
+
+            if ahora >= proximas_metricas:
+                if not dry_run:
+                    self.cerrar_lote(eventos_actualizados)
+                    if eventos_actualizados and options['prerenderizar']:
+                        self.prerenderizar()
+                    eventos_actualizados.clear()
+                self.publicar_metricas(planificador)
+                proximas_metricas = ahora + options['intervalo_metricas']
+
+            espera, entrada = planificador.siguiente()
+            if entrada is None or espera > 0:
+                # Nada pendiente: dormir hasta el próximo refresco, recarga o publicación
+                limite = min(proxima_recarga, proximas_metricas) - time.monotonic()
+                parada.wait(max(0.0, min(espera, limite) if entrada else limite))
+                continue
+
+            if not limitador.adquirir(parada):
+                break
+
+            # Un evento ya iniciado se retira en la próxima recarga
+            if entrada.evento.fecha_evento >= timezone.now():
+                with lote_escritura():
+                    actualizaciones = self.actualizar_cuotas_evento(entrada.evento, dry_run)
+                total_actualizaciones += actualizaciones
+                if actualizaciones > 0:
+                    eventos_actualizados.add(entrada.evento.id)
+                    self.stdout.write(
+                        f'✓ [{entrada.nivel}] {entrada.evento}: {actualizaciones} cuotas actualizadas'
+                    )
+            planificador.completar(entrada)
+
+        if not dry_run:
+            self.cerrar_lote(eventos_actualizados)
+        self.publicar_metricas(planificador)
+        self.stdout.write(
+            self.style.SUCCESS(f'DAEMON DETENIDO: {total_actualizaciones} cuotas actualizadas')
+        )
+
+    def cerrar_lote(self, eventos_ids):
+        """Aplica los deltas de estadísticas y recalcula los márgenes de los eventos modificados"""
+        with lote_escritura():
+            self.estadisticas.aplicar()
+            mercados = actualizar_margenes(eventos_ids) if eventos_ids else 0
+        if eventos_ids:
+            self.stdout.write(f'✓ Márgenes recalculados: {mercados} mercados en {len(eventos_ids)} eventos')
+
+    def prerenderizar(self):
+        """Regenera las páginas pre-renderizadas para la versión recién publicada"""
+        version, paginas, _ = prerenderizar()
+        self.stdout.write(f'✓ Pre-renderizadas {paginas} páginas (versión {version})')
+
+    def publicar_metricas(self, planificador):
+        """Publica profundidad de cola y antigüedad por nivel en un archivo JSON y la salida"""
+        metricas = json.dumps({
+            'actualizado': timezone.now().isoformat(),
+            'eventos': len(planificador),
+            'niveles': planificador.metricas(),
+        }, ensure_ascii=False)
+        # Archivo y no caché: la caché por defecto es local al proceso del daemon.
+        # Se reemplaza de forma atómica para que nadie lea un JSON a medias.
+        destino = settings.COMPARADOR_METRICAS_PLANIFICADOR
+        temporal = destino.with_name(f'.{destino.name}-{os.getpid()}.tmp')
+        temporal.write_text(metricas)
+        os.replace(temporal, destino)
+        self.stdout.write(metricas)
+
+    def actualizar_en_bloques(self, eventos, tamano_bloque, dry_run=False):
+        """
+        Actualiza las cuotas de los eventos leyendo y escribiendo por bloques de eventos.
+
+        Solo se leen columnas sueltas (sin instancias de modelo) y la memoria depende del
+        tamaño de bloque, no del número de eventos: por bloque, una consulta de cuotas y
+        una escritura en lote. Genera (evento_id, nombre, actualizaciones) por evento modificado.
+        """
+        referencias = obtener_referencias()
+        filas_eventos = eventos.order_by().values_list(
+            'id', 'equipo_local', 'equipo_visitante'
+        ).iterator(chunk_size=tamano_bloque)
+
+        while bloque := list(islice(filas_eventos, tamano_bloque)):
+            cuotas_por_evento = defaultdict(list)
+            for cuota in Cuota.objects.filter(evento_id__in=[fila[0] for fila in bloque]).order_by().values_list(
+                'evento_id', 'casa_apuestas_id', 'tipo_cuota_id', 'opcion', 'valor'
+            ).iterator(chunk_size=tamano_bloque * 20):
+                cuotas_por_evento[cuota[0]].append(cuota)
+
+            filas = []
+            modificados = []
+            for evento_id, local, visitante in bloque:
+                cuotas = cuotas_por_evento.pop(evento_id, None)
+                if cuotas is None:
+                    # Sin cuotas: se crean las iniciales para cada casa activa
+                    nuevas = self.filas_iniciales(evento_id, referencias)
+                    if not dry_run:
+                        for casa_id, cantidad in Counter(fila[1] for fila in nuevas).items():
+                            self.estadisticas.registrar_cuotas(casa_id, nuevas=cantidad, eventos_nuevos=1)
+                else:
+                    nuevas = []
+                    for _, casa_id, tipo_id, opcion, valor in cuotas:
+                        nuevo_valor = self.variar_valor(valor)
+                        if nuevo_valor is not None:
+                            nuevas.append((evento_id, casa_id, tipo_id, opcion, nuevo_valor, valor))
+                            if not dry_run:
+                                self.estadisticas.registrar_actualizacion(casa_id)
+                if nuevas:
+                    filas += nuevas
+                    modificados.append((evento_id, f'{local} vs {visitante}', len(nuevas)))
+
+            if filas and not dry_run:
+                # El upsert no emite señales: la versión de datos se invalida aquí
+                upsert_cuotas(filas)
+                incrementar_version()
+            yield from modificados
+
     def actualizar_cuotas_evento(self, evento, dry_run=False):
         """Actualiza las cuotas de un evento específico"""
         actualizaciones = 0
@@ -90,16 +313,17 @@ class Command(BaseCommand):
         """Crea cuotas iniciales para un evento nuevo"""
         creaciones = 0
 
-        # Obtener casas de apuestas activas
-        casas = CasaApuestas.objects.filter(activa=True)
-        if not casas.exists():
+        # Casas activas y tipos de cuota desde la instantánea de referencias (sin consultas)
+        referencias = obtener_referencias()
+        casas = referencias.casas_activas
+        if not casas:
             return creaciones
 
-        # Obtener tipos de cuota disponibles
-        tipos_cuota = TipoCuota.objects.all()
-        if not tipos_cuota.exists():
+        tipos_cuota = referencias.tipos_cuota
+        if not tipos_cuota:
             return creaciones
 
+        creaciones_por_casa = {}
         for tipo_cuota in tipos_cuota:
             opciones = self.obtener_opciones_por_tipo(tipo_cuota)
 
@@ -116,20 +340,34 @@ class Command(BaseCommand):
                             opcion=opcion,
                             valor=cuota_valor
                         )
+                        creaciones_por_casa[casa.id] = creaciones_por_casa.get(casa.id, 0) + 1
                     creaciones += 1
 
+        # El evento no tenía cuotas, así que cuenta como cubierto por cada casa
+        for casa_id, nuevas in creaciones_por_casa.items():
+            self.estadisticas.registrar_cuotas(casa_id, nuevas=nuevas, eventos_nuevos=1)
+
         return creaciones
 
-    def actualizar_cuota_individual(self, cuota, dry_run=False):
-        """Actualiza una cuota individual con variaciones aleatorias"""
+    def filas_iniciales(self, evento_id, referencias):
+        """Filas de upsert con las cuotas iniciales de un evento para cada casa activa"""
+        return [
+            (evento_id, casa.id, tipo_cuota.id, opcion, self.generar_cuota_base(tipo_cuota), None)
+            for tipo_cuota in referencias.tipos_cuota
+            for opcion in self.obtener_opciones_por_tipo(tipo_cuota)
+            for casa in referencias.casas_activas
+        ]
+
+    def variar_valor(self, valor):
+        """Valor con una variación aleatoria, o None si no cambia significativamente"""
         # Generar variación aleatoria (-10% a +10%)
         variacion = random.uniform(-0.10, 0.10)
 
         # Aplicar variación más conservadora para cuotas altas
-        if cuota.valor > 5.0:
+        if valor > 5.0:
             variacion *= 0.5
 
-        nuevo_valor = cuota.valor * (1 + variacion)
+        nuevo_valor = float(valor) * (1 + variacion)
 
         # Asegurar que el valor esté dentro de rangos razonables
         nuevo_valor = max(1.01, min(100.0, nuevo_valor))
@@ -138,11 +376,19 @@ class Command(BaseCommand):
         nuevo_valor = round(nuevo_valor, 2)
 
         # Solo actualizar si cambió significativamente (> 0.01)
-        if abs(nuevo_valor - cuota.valor) > 0.01:
+        if abs(nuevo_valor - float(valor)) > 0.01:
+            return nuevo_valor
+        return None
+
+    def actualizar_cuota_individual(self, cuota, dry_run=False):
+        """Actualiza una cuota individual con variaciones aleatorias"""
+        nuevo_valor = self.variar_valor(cuota.valor)
+        if nuevo_valor is not None:
             if not dry_run:
                 cuota.valor_anterior = cuota.valor
                 cuota.valor = nuevo_valor
                 cuota.save()
+                self.estadisticas.registrar_actualizacion(cuota.casa_apuestas_id)
             return True
 
         return False
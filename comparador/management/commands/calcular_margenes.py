@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from comparador.margenes import actualizar_margenes
+from comparador.models import EstadisticaMargen
+
+
+class Command(BaseCommand):
+    help = 'Calcula los márgenes (overround) por mercado y las estadísticas por casa de apuestas'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--eventos',
+            type=int,
+            nargs='+',
+            help='IDs de eventos a recalcular (por defecto: todos los eventos abiertos)',
+        )
+
+    def handle(self, *args, **options):
+        mercados = actualizar_margenes(options['eventos'])
+        self.stdout.write(f'✓ {mercados} mercados calculados')
+
+        for estadistica in EstadisticaMargen.objects.filter(deporte__isnull=True).select_related('casa_apuestas'):
+            self.stdout.write(
+                f'  {estadistica.casa_apuestas}: media {estadistica.margen_medio:.2%}, '
+                f'p50 {estadistica.margen_p50:.2%}, p90 {estadistica.margen_p90:.2%} '
+                f'({estadistica.mercados} mercados)'
+            )
+
+        self.stdout.write(self.style.SUCCESS('MÁRGENES ACTUALIZADOS'))
@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand
+from comparador.estadisticas import recalcular_estadisticas
+from comparador.instantaneas import importar_instantanea
+from comparador.versiones import lote_escritura
+
+
+class Command(BaseCommand):
+    help = 'Importa eventos y cuotas desde una instantánea columnar (.npz)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('archivo', help='Ruta del archivo .npz a cargar')
+        parser.add_argument(
+            '--lote',
+            type=int,
+            default=5000,
+            help='Filas por sentencia INSERT (por defecto: 5000)',
+        )
+
+    def handle(self, *args, **options):
+        inicio = time.perf_counter()
+
+        def progreso(cuotas):
+            self.stdout.write(f'  {cuotas} cuotas importadas...')
+
+        with lote_escritura():
+            eventos, cuotas = importar_instantanea(options['archivo'], tamano_lote=options['lote'], progreso=progreso)
+            recalcular_estadisticas()
+
+        duracion = time.perf_counter() - inicio
+        self.stdout.write(self.style.SUCCESS(
+            f'IMPORTACIÓN COMPLETADA: {eventos} eventos nuevos y {cuotas} cuotas en {duracion:.1f}s '
+            f'({cuotas / max(duracion, 1e-9):,.0f} cuotas/s); márgenes y estadísticas por casa recalculados'
+        ))
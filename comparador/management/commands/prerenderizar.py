@@ -0,0 +1,44 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from comparador.prerenderizado import prerenderizar, rutas_a_prerenderizar
+
+
+class Command(BaseCommand):
+    help = 'Pre-renderiza a disco (gzip) las páginas más visitadas para la versión de datos actual'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--eventos',
+            type=int,
+            default=settings.COMPARADOR_PRERENDER_EVENTOS,
+            help=f'Próximos eventos con página de detalle pre-renderizada '
+                 f'(por defecto: {settings.COMPARADOR_PRERENDER_EVENTOS})',
+        )
+        parser.add_argument(
+            '--hilos',
+            type=int,
+            default=4,
+            help='Hilos de renderizado en paralelo (por defecto: 4)',
+        )
+        parser.add_argument(
+            '--nivel',
+            type=int,
+            default=6,
+            choices=range(1, 10),
+            help='Nivel de compresión gzip (por defecto: 6)',
+        )
+
+    def handle(self, *args, **options):
+        inicio = time.perf_counter()
+        version, paginas, tamano = prerenderizar(
+            rutas_a_prerenderizar(options['eventos']),
+            hilos=options['hilos'],
+            nivel=options['nivel'],
+        )
+        duracion = time.perf_counter() - inicio
+        self.stdout.write(self.style.SUCCESS(
+            f'PRE-RENDERIZADO COMPLETADO: {paginas} páginas ({tamano / 1024:,.0f} KiB sin comprimir) '
+            f'de la versión {version} en {duracion:.1f}s'
+        ))
@@ -0,0 +1,132 @@
+import asyncio
+import json
+import os
+import signal
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from comparador.carga import MEZCLA_POR_DEFECTO, ejecutar_carga, informe, urls_de_prueba
+
+
+def mezcla(valor):
+    """'index=20,evento_detalle=40,...': las vistas omitidas no reciben peticiones"""
+    pesos = {}
+    for parte in valor.split(','):
+        vista, _, peso = parte.partition('=')
+        if vista.strip() not in MEZCLA_POR_DEFECTO:
+            raise ValueError(vista)
+        pesos[vista.strip()] = float(peso)
+    return pesos
+
+
+class Command(BaseCommand):
+    help = ('Genera carga HTTP contra un servidor local (runserver, uvicorn, gunicorn...) con una mezcla '
+            'ponderada de vistas y guarda rendimiento, latencias y errores en un informe JSON')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1', help='Servidor (por defecto: 127.0.0.1)')
+        parser.add_argument('--puerto', type=int, default=8000, help='Puerto (por defecto: 8000)')
+        parser.add_argument(
+            '--concurrencia',
+            type=int,
+            default=20,
+            help='Clientes simultáneos, cada uno con su conexión (por defecto: 20)',
+        )
+        parser.add_argument('--duracion', type=float, default=30, help='Segundos medidos (por defecto: 30)')
+        parser.add_argument(
+            '--calentamiento',
+            type=float,
+            default=5,
+            help='Segundos iniciales excluidos del informe (por defecto: 5)',
+        )
+        parser.add_argument(
+            '--mezcla',
+            type=mezcla,
+            default=MEZCLA_POR_DEFECTO,
+            help='Pesos por vista, p. ej. index=20,evento_detalle=40 (por defecto: '
+                 + ','.join(f'{vista}={peso}' for vista, peso in MEZCLA_POR_DEFECTO.items()) + ')',
+        )
+        parser.add_argument(
+            '--eventos',
+            type=int,
+            default=200,
+            help='Próximos eventos cuyo detalle entra en la mezcla (por defecto: 200)',
+        )
+        parser.add_argument(
+            '--gzip',
+            action='store_true',
+            help='Envía Accept-Encoding: gzip (necesario para servir páginas pre-renderizadas)',
+        )
+        parser.add_argument(
+            '--con-actualizacion',
+            action='store_true',
+            help='Ejecuta actualizar_cuotas --daemon en paralelo durante la prueba',
+        )
+        parser.add_argument('--semilla', type=int, help='Semilla para repetir la misma secuencia de URLs')
+        parser.add_argument(
+            '--salida',
+            default='prueba_carga.json',
+            help='Archivo del informe JSON (por defecto: prueba_carga.json)',
+        )
+
+    def handle(self, *args, **options):
+        urls = urls_de_prueba(options['eventos'])
+        vacias = [vista for vista, peso in options['mezcla'].items() if peso > 0 and not urls.get(vista)]
+        if vacias:
+            self.stdout.write(self.style.WARNING(f'Sin URLs para: {", ".join(vacias)} (¿base de datos vacía?)'))
+        if not any(urls.get(vista) for vista, peso in options['mezcla'].items() if peso > 0):
+            raise CommandError('Ninguna vista de la mezcla tiene URLs de prueba')
+
+        actualizador = None
+        if options['con_actualizacion']:
+            # Proceso aparte, como en producción: compite por la base de datos, no por el GIL
+            actualizador = subprocess.Popen(
+                [sys.executable, '-m', 'django', 'actualizar_cuotas', '--daemon'],
+                cwd=settings.BASE_DIR,
+                env={**os.environ, 'DJANGO_SETTINGS_MODULE': settings.SETTINGS_MODULE},
+                stdout=subprocess.DEVNULL,
+            )
+
+        self.stdout.write(
+            f"Carga contra {options['host']}:{options['puerto']}: {options['concurrencia']} clientes, "
+            f"{options['calentamiento']:g}s de calentamiento + {options['duracion']:g}s medidos"
+        )
+        try:
+            latencias, errores, segundos = asyncio.run(ejecutar_carga(
+                options['host'],
+                options['puerto'],
+                urls,
+                options['mezcla'],
+                concurrencia=options['concurrencia'],
+                duracion=options['duracion'],
+                calentamiento=options['calentamiento'],
+                cabeceras={'Accept-Encoding': 'gzip'} if options['gzip'] else None,
+                semilla=options['semilla'],
+            ))
+        finally:
+            if actualizador is not None:
+                actualizador.send_signal(signal.SIGTERM)
+                actualizador.wait()
+
+        resultado = {
+            'configuracion': {
+                clave: options[clave]
+                for clave in ('host', 'puerto', 'concurrencia', 'duracion', 'calentamiento', 'mezcla',
+                              'eventos', 'gzip', 'con_actualizacion', 'semilla')
+            },
+            **informe(latencias, errores, segundos),
+        }
+        with open(options['salida'], 'w') as archivo:
+            json.dump(resultado, archivo, indent=2, ensure_ascii=False)
+
+        for vista, resumen in [('TOTAL', resultado['total'])] + list(resultado['vistas'].items()):
+            latencia = resumen.get('latencia_ms', {})
+            self.stdout.write(
+                f"  {vista:<20} {resumen['peticiones']:>7} pet. {resumen['por_segundo']:>8.1f}/s  "
+                f"p50 {latencia.get('p50', 0):>7.1f}ms  p95 {latencia.get('p95', 0):>7.1f}ms  "
+                f"p99 {latencia.get('p99', 0):>7.1f}ms  errores {resumen['tasa_error']:.1%}"
+            )
+        estilo = self.style.SUCCESS if not resultado['total']['errores'] else self.style.WARNING
+        self.stdout.write(estilo(f"INFORME GUARDADO EN {options['salida']}"))
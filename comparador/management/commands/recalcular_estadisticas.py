@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from comparador.estadisticas import recalcular_estadisticas
+from comparador.models import EstadisticasCasa
+
+
+class Command(BaseCommand):
+    help = 'Recalcula desde cero las estadísticas de las casas de apuestas para corregir desvíos'
+
+    def handle(self, *args, **options):
+        anteriores = {
+            estadistica.casa_apuestas_id: estadistica
+            for estadistica in EstadisticasCasa.objects.all()
+        }
+
+        for estadistica in recalcular_estadisticas():
+            anterior = anteriores.get(estadistica.casa_apuestas_id)
+            desvio_cuotas = estadistica.total_cuotas - (anterior.total_cuotas if anterior else 0)
+            desvio_eventos = estadistica.eventos_cubiertos - (anterior.eventos_cubiertos if anterior else 0)
+            mensaje = (
+                f'casa {estadistica.casa_apuestas_id}: {estadistica.total_cuotas} cuotas, '
+                f'{estadistica.eventos_cubiertos} eventos'
+            )
+            if desvio_cuotas or desvio_eventos:
+                self.stdout.write(self.style.WARNING(
+                    f'⚠ {mensaje} (desvío: {desvio_cuotas:+d} cuotas, {desvio_eventos:+d} eventos)'
+                ))
+            else:
+                self.stdout.write(f'✓ {mensaje}')
+
+        self.stdout.write(self.style.SUCCESS('ESTADÍSTICAS RECALCULADAS'))
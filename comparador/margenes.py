@@ -0,0 +1,163 @@
+"""
+Cálculo vectorizado de márgenes (overround) por casa de apuestas
+"""
+import math
+from collections import defaultdict
+from itertools import islice
+
+import numpy as np
+from django.db import transaction
+from django.db.models import Avg, Count, F, Q, Window
+from django.db.models.functions import Ceil, Floor, RowNumber
+
+from .models import Cuota, EstadisticaMargen, Evento, MargenMercado
+from .versiones import incrementar_version
+
+TAMANO_LOTE = 500
+PERCENTILES = (50, 90)
+
+
+def cargar_cuotas(eventos_ids):
+    """Carga las cuotas abiertas de un bloque de eventos como matriz (evento, casa, tipo, deporte, valor)"""
+    cuotas = Cuota.objects.filter(evento_id__in=eventos_ids, evento__finalizado=False, valor__gt=0)
+    filas = list(cuotas.order_by().values_list(
+        'evento_id', 'casa_apuestas_id', 'tipo_cuota_id', 'evento__deporte_id', 'valor'
+    ))
+    return np.array(filas, dtype=np.float64).reshape(-1, 5)
+
+
+def calcular_margenes(matriz):
+    """
+    Agrupa las cuotas por (evento, casa, tipo) y calcula el margen de cada mercado.
+
+    Solo se consideran mercados completos: la casa ofrece tantas opciones como
+    el máximo ofrecido por cualquier casa para ese (evento, tipo), y al menos dos.
+    Retorna (claves[evento, casa, tipo], deportes, opciones, margenes).
+    """
+    if not len(matriz):
+        vacio = np.empty(0, dtype=np.int64)
+        return np.empty((0, 3), dtype=np.int64), vacio, vacio, np.empty(0)
+
+    claves_cuota = matriz[:, :3].astype(np.int64)
+    claves, inversa = np.unique(claves_cuota, axis=0, return_inverse=True)
+    inversa = inversa.ravel()
+
+    implicitas = np.bincount(inversa, weights=1.0 / matriz[:, 4])
+    opciones = np.bincount(inversa)
+    deportes = np.empty(len(claves), dtype=np.int64)
+    deportes[inversa] = matriz[:, 3].astype(np.int64)
+
+    _, inversa_mercado = np.unique(claves[:, [0, 2]], axis=0, return_inverse=True)
+    inversa_mercado = inversa_mercado.ravel()
+    maximo = np.zeros(inversa_mercado.max() + 1, dtype=np.int64)
+    np.maximum.at(maximo, inversa_mercado, opciones)
+
+    completos = (opciones == maximo[inversa_mercado]) & (opciones >= 2)
+    return claves[completos], deportes[completos], opciones[completos], implicitas[completos] - 1
+
+
+def _lotes_eventos(eventos_ids=None):
+    """Bloques de TAMANO_LOTE ids: los indicados o, por defecto, los eventos abiertos leídos por bloques"""
+    if eventos_ids is None:
+        ids = Evento.objects.filter(finalizado=False).order_by().values_list(
+            'id', flat=True
+        ).iterator(chunk_size=TAMANO_LOTE)
+    else:
+        ids = iter(sorted(set(eventos_ids)))
+    while lote := list(islice(ids, TAMANO_LOTE)):
+        yield lote
+
+
+def actualizar_margenes(eventos_ids=None, agregados=True):
+    """
+    Recalcula los márgenes de mercado (de todos o de los eventos indicados) y, si se pide, sus agregados.
+
+    Las cuotas se leen por bloques de eventos: la memoria depende del tamaño del bloque,
+    no del número de cuotas abiertas.
+    """
+    total = 0
+    with transaction.atomic():
+        if eventos_ids is None:
+            # Un solo borrado para todos, también los márgenes de eventos ya finalizados
+            MargenMercado.objects.all().delete()
+        for lote in _lotes_eventos(eventos_ids):
+            claves, deportes, opciones, margenes = calcular_margenes(cargar_cuotas(lote))
+            if eventos_ids is not None:
+                MargenMercado.objects.filter(evento_id__in=lote).delete()
+
+            MargenMercado.objects.bulk_create([
+                MargenMercado(
+                    evento_id=int(evento), casa_apuestas_id=int(casa), tipo_cuota_id=int(tipo),
+                    deporte_id=int(deporte), opciones=int(n), margen=float(margen)
+                )
+                for (evento, casa, tipo), deporte, n, margen in zip(claves, deportes, opciones, margenes)
+            ], batch_size=1000)
+            total += len(claves)
+
+        if agregados:
+            recalcular_estadisticas_margen()
+    return total
+
+
+def agregar_margenes(grupo):
+    """
+    {clave del grupo: [mercados, media, p50, p90]} de los márgenes de eventos abiertos.
+
+    Cuentas y medias con GROUP BY; para los percentiles (interpolación lineal) la base
+    de datos ordena cada grupo y solo devuelve las filas vecinas de cada posición.
+    """
+    abiertos = MargenMercado.objects.filter(evento__finalizado=False).order_by()
+    resultado = {
+        tuple(fila[campo] for campo in grupo): [fila['mercados'], fila['media']]
+        for fila in abiertos.values(*grupo).annotate(mercados=Count('id'), media=Avg('margen'))
+    }
+
+    particion = [F(campo) for campo in grupo]
+    ordenados = abiertos.annotate(
+        posicion=Window(RowNumber(), partition_by=particion, order_by=F('margen').asc()) - 1,
+        total=Window(Count('id'), partition_by=particion),
+    )
+    vecinas = Q()
+    for percentil in PERCENTILES:
+        exacta = (F('total') - 1) * (percentil / 100)
+        vecinas |= Q(posicion__gte=Floor(exacta), posicion__lte=Ceil(exacta))
+    valores = defaultdict(dict)
+    for *clave, posicion, margen in ordenados.filter(vecinas).values_list(*grupo, 'posicion', 'margen'):
+        valores[tuple(clave)][posicion] = margen
+
+    for clave, agregado in resultado.items():
+        for percentil in PERCENTILES:
+            exacta = (agregado[0] - 1) * (percentil / 100)
+            bajo, alto = valores[clave][math.floor(exacta)], valores[clave][math.ceil(exacta)]
+            agregado.append(bajo + (alto - bajo) * (exacta - math.floor(exacta)))
+    return resultado
+
+
+def recalcular_estadisticas_margen():
+    """Reconstruye los agregados por casa (global y por deporte) desde los márgenes de eventos abiertos"""
+    estadisticas = [
+        _construir_estadistica(casa, None, agregado)
+        for (casa,), agregado in agregar_margenes(['casa_apuestas_id']).items()
+    ]
+    estadisticas += [
+        _construir_estadistica(casa, deporte, agregado)
+        for (casa, deporte), agregado in agregar_margenes(['casa_apuestas_id', 'deporte_id']).items()
+    ]
+
+    with transaction.atomic():
+        EstadisticaMargen.objects.all().delete()
+        EstadisticaMargen.objects.bulk_create(estadisticas)
+        incrementar_version()
+    return len(estadisticas)
+
+
+def _construir_estadistica(casa, deporte, agregado):
+    mercados, media, p50, p90 = agregado
+    return EstadisticaMargen(
+        casa_apuestas_id=casa,
+        deporte_id=deporte,
+        mercados=mercados,
+        margen_medio=media,
+        margen_p50=p50,
+        margen_p90=p90,
+    )
@@ -0,0 +1,57 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+from django.utils.http import http_date
+
+from .prerenderizado import archivo_vigente
+from .versiones import validadores_version
+
+
+class PrerenderizadoMiddleware:
+    """Sirve las páginas pre-renderizadas de la versión de datos vigente sin pasar por las vistas"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.respuesta_prerenderizada(request) or self.get_response(request)
+
+    async def __acall__(self, request):
+        respuesta = await sync_to_async(self.respuesta_prerenderizada)(request)
+        return respuesta or await self.get_response(request)
+
+    def respuesta_prerenderizada(self, request):
+        """Respuesta desde disco, o None si la ruta no tiene un archivo vigente; sin la base de datos"""
+        # Solo GET: la respuesta a HEAD no lleva cuerpo y la construye la vista
+        if request.method != 'GET' or 'gzip' not in request.headers.get('Accept-Encoding', ''):
+            return None
+
+        # Versión y fecha salen del puntero publicado, no de VersionDatos: las rutas sin
+        # archivo (admin, búsquedas, páginas no pre-renderizadas) siguen sin coste extra
+        vigente = archivo_vigente(request.get_full_path())
+        if vigente is None:
+            return None
+        archivo, version, fecha = vigente
+
+        etag, ultima_modificacion = validadores_version(version, fecha)
+        if etag in request.headers.get('If-None-Match', ''):
+            respuesta = HttpResponseNotModified()
+        else:
+            try:
+                contenido = archivo.read_bytes()
+            except FileNotFoundError:
+                # Retirado por un ciclo posterior entre la comprobación y la lectura
+                return None
+            respuesta = HttpResponse(contenido, content_type='text/html; charset=utf-8')
+            respuesta['Content-Encoding'] = 'gzip'
+        respuesta['ETag'] = etag
+        respuesta['Last-Modified'] = http_date(ultima_modificacion.timestamp())
+        respuesta['X-Prerenderizado'] = str(version)
+        patch_vary_headers(respuesta, ['Accept-Encoding'])
+        return respuesta
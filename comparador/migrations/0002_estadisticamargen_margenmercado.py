@@ -0,0 +1,52 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('comparador', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EstadisticaMargen',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mercados', models.PositiveIntegerField(default=0)),
+                ('margen_medio', models.FloatField()),
+                ('margen_p50', models.FloatField()),
+                ('margen_p90', models.FloatField()),
+                ('fecha_actualizacion', models.DateTimeField(auto_now=True)),
+                ('casa_apuestas', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='estadisticas_margen', to='comparador.casaapuestas')),
+                ('deporte', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='estadisticas_margen', to='comparador.deporte')),
+            ],
+            options={
+                'verbose_name': 'Estadística de Margen',
+                'verbose_name_plural': 'Estadísticas de Margen',
+                'ordering': ['margen_medio'],
+                'unique_together': {('casa_apuestas', 'deporte')},
+            },
+        ),
+        migrations.CreateModel(
+            name='MargenMercado',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('opciones', models.PositiveSmallIntegerField()),
+                ('margen', models.FloatField(help_text='Suma de probabilidades implícitas menos 1')),
+                ('fecha_actualizacion', models.DateTimeField(auto_now=True)),
+                ('casa_apuestas', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='margenes', to='comparador.casaapuestas')),
+                ('deporte', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='margenes', to='comparador.deporte')),
+                ('evento', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='margenes', to='comparador.evento')),
+                ('tipo_cuota', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='margenes', to='comparador.tipocuota')),
+            ],
+            options={
+                'verbose_name': 'Margen de Mercado',
+                'verbose_name_plural': 'Márgenes de Mercado',
+                'indexes': [models.Index(fields=['casa_apuestas', 'deporte'], name='comparador__casa_ap_53bdb4_idx')],
+                'unique_together': {('casa_apuestas', 'evento', 'tipo_cuota')},
+            },
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:31
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def poblar_estadisticas(apps, schema_editor):
+    CasaApuestas = apps.get_model('comparador', 'CasaApuestas')
+    Cuota = apps.get_model('comparador', 'Cuota')
+    EstadisticasCasa = apps.get_model('comparador', 'EstadisticasCasa')
+
+    totales = {
+        fila['casa_apuestas']: fila
+        for fila in Cuota.objects.filter(evento__finalizado=False).order_by().values('casa_apuestas').annotate(
+            total=Count('id'),
+            eventos=Count('evento', distinct=True),
+        )
+    }
+    EstadisticasCasa.objects.bulk_create([
+        EstadisticasCasa(
+            casa_apuestas_id=casa_id,
+            total_cuotas=totales.get(casa_id, {}).get('total', 0),
+            eventos_cubiertos=totales.get(casa_id, {}).get('eventos', 0),
+        )
+        for casa_id in CasaApuestas.objects.values_list('id', flat=True)
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('comparador', '0002_estadisticamargen_margenmercado'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EstadisticasCasa',
+            fields=[
+                ('casa_apuestas', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='estadisticas', serialize=False, to='comparador.casaapuestas')),
+                ('total_cuotas', models.PositiveIntegerField(default=0)),
+                ('eventos_cubiertos', models.PositiveIntegerField(default=0)),
+                ('ultima_actualizacion', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Estadísticas de Casa',
+                'verbose_name_plural': 'Estadísticas de Casas',
+            },
+        ),
+        migrations.RunPython(poblar_estadisticas, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,153 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:47
+
+import re
+import unicodedata
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+# Copia de comparador.normalizacion tal como era al crear la migración: el código de la
+# aplicación puede cambiar después y la migración debe dar siempre el mismo resultado
+PALABRAS_IGNORADAS = {'fc', 'cf', 'sc', 'ac', 'afc', 'cd', 'club', 'the'}
+_UNIONES = re.compile(r"[.'´`’]")
+_NO_ALFANUMERICO = re.compile(r'[^a-z0-9]+')
+
+
+def normalizar_nombre(nombre):
+    texto = unicodedata.normalize('NFKD', nombre or '')
+    texto = ''.join(c for c in texto if not unicodedata.combining(c)).lower()
+    palabras = _NO_ALFANUMERICO.sub(' ', _UNIONES.sub('', texto)).split()
+    significativas = [palabra for palabra in palabras if palabra not in PALABRAS_IGNORADAS]
+    return ' '.join(significativas or palabras)
+
+
+def _crear_referencias(modelo, filas):
+    """Crea un registro por (deporte, nombre normalizado); retorna {(deporte, nombre original): id}"""
+    canonicos = {}
+    for deporte_id, nombre, *extra in filas:
+        canonicos.setdefault((deporte_id, normalizar_nombre(nombre)), (nombre, extra))
+    modelo.objects.bulk_create([
+        modelo(deporte_id=deporte_id, nombre=nombre, nombre_normalizado=normalizado,
+               **({'pais': extra[0]} if extra else {}))
+        for (deporte_id, normalizado), (nombre, extra) in canonicos.items()
+    ])
+    ids = {
+        (deporte_id, normalizado): pk
+        for pk, deporte_id, normalizado in modelo.objects.values_list('id', 'deporte_id', 'nombre_normalizado')
+    }
+    return {(deporte_id, nombre): ids[(deporte_id, normalizar_nombre(nombre))] for deporte_id, nombre, *_ in filas}
+
+
+def _vincular(Evento, modelo, campo_fk, campo_texto, ids):
+    """Enlaza los eventos: una actualización correlacionada y otra por cada variante de escritura"""
+    Evento.objects.update(**{campo_fk: Subquery(
+        modelo.objects.filter(deporte_id=OuterRef('deporte_id'), nombre=OuterRef(campo_texto)).values('id')[:1]
+    )})
+    canonicos = dict(modelo.objects.values_list('id', 'nombre'))
+    for (deporte_id, nombre), pk in ids.items():
+        if canonicos[pk] != nombre:
+            Evento.objects.filter(**{'deporte_id': deporte_id, campo_texto: nombre}).update(**{campo_fk: pk})
+
+
+def poblar_referencias(apps, schema_editor):
+    Evento = apps.get_model('comparador', 'Evento')
+    Equipo = apps.get_model('comparador', 'Equipo')
+    Competicion = apps.get_model('comparador', 'Competicion')
+
+    eventos = Evento.objects.order_by()
+    nombres = set(eventos.values_list('deporte_id', 'equipo_local').distinct())
+    nombres |= set(eventos.values_list('deporte_id', 'equipo_visitante').distinct())
+    equipos = _crear_referencias(Equipo, sorted(nombres))
+    competiciones = _crear_referencias(
+        Competicion, sorted(eventos.exclude(liga='').values_list('deporte_id', 'liga', 'pais').distinct())
+    )
+
+    _vincular(Evento, Equipo, 'local', 'equipo_local', equipos)
+    _vincular(Evento, Equipo, 'visitante', 'equipo_visitante', equipos)
+    _vincular(Evento, Competicion, 'competicion', 'liga', competiciones)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('comparador', '0004_versiondatos'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Competicion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nombre', models.CharField(max_length=100)),
+                ('nombre_normalizado', models.CharField(editable=False, max_length=100)),
+                ('pais', models.CharField(blank=True, max_length=100)),
+                ('deporte', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='competiciones', to='comparador.deporte')),
+            ],
+            options={
+                'verbose_name': 'Competición',
+                'verbose_name_plural': 'Competiciones',
+                'ordering': ['nombre'],
+                'unique_together': {('deporte', 'nombre_normalizado')},
+            },
+        ),
+        migrations.AddField(
+            model_name='evento',
+            name='competicion',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='eventos', to='comparador.competicion'),
+        ),
+        migrations.CreateModel(
+            name='Equipo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nombre', models.CharField(max_length=150)),
+                ('nombre_normalizado', models.CharField(editable=False, max_length=150)),
+                ('deporte', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='equipos', to='comparador.deporte')),
+            ],
+            options={
+                'verbose_name': 'Equipo',
+                'verbose_name_plural': 'Equipos',
+                'ordering': ['nombre'],
+                'unique_together': {('deporte', 'nombre_normalizado')},
+            },
+        ),
+        migrations.AddField(
+            model_name='evento',
+            name='local',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='eventos_local', to='comparador.equipo'),
+        ),
+        migrations.AddField(
+            model_name='evento',
+            name='visitante',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='eventos_visitante', to='comparador.equipo'),
+        ),
+        migrations.CreateModel(
+            name='AliasCompeticion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('alias', models.CharField(max_length=100)),
+                ('deporte', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='alias_competiciones', to='comparador.deporte')),
+                ('competicion', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='alias', to='comparador.competicion')),
+            ],
+            options={
+                'verbose_name': 'Alias de Competición',
+                'verbose_name_plural': 'Alias de Competiciones',
+                'unique_together': {('deporte', 'alias')},
+            },
+        ),
+        migrations.CreateModel(
+            name='AliasEquipo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('alias', models.CharField(max_length=150)),
+                ('deporte', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='alias_equipos', to='comparador.deporte')),
+                ('equipo', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='alias', to='comparador.equipo')),
+            ],
+            options={
+                'verbose_name': 'Alias de Equipo',
+                'verbose_name_plural': 'Alias de Equipos',
+                'unique_together': {('deporte', 'alias')},
+            },
+        ),
+        migrations.RunPython(poblar_referencias, migrations.RunPython.noop),
+    ]
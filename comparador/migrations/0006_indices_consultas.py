@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('comparador', '0005_equipos_competiciones'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='cuota',
+            options={'verbose_name': 'Cuota', 'verbose_name_plural': 'Cuotas'},
+        ),
+        migrations.RemoveIndex(
+            model_name='evento',
+            name='comparador__fecha_e_8bd404_idx',
+        ),
+        migrations.AddIndex(
+            model_name='cuota',
+            index=models.Index(fields=['tipo_cuota', 'evento', 'opcion', '-valor', 'casa_apuestas'], name='cuota_mejor_precio_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='evento',
+            index=models.Index(condition=models.Q(('finalizado', False)), fields=['fecha_evento'], name='evento_abierto_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='evento',
+            index=models.Index(condition=models.Q(('finalizado', False)), fields=['deporte', 'fecha_evento'], name='evento_abierto_deporte_idx'),
+        ),
+    ]
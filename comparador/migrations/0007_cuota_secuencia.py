@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:13
+
+from django.db import migrations, models
+from django.db.models import F, Max
+from django.utils import timezone
+
+
+def numerar_cuotas(apps, schema_editor):
+    """Numera las cuotas existentes por id y deja el contador de cambios en el último número"""
+    Cuota = apps.get_model('comparador', 'Cuota')
+    VersionDatos = apps.get_model('comparador', 'VersionDatos')
+
+    ultimo = Cuota.objects.aggregate(ultimo=Max('id'))['ultimo'] or 0
+    Cuota.objects.update(secuencia=F('id'))
+    VersionDatos.objects.update_or_create(
+        clave='cambios', defaults={'version': ultimo, 'fecha_actualizacion': timezone.now()}
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('comparador', '0006_indices_consultas'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cuota',
+            name='secuencia',
+            field=models.BigIntegerField(db_index=True, default=0, editable=False),
+        ),
+        # Con secuencia 0, las cuotas previas no llegarían a los clientes que empiezan con desde=0
+        migrations.RunPython(numerar_cuotas, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('comparador', '0007_cuota_secuencia'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='evento',
+            index=models.Index(fields=['fecha_evento', 'finalizado'], name='evento_fecha_idx'),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:52
+
+from django.db import migrations
+
+CAMPOS = {'evento_local_busqueda_idx': 'equipo_local', 'evento_visitante_busqueda_idx': 'equipo_visitante'}
+
+# La búsqueda por prefijo del admin (^campo) es un istartswith: cada motor lo resuelve
+# con un índice distinto, así que no se declara en el modelo
+COLUMNA_INDEXADA = {
+    # LIKE no distingue mayúsculas: solo usa índices con colación NOCASE
+    'sqlite': '"{campo}" COLLATE NOCASE',
+    # istartswith compara UPPER(campo) con LIKE
+    'postgresql': 'UPPER("{campo}"::text) text_pattern_ops',
+    # Las colaciones por defecto ya no distinguen mayúsculas
+    'mysql': '`{campo}`',
+}
+
+
+def crear_indices(apps, schema_editor):
+    columna = COLUMNA_INDEXADA.get(schema_editor.connection.vendor)
+    if columna is None:
+        return
+    for nombre, campo in CAMPOS.items():
+        schema_editor.execute(f'CREATE INDEX {nombre} ON comparador_evento ({columna.format(campo=campo)})')
+
+
+def borrar_indices(apps, schema_editor):
+    if schema_editor.connection.vendor not in COLUMNA_INDEXADA:
+        return
+    sufijo = ' ON comparador_evento' if schema_editor.connection.vendor == 'mysql' else ''
+    for nombre in CAMPOS:
+        schema_editor.execute(f'DROP INDEX {nombre}{sufijo}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('comparador', '0008_indice_fecha_evento'),
+    ]
+
+    operations = [
+        migrations.RunPython(crear_indices, borrar_indices),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:49
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('comparador', '0009_indices_busqueda_equipos'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='evento',
+            name='competicion',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.RESTRICT, related_name='eventos', to='comparador.competicion'),
+        ),
+        migrations.AlterField(
+            model_name='evento',
+            name='local',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.RESTRICT, related_name='eventos_local', to='comparador.equipo'),
+        ),
+        migrations.AlterField(
+            model_name='evento',
+            name='visitante',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.RESTRICT, related_name='eventos_visitante', to='comparador.equipo'),
+        ),
+    ]
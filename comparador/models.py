@@ -1,6 +1,12 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F
 from django.utils import timezone
 
+# Contador de VersionDatos con la secuencia global de cambios de cuotas
+CLAVE_CAMBIOS = 'cambios'
+# Versión de VersionDatos de los datos de referencia (deportes, tipos de cuota y casas)
+CLAVE_REFERENCIAS = 'referencias'
+
 class CasaApuestas(models.Model):
     """Modelo para representar una casa de apuestassss"""
     nombre = models.CharField(max_length=100, unique=True)
@@ -33,6 +39,69 @@ class Deporte(models.Model):
         return self.nombre
 
 
+class Competicion(models.Model):
+    """Liga o torneo de un deporte, identificado por su nombre normalizado"""
+    deporte = models.ForeignKey(Deporte, on_delete=models.CASCADE, related_name='competiciones')
+    nombre = models.CharField(max_length=100)
+    nombre_normalizado = models.CharField(max_length=100, editable=False)
+    pais = models.CharField(max_length=100, blank=True)
+
+    class Meta:
+        verbose_name = "Competición"
+        verbose_name_plural = "Competiciones"
+        ordering = ['nombre']
+        unique_together = [['deporte', 'nombre_normalizado']]
+
+    def __str__(self):
+        return self.nombre
+
+
+class Equipo(models.Model):
+    """Equipo o participante de un deporte, identificado por su nombre normalizado"""
+    deporte = models.ForeignKey(Deporte, on_delete=models.CASCADE, related_name='equipos')
+    nombre = models.CharField(max_length=150)
+    nombre_normalizado = models.CharField(max_length=150, editable=False)
+
+    class Meta:
+        verbose_name = "Equipo"
+        verbose_name_plural = "Equipos"
+        ordering = ['nombre']
+        unique_together = [['deporte', 'nombre_normalizado']]
+
+    def __str__(self):
+        return self.nombre
+
+
+class AliasCompeticion(models.Model):
+    """Nombre alternativo (normalizado) con el que una fuente designa una competición"""
+    deporte = models.ForeignKey(Deporte, on_delete=models.CASCADE, related_name='alias_competiciones')
+    alias = models.CharField(max_length=100)
+    competicion = models.ForeignKey(Competicion, on_delete=models.CASCADE, related_name='alias')
+
+    class Meta:
+        verbose_name = "Alias de Competición"
+        verbose_name_plural = "Alias de Competiciones"
+        unique_together = [['deporte', 'alias']]
+
+    def __str__(self):
+        return f"{self.alias} → {self.competicion}"
+
+
+class AliasEquipo(models.Model):
+    """Nombre alternativo (normalizado) con el que una fuente designa un equipo"""
+    deporte = models.ForeignKey(Deporte, on_delete=models.CASCADE, related_name='alias_equipos')
+    alias = models.CharField(max_length=150)
+    equipo = models.ForeignKey(Equipo, on_delete=models.CASCADE, related_name='alias')
+
+    class Meta:
+        verbose_name = "Alias de Equipo"
+        verbose_name_plural = "Alias de Equipos"
+        unique_together = [['deporte', 'alias']]
+
+    def __str__(self):
+        return f"{self.alias} → {self.equipo}"
+
+
 class Evento(models.Model):
     """Modelo para representar un evento deportivo"""
     deporte = models.ForeignKey(Deporte, on_delete=models.CASCADE, related_name='eventos')
@@ -41,6 +110,11 @@ class Evento(models.Model):
     fecha_evento = models.DateTimeField()
     liga = models.CharField(max_length=100, blank=True)
     pais = models.CharField(max_length=100, blank=True)
+    # Referencias normalizadas: agrupación y búsqueda por clave entera. RESTRICT y no
+    # PROTECT: el borrado de un deporte arrastra a la vez sus equipos y sus eventos
+    local = models.ForeignKey(Equipo, on_delete=models.RESTRICT, null=True, blank=True, related_name='eventos_local')
+    visitante = models.ForeignKey(Equipo, on_delete=models.RESTRICT, null=True, blank=True, related_name='eventos_visitante')
+    competicion = models.ForeignKey(Competicion, on_delete=models.RESTRICT, null=True, blank=True, related_name='eventos')
     finalizado = models.BooleanField(default=False)
     fecha_creacion = models.DateTimeField(auto_now_add=True)
     fecha_actualizacion = models.DateTimeField(auto_now=True)
@@ -50,7 +124,17 @@ class Evento(models.Model):
         verbose_name_plural = "Eventos"
         ordering = ['fecha_evento']
         indexes = [
-            models.Index(fields=['fecha_evento', 'finalizado']),
+            # Todos los eventos por fecha: orden, filtro de estado y jerarquía de fechas del admin
+            models.Index(fields=['fecha_evento', 'finalizado'], name='evento_fecha_idx'),
+            # Las consultas públicas solo ven eventos abiertos (finalizado=False,
+            # fecha_evento >= ahora): índices parciales ordenados por fecha
+            models.Index(
+                fields=['fecha_evento'], condition=models.Q(finalizado=False), name='evento_abierto_fecha_idx'
+            ),
+            models.Index(
+                fields=['deporte', 'fecha_evento'], condition=models.Q(finalizado=False),
+                name='evento_abierto_deporte_idx'
+            ),
         ]
     
     def __str__(self):
@@ -92,19 +176,34 @@ class Cuota(models.Model):
     valor_anterior = models.DecimalField(max_digits=6, decimal_places=2, null=True, blank=True)
     fecha_actualizacion = models.DateTimeField(auto_now=True)
     fecha_creacion = models.DateTimeField(auto_now_add=True)
+    # Número de la secuencia global de cambios asignado en la última escritura
+    secuencia = models.BigIntegerField(default=0, db_index=True, editable=False)
     
     class Meta:
         verbose_name = "Cuota"
         verbose_name_plural = "Cuotas"
-        ordering = ['-valor']
         unique_together = [['evento', 'casa_apuestas', 'tipo_cuota', 'opcion']]
         indexes = [
             models.Index(fields=['evento', 'tipo_cuota', 'opcion']),
+            # Mejor precio por (tipo, evento, opción): el índice cubre la consulta completa.
+            # Las columnas cubiertas van en la clave porque SQLite no admite INCLUDE
+            models.Index(
+                fields=['tipo_cuota', 'evento', 'opcion', '-valor', 'casa_apuestas'], name='cuota_mejor_precio_idx'
+            ),
         ]
     
     def __str__(self):
         return f"{self.evento} - {self.tipo_cuota} {self.opcion}: {self.valor} ({self.casa_apuestas})"
     
+    def save(self, *args, **kwargs):
+        # La secuencia se reserva en la transacción de la propia escritura: el bloqueo del
+        # contador hace que los cambios se confirmen en el orden de su secuencia
+        with transaction.atomic():
+            self.secuencia = VersionDatos.reservar(CLAVE_CAMBIOS)
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'secuencia'}
+            super().save(*args, **kwargs)
+    
     def cambio_cuota(self):
         """Retorna el cambio en la cuota si hubo actualización"""
         if self.valor_anterior:
@@ -119,3 +218,82 @@ class Cuota(models.Model):
         elif cambio < 0:
             return 'bajada'
         return 'sin_cambio'
+
+
+class MargenMercado(models.Model):
+    """Margen (overround) de una casa de apuestas en un mercado de un evento"""
+    casa_apuestas = models.ForeignKey(CasaApuestas, on_delete=models.CASCADE, related_name='margenes')
+    evento = models.ForeignKey(Evento, on_delete=models.CASCADE, related_name='margenes')
+    tipo_cuota = models.ForeignKey(TipoCuota, on_delete=models.CASCADE, related_name='margenes')
+    deporte = models.ForeignKey(Deporte, on_delete=models.CASCADE, related_name='margenes')
+    opciones = models.PositiveSmallIntegerField()
+    margen = models.FloatField(help_text="Suma de probabilidades implícitas menos 1")
+    fecha_actualizacion = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Margen de Mercado"
+        verbose_name_plural = "Márgenes de Mercado"
+        unique_together = [['casa_apuestas', 'evento', 'tipo_cuota']]
+        indexes = [
+            models.Index(fields=['casa_apuestas', 'deporte']),
+        ]
+
+    def __str__(self):
+        return f"{self.evento} - {self.tipo_cuota}: {self.margen:.2%} ({self.casa_apuestas})"
+
+
+class EstadisticaMargen(models.Model):
+    """Margen agregado de una casa de apuestas por deporte (deporte nulo = global)"""
+    casa_apuestas = models.ForeignKey(CasaApuestas, on_delete=models.CASCADE, related_name='estadisticas_margen')
+    deporte = models.ForeignKey(Deporte, on_delete=models.CASCADE, null=True, blank=True, related_name='estadisticas_margen')
+    mercados = models.PositiveIntegerField(default=0)
+    margen_medio = models.FloatField()
+    margen_p50 = models.FloatField()
+    margen_p90 = models.FloatField()
+    fecha_actualizacion = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Estadística de Margen"
+        verbose_name_plural = "Estadísticas de Margen"
+        ordering = ['margen_medio']
+        unique_together = [['casa_apuestas', 'deporte']]
+
+    def __str__(self):
+        return f"{self.casa_apuestas} ({self.deporte or 'Global'}): {self.margen_medio:.2%}"
+
+
+class EstadisticasCasa(models.Model):
+    """Contadores mantenidos por lotes de deltas para cada casa de apuestas"""
+    casa_apuestas = models.OneToOneField(CasaApuestas, on_delete=models.CASCADE, primary_key=True, related_name='estadisticas')
+    total_cuotas = models.PositiveIntegerField(default=0)
+    eventos_cubiertos = models.PositiveIntegerField(default=0)
+    ultima_actualizacion = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Estadísticas de Casa"
+        verbose_name_plural = "Estadísticas de Casas"
+
+    def __str__(self):
+        return f"{self.casa_apuestas}: {self.total_cuotas} cuotas en {self.eventos_cubiertos} eventos"
+
+
+class VersionDatos(models.Model):
+    """Contador de versión de los datos publicados, usado como validador HTTP"""
+    clave = models.CharField(max_length=50, primary_key=True)
+    version = models.BigIntegerField(default=0)
+    fecha_actualizacion = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        verbose_name = "Versión de Datos"
+        verbose_name_plural = "Versiones de Datos"
+
+    def __str__(self):
+        return f"{self.clave} v{self.version}"
+
+    @classmethod
+    def reservar(cls, clave, cantidad=1):
+        """Suma `cantidad` al contador y retorna el primer valor reservado (llamar dentro de una transacción)"""
+        if not cls.objects.filter(clave=clave).update(version=F('version') + cantidad):
+            cls.objects.get_or_create(clave=clave)
+            cls.objects.filter(clave=clave).update(version=F('version') + cantidad)
+        return cls.objects.values_list('version', flat=True).get(clave=clave) - cantidad + 1
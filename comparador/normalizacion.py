@@ -0,0 +1,132 @@
+"""
+Normalización de nombres de equipos y competiciones e índice en memoria para la ingesta
+"""
+import re
+import unicodedata
+
+from django.db import transaction
+
+from .models import AliasCompeticion, AliasEquipo, Competicion, Equipo
+
+# Prefijos y sufijos societarios que las casas añaden u omiten a su criterio
+PALABRAS_IGNORADAS = {'fc', 'cf', 'sc', 'ac', 'afc', 'cd', 'club', 'the'}
+
+# Puntos y apóstrofos unen (C.F. -> cf, O'Higgins -> ohiggins); el resto separa palabras
+_UNIONES = re.compile(r"[.'´`’]")
+_NO_ALFANUMERICO = re.compile(r'[^a-z0-9]+')
+
+
+def normalizar_nombre(nombre):
+    """Clave de comparación: sin acentos, minúsculas, sin puntuación ni palabras societarias"""
+    texto = unicodedata.normalize('NFKD', nombre or '')
+    texto = ''.join(c for c in texto if not unicodedata.combining(c)).lower()
+    palabras = _NO_ALFANUMERICO.sub(' ', _UNIONES.sub('', texto)).split()
+    significativas = [palabra for palabra in palabras if palabra not in PALABRAS_IGNORADAS]
+    return ' '.join(significativas or palabras)
+
+
+class IndiceNombres:
+    """
+    Resuelve nombres libres a ids de un modelo de referencia por (deporte, nombre normalizado).
+
+    El índice se carga con una consulta por tabla (nombres canónicos y alias) y las
+    resoluciones posteriores son búsquedas en un diccionario; los nombres desconocidos
+    de un lote se crean juntos con un único bulk_create. Con deporte y nombres solo se
+    cargan esas claves, buscándolas por el índice único (guardados individuales).
+    """
+    modelo = None
+    modelo_alias = None
+    campo_alias = None
+
+    def __init__(self, deporte_id=None, nombres=None):
+        self.ids = {}
+        self.cargar(deporte_id, nombres)
+
+    def cargar(self, deporte_id=None, nombres=None):
+        canonicos, alias = self.modelo.objects.all(), self.modelo_alias.objects.all()
+        if nombres is not None:
+            normalizados = {normalizar_nombre(nombre) for nombre in nombres}
+            canonicos = canonicos.filter(deporte_id=deporte_id, nombre_normalizado__in=normalizados)
+            alias = alias.filter(deporte_id=deporte_id, alias__in=normalizados)
+        self.ids = {
+            (deporte_id, normalizado): pk
+            for pk, deporte_id, normalizado in canonicos.values_list('id', 'deporte_id', 'nombre_normalizado')
+        }
+        self.ids.update(
+            ((deporte_id, alias), pk)
+            for pk, deporte_id, alias in alias.values_list(self.campo_alias, 'deporte_id', 'alias')
+        )
+
+    def __len__(self):
+        return len(self.ids)
+
+    def resolver(self, deporte_id, nombre, **campos):
+        """Id del registro para un nombre (creándolo si no existe)"""
+        return self.resolver_lote([(deporte_id, nombre, campos)])[0]
+
+    def resolver_lote(self, filas):
+        """Ids para filas (deporte_id, nombre[, campos]) en orden; crea los desconocidos en bloque"""
+        claves = []
+        nuevos = {}
+        for fila in filas:
+            deporte_id, nombre = fila[0], fila[1]
+            clave = (deporte_id, normalizar_nombre(nombre))
+            claves.append(clave)
+            if clave not in self.ids and clave not in nuevos:
+                campos = fila[2] if len(fila) > 2 else {}
+                nuevos[clave] = self.modelo(
+                    deporte_id=deporte_id, nombre=nombre.strip(), nombre_normalizado=clave[1], **campos
+                )
+
+        if nuevos:
+            with transaction.atomic():
+                # Otro proceso puede haber creado alguno entretanto: se ignora y se relee
+                self.modelo.objects.bulk_create(nuevos.values(), ignore_conflicts=True)
+                for pk, deporte_id, normalizado in self.modelo.objects.filter(
+                    nombre_normalizado__in={normalizado for _, normalizado in nuevos}
+                ).values_list('id', 'deporte_id', 'nombre_normalizado'):
+                    self.ids.setdefault((deporte_id, normalizado), pk)
+
+        return [self.ids[clave] for clave in claves]
+
+    def registrar_alias(self, pk, deporte_id, alias):
+        """Asocia un nombre alternativo a un registro existente"""
+        normalizado = normalizar_nombre(alias)
+        self.modelo_alias.objects.update_or_create(
+            deporte_id=deporte_id, alias=normalizado, defaults={self.campo_alias: pk}
+        )
+        self.ids[(deporte_id, normalizado)] = pk
+
+
+class IndiceEquipos(IndiceNombres):
+    modelo = Equipo
+    modelo_alias = AliasEquipo
+    campo_alias = 'equipo_id'
+
+
+class IndiceCompeticiones(IndiceNombres):
+    modelo = Competicion
+    modelo_alias = AliasCompeticion
+    campo_alias = 'competicion_id'
+
+
+def vincular_eventos(eventos, equipos=None, competiciones=None):
+    """Rellena local, visitante y competicion de instancias Evento a partir de sus nombres"""
+    equipos = IndiceEquipos() if equipos is None else equipos
+    competiciones = IndiceCompeticiones() if competiciones is None else competiciones
+
+    locales = equipos.resolver_lote([(evento.deporte_id, evento.equipo_local) for evento in eventos])
+    visitantes = equipos.resolver_lote([(evento.deporte_id, evento.equipo_visitante) for evento in eventos])
+    con_liga = [evento for evento in eventos if evento.liga]
+    ligas = competiciones.resolver_lote([
+        (evento.deporte_id, evento.liga, {'pais': evento.pais}) for evento in con_liga
+    ])
+
+    for evento, local_id, visitante_id in zip(eventos, locales, visitantes):
+        evento.local_id = local_id
+        evento.visitante_id = visitante_id
+    for evento in eventos:
+        evento.competicion_id = None
+    for evento, competicion_id in zip(con_liga, ligas):
+        evento.competicion_id = competicion_id
+    return eventos
@@ -0,0 +1,160 @@
+"""
+Planificación de refrescos de cuotas según la cercanía al inicio del evento
+"""
+import heapq
+import random
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import timedelta
+
+
+# Niveles de prioridad: (nombre, horizonte hasta el inicio, intervalo de refresco en segundos)
+NIVELES_PRIORIDAD = [
+    ('inminente', timedelta(hours=1), 60),
+    ('hoy', timedelta(hours=24), 5 * 60),
+    ('semana', timedelta(days=7), 30 * 60),
+    ('lejano', None, 2 * 60 * 60),
+]
+# Desempate entre refrescos debidos a la vez (el arranque los encola todos para ya): primero los próximos
+PRIORIDAD = {nombre: posicion for posicion, (nombre, _, _) in enumerate(NIVELES_PRIORIDAD)}
+
+
+def clasificar_evento(fecha_evento, ahora):
+    """Retorna el nivel de prioridad y su intervalo según la distancia al inicio"""
+    distancia = fecha_evento - ahora
+    for nombre, horizonte, intervalo in NIVELES_PRIORIDAD:
+        if horizonte is None or distancia <= horizonte:
+            return nombre, intervalo
+    nombre, _, intervalo = NIVELES_PRIORIDAD[-1]
+    return nombre, intervalo
+
+
+@dataclass
+class EntradaPlanificada:
+    """Estado de refresco de un evento dentro del planificador"""
+    evento: object
+    nivel: str
+    intervalo: int
+    proximo: float
+    ultimo_refresco: float = None
+    en_cola_desde: float = field(default_factory=time.monotonic)
+
+
+class LimitadorTasa:
+    """Presupuesto global de refrescos por segundo (token bucket)"""
+
+    def __init__(self, tasa, capacidad=None, reloj=time.monotonic):
+        if not tasa > 0:
+            raise ValueError('La tasa debe ser positiva')
+        self.tasa = float(tasa)
+        self.capacidad = float(capacidad or max(1.0, self.tasa))
+        self.tokens = self.capacidad
+        self.reloj = reloj
+        self.ultimo = reloj()
+
+    def _recargar(self):
+        ahora = self.reloj()
+        self.tokens = min(self.capacidad, self.tokens + (ahora - self.ultimo) * self.tasa)
+        self.ultimo = ahora
+
+    def adquirir(self, parada=None):
+        """Espera hasta disponer de un token; retorna False si se pidió la parada"""
+        parada = parada or threading.Event()
+        while not parada.is_set():
+            self._recargar()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            parada.wait((1 - self.tokens) / self.tasa)
+        return False
+
+
+class PlanificadorRefresco:
+    """Cola de prioridad que programa el próximo refresco de cada evento"""
+
+    def __init__(self, jitter=0.1, reloj=time.monotonic, aleatorio=None):
+        self.jitter = jitter
+        self.reloj = reloj
+        self.aleatorio = aleatorio or random.Random()
+        self.entradas = {}
+        self.cola = []
+
+    def __len__(self):
+        return len(self.entradas)
+
+    def _con_jitter(self, intervalo):
+        return intervalo * (1 + self.aleatorio.uniform(-self.jitter, self.jitter))
+
+    def _encolar(self, entrada):
+        heapq.heappush(self.cola, (entrada.proximo, PRIORIDAD[entrada.nivel], entrada.evento.id))
+
+    def sincronizar(self, eventos, ahora_dt):
+        """Alinea la cola con el conjunto actual de eventos abiertos"""
+        ahora = self.reloj()
+        vigentes = set()
+        for evento in eventos:
+            vigentes.add(evento.id)
+            nivel, intervalo = clasificar_evento(evento.fecha_evento, ahora_dt)
+            entrada = self.entradas.get(evento.id)
+            if entrada is None:
+                # Los eventos nuevos se refrescan de inmediato
+                entrada = self.entradas[evento.id] = EntradaPlanificada(evento, nivel, intervalo, ahora)
+                self._encolar(entrada)
+                continue
+
+            entrada.evento = evento
+            subio = intervalo < entrada.intervalo
+            entrada.nivel, entrada.intervalo = nivel, intervalo
+            if subio:
+                # Subió de prioridad: adelantar el refresco si corresponde
+                base = entrada.ultimo_refresco or entrada.en_cola_desde
+                proximo = base + self._con_jitter(intervalo)
+                if proximo < entrada.proximo:
+                    entrada.proximo = proximo
+                    self._encolar(entrada)
+
+        for evento_id in set(self.entradas) - vigentes:
+            del self.entradas[evento_id]
+
+    def siguiente(self):
+        """Retorna (segundos_de_espera, entrada) del próximo evento a refrescar"""
+        while self.cola:
+            proximo, _, evento_id = self.cola[0]
+            entrada = self.entradas.get(evento_id)
+            if entrada is None or entrada.proximo != proximo:
+                # Entrada obsoleta (evento retirado o reprogramado)
+                heapq.heappop(self.cola)
+                continue
+            return max(0.0, proximo - self.reloj()), entrada
+        return None, None
+
+    def completar(self, entrada):
+        """Marca el refresco de la entrada y la reprograma según su nivel"""
+        ahora = self.reloj()
+        entrada.ultimo_refresco = ahora
+        entrada.proximo = ahora + self._con_jitter(entrada.intervalo)
+        self._encolar(entrada)
+
+    def metricas(self):
+        """Profundidad de cola y antigüedad de los datos por nivel de prioridad"""
+        ahora = self.reloj()
+        metricas = {
+            nombre: {'eventos': 0, 'pendientes': 0, 'antiguedad_max': 0.0, 'antiguedad_media': 0.0}
+            for nombre, _, _ in NIVELES_PRIORIDAD
+        }
+        for entrada in self.entradas.values():
+            nivel = metricas[entrada.nivel]
+            antiguedad = ahora - (entrada.ultimo_refresco or entrada.en_cola_desde)
+            nivel['eventos'] += 1
+            if entrada.proximo <= ahora:
+                nivel['pendientes'] += 1
+            nivel['antiguedad_max'] = max(nivel['antiguedad_max'], antiguedad)
+            nivel['antiguedad_media'] += antiguedad
+
+        for nivel in metricas.values():
+            if nivel['eventos']:
+                nivel['antiguedad_media'] /= nivel['eventos']
+            nivel['antiguedad_max'] = round(nivel['antiguedad_max'], 1)
+            nivel['antiguedad_media'] = round(nivel['antiguedad_media'], 1)
+        return metricas
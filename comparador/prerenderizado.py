@@ -0,0 +1,179 @@
+"""
+Pre-renderizado a disco (gzip) de las páginas más visitadas tras cada ciclo de actualización
+
+Cada ciclo escribe las páginas en un directorio temporal que después se publica de
+forma atómica con el nombre de la versión de datos que representa, y apunta a él el
+archivo `vigente`, reemplazado también de forma atómica, con la versión y su fecha.
+El middleware sirve el directorio apuntado mientras no caduque leyendo solo ese
+archivo, sin la base de datos: una escritura fuera de ciclo (admin, ingesta) tarda
+como mucho COMPARADOR_PRERENDER_VIGENCIA segundos en verse en estas páginas.
+"""
+import gzip
+import hashlib
+import os
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone as dt_timezone
+from inspect import iscoroutinefunction
+from pathlib import Path
+from urllib.parse import quote
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.db import close_old_connections
+from django.test import RequestFactory
+from django.urls import resolve, reverse
+from django.utils import timezone
+
+from .models import Evento
+from .referencias import obtener_referencias
+from .versiones import obtener_version
+
+PUNTERO = 'vigente'
+
+def directorio_raiz():
+    return Path(settings.COMPARADOR_PRERENDER_DIR)
+
+
+def nombre_archivo(ruta_completa):
+    """Nombre de archivo de longitud fija para una ruta con su query string, por larga que sea"""
+    return hashlib.sha256(ruta_completa.encode()).hexdigest() + '.html.gz'
+
+
+def publicacion(raiz):
+    """(version, fecha_actualizacion) del directorio apuntado, o None si aún no se ha publicado ninguno"""
+    try:
+        version, marca = (raiz / PUNTERO).read_text().split()
+        return int(version), datetime.fromtimestamp(float(marca), tz=dt_timezone.utc)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def version_publicada(raiz):
+    """Versión del directorio al que apunta el puntero, o None si aún no se ha publicado ninguno"""
+    publicada = publicacion(raiz)
+    return publicada and publicada[0]
+
+
+def apuntar(raiz, version, fecha):
+    """Reemplaza atómicamente el puntero para que señale el directorio de la versión"""
+    temporal = raiz / f'.{PUNTERO}-{os.getpid()}.tmp'
+    temporal.write_text(f'{version} {fecha.timestamp()}')
+    os.replace(temporal, raiz / PUNTERO)
+
+
+def archivo_vigente(ruta_completa):
+    """(archivo, version, fecha) de la ruta en el directorio publicado si no ha caducado, o None; sin la base de datos"""
+    raiz = directorio_raiz()
+    publicada = publicacion(raiz)
+    if publicada is None:
+        return None
+    directorio = raiz / str(publicada[0])
+    archivo = directorio / nombre_archivo(ruta_completa)
+    try:
+        # La fecha del directorio es la de su publicación
+        antiguedad = time.time() - directorio.stat().st_mtime
+    except FileNotFoundError:
+        return None
+    if antiguedad > settings.COMPARADOR_PRERENDER_VIGENCIA or not archivo.is_file():
+        return None
+    return (archivo, *publicada)
+
+
+def rutas_a_prerenderizar(eventos=None):
+    """Dashboard, mejores cuotas por tipo y detalle de los próximos eventos"""
+    eventos = settings.COMPARADOR_PRERENDER_EVENTOS if eventos is None else eventos
+    rutas = [reverse('comparador:index'), reverse('comparador:mejores_cuotas')]
+    rutas += [
+        f"{reverse('comparador:mejores_cuotas')}?tipo={quote(tipo.codigo)}"
+        for tipo in obtener_referencias().tipos_cuota
+    ]
+    rutas += [
+        reverse('comparador:evento_detalle', args=[evento_id])
+        for evento_id in Evento.objects.filter(
+            finalizado=False, fecha_evento__gte=timezone.now()
+        ).order_by('fecha_evento').values_list('id', flat=True)[:eventos]
+    ]
+    return rutas
+
+
+def renderizar(ruta_completa):
+    """
+    Ejecuta la vista de una ruta como un visitante anónimo y retorna el HTML.
+
+    La petición no pasa por los middleware: las páginas se comparten entre todos los
+    usuarios, así que sus plantillas no pueden depender de sesión, mensajes ni CSRF.
+    """
+    request = RequestFactory().get(ruta_completa)
+    request.user = AnonymousUser()
+
+    coincidencia = resolve(request.path_info)
+    vista = coincidencia.func
+    if iscoroutinefunction(vista):
+        vista = async_to_sync(vista)
+    respuesta = vista(request, *coincidencia.args, **coincidencia.kwargs)
+    if respuesta.status_code != 200:
+        return None
+    return respuesta.content
+
+
+def _escribir(directorio, ruta_completa, nivel):
+    try:
+        contenido = renderizar(ruta_completa)
+        if contenido is None:
+            return 0
+        destino = directorio / nombre_archivo(ruta_completa)
+        temporal = destino.with_name(destino.name + '.tmp')
+        # mtime=0: mismo contenido, mismos bytes
+        temporal.write_bytes(gzip.compress(contenido, compresslevel=nivel, mtime=0))
+        os.replace(temporal, destino)
+        return len(contenido)
+    finally:
+        close_old_connections()
+
+
+def prerenderizar(rutas=None, hilos=4, nivel=6):
+    """Renderiza las rutas en un pool de hilos y publica el resultado; retorna (version, paginas, bytes)"""
+    version, fecha = obtener_version()
+    rutas = rutas_a_prerenderizar() if rutas is None else rutas
+    raiz = directorio_raiz()
+    raiz.mkdir(parents=True, exist_ok=True)
+
+    temporal = raiz / f'.{version}-{os.getpid()}.tmp'
+    shutil.rmtree(temporal, ignore_errors=True)
+    temporal.mkdir()
+    try:
+        with ThreadPoolExecutor(max_workers=hilos) as pool:
+            tamanos = list(pool.map(lambda ruta: _escribir(temporal, ruta, nivel), rutas))
+        publicar(temporal, raiz / str(version))
+    finally:
+        shutil.rmtree(temporal, ignore_errors=True)
+
+    # Un ciclo más lento que el siguiente no vuelve a apuntar a una versión anterior
+    if (version_publicada(raiz) or 0) <= version:
+        apuntar(raiz, version, fecha)
+    limpiar(raiz, conservar=version)
+    return version, sum(1 for tamano in tamanos if tamano), sum(tamanos)
+
+
+def publicar(temporal, destino):
+    """Sustituye atómicamente el directorio de una versión por el recién generado"""
+    if destino.exists():
+        # rename() no sustituye directorios con contenido: se aparta el anterior primero
+        anterior = destino.with_name(f'.{destino.name}-{os.getpid()}.old')
+        os.rename(destino, anterior)
+        os.rename(temporal, destino)
+        shutil.rmtree(anterior, ignore_errors=True)
+    else:
+        os.rename(temporal, destino)
+
+
+def limpiar(raiz, conservar):
+    """Elimina los directorios de versiones anteriores salvo el apuntado (las peticiones en curso ya abrieron su archivo)"""
+    apuntada = version_publicada(raiz)
+    for directorio in raiz.iterdir():
+        if (directorio.is_dir() and directorio.name.isdigit() and int(directorio.name) < conservar
+                and int(directorio.name) != apuntada):
+            shutil.rmtree(directorio, ignore_errors=True)
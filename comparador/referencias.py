@@ -0,0 +1,109 @@
+"""
+Caché en dos niveles de los datos de referencia (deportes, tipos de cuota y casas)
+
+Nivel 1: instantánea inmutable por proceso. Nivel 2: caché bajo una clave con la
+versión de referencias. Las señales de guardado y borrado incrementan esa versión en
+la base de datos, así que cada proceso ve los cambios hechos en los demás con una
+lectura por clave primaria, o sin ninguna si la petición ya trae la versión (la lee
+junto con la de datos al calcular su validador HTTP). Las filas creadas sin señales
+(bulk_create, SQL) no la incrementan: quien no encuentra un id o un nombre recarga la
+instantánea una vez.
+"""
+from dataclasses import dataclass
+from types import MappingProxyType
+
+from django.core.cache import cache
+
+from .models import CLAVE_REFERENCIAS, CasaApuestas, Deporte, TipoCuota
+from .versiones import obtener_version
+
+_instantanea = None
+
+
+@dataclass(frozen=True)
+class Referencias:
+    """Instantánea compartida entre peticiones: sus objetos no deben modificarse"""
+    version: int
+    deportes: tuple
+    tipos_cuota: tuple
+    casas: tuple
+    casas_activas: tuple
+    deportes_por_slug: MappingProxyType
+    tipos_por_codigo: MappingProxyType
+    tipos_por_id: MappingProxyType
+    casas_por_nombre: MappingProxyType
+    casas_por_id: MappingProxyType
+
+    def deporte(self, slug):
+        return self.deportes_por_slug.get(slug)
+
+    def tipo_cuota(self, codigo):
+        return self.tipos_por_codigo.get(codigo)
+
+
+def construir_referencias(version, deportes, tipos_cuota, casas):
+    """Instantánea con sus índices de búsqueda a partir de las filas de cada tabla"""
+    return Referencias(
+        version=version,
+        deportes=deportes,
+        tipos_cuota=tipos_cuota,
+        casas=casas,
+        casas_activas=tuple(casa for casa in casas if casa.activa),
+        deportes_por_slug=MappingProxyType({deporte.slug: deporte for deporte in deportes}),
+        tipos_por_codigo=MappingProxyType({tipo.codigo: tipo for tipo in tipos_cuota}),
+        tipos_por_id=MappingProxyType({tipo.id: tipo for tipo in tipos_cuota}),
+        casas_por_nombre=MappingProxyType({casa.nombre: casa for casa in casas}),
+        casas_por_id=MappingProxyType({casa.id: casa for casa in casas}),
+    )
+
+
+def obtener_referencias(version=None):
+    """
+    Instantánea vigente: del proceso, de la caché compartida o, si ambas caducaron, de la base de datos.
+
+    Sin `version` (la de version_referencias_peticion() en las vistas), cuesta una
+    lectura por clave primaria de VersionDatos aunque la instantánea esté en memoria.
+    """
+    global _instantanea
+    if version is None:
+        version, _ = obtener_version(CLAVE_REFERENCIAS)
+    instantanea = _instantanea
+    if instantanea is not None and instantanea.version == version:
+        return instantanea
+
+    # La caché guarda solo las filas; los índices se reconstruyen en cada proceso
+    filas = cache.get(_clave(version))
+    if filas is None:
+        filas = _leer_filas()
+        cache.set(_clave(version), filas, timeout=None)
+    _instantanea = instantanea = construir_referencias(version, *filas)
+    return instantanea
+
+
+def recargar_referencias():
+    """Instantánea leída de la base de datos aunque su versión no haya cambiado"""
+    global _instantanea
+    version, _ = obtener_version(CLAVE_REFERENCIAS)
+    filas = _leer_filas()
+    cache.set(_clave(version), filas, timeout=None)
+    _instantanea = instantanea = construir_referencias(version, *filas)
+    return instantanea
+
+
+def referencias_con(casas_ids=(), tipos_ids=()):
+    """Instantánea vigente, recargada una vez si le falta alguna de las casas o tipos indicados"""
+    referencias = obtener_referencias()
+    if any(casa_id not in referencias.casas_por_id for casa_id in casas_ids) or any(
+        tipo_id not in referencias.tipos_por_id for tipo_id in tipos_ids
+    ):
+        referencias = recargar_referencias()
+    return referencias
+
+
+def _clave(version):
+    return f'comparador:referencias:{version}'
+
+
+def _leer_filas():
+    # Una consulta por tabla
+    return tuple(Deporte.objects.all()), tuple(TipoCuota.objects.all()), tuple(CasaApuestas.objects.all())
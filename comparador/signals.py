@@ -0,0 +1,83 @@
+"""
+Invalidación de las versiones de datos y de referencias ante escrituras individuales
+sobre los modelos publicados, y vinculación de los eventos guardados uno a uno con sus equipos y competición
+"""
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .cambios import compactar
+from .models import AliasCompeticion, AliasEquipo, CasaApuestas, Competicion, Cuota, Deporte, Equipo, Evento, TipoCuota
+from .normalizacion import IndiceCompeticiones, IndiceEquipos, normalizar_nombre, vincular_eventos
+from .referencias import CLAVE_REFERENCIAS
+from .versiones import incrementar_version
+
+
+# Sin receptores de borrado en Cuota: los borrados en cascada desde eventos, casas y
+# tipos la eliminan con un solo DELETE, sin cargar sus filas. El borrado del padre
+# cubre el de sus cuotas; los borrados directos de cuotas (admin) lo aplican aparte.
+@receiver(post_save, sender=Cuota)
+@receiver(post_save, sender=Evento)
+@receiver(post_delete, sender=Evento)
+@receiver(post_save, sender=CasaApuestas)
+@receiver(post_delete, sender=CasaApuestas)
+@receiver(post_save, sender=Deporte)
+@receiver(post_delete, sender=Deporte)
+@receiver(post_save, sender=TipoCuota)
+@receiver(post_delete, sender=TipoCuota)
+def invalidar_version_datos(sender, **kwargs):
+    incrementar_version()
+
+
+@receiver(post_save, sender=CasaApuestas)
+@receiver(post_delete, sender=CasaApuestas)
+@receiver(post_save, sender=Deporte)
+@receiver(post_delete, sender=Deporte)
+@receiver(post_save, sender=TipoCuota)
+@receiver(post_delete, sender=TipoCuota)
+def invalidar_referencias(sender, **kwargs):
+    incrementar_version(CLAVE_REFERENCIAS)
+
+
+# Los borrados de cuotas en cascada no quedan en el registro de cambios: uno por objeto
+# borrado (ya sin sus cuotas), no por cuota; un borrado de deporte llega por sus eventos
+@receiver(post_delete, sender=Evento)
+@receiver(post_delete, sender=CasaApuestas)
+@receiver(post_delete, sender=TipoCuota)
+def compactar_cambios(sender, **kwargs):
+    compactar()
+
+
+# Campos de texto de los que salen local, visitante y competición
+CAMPOS_VINCULADOS = ('deporte_id', 'equipo_local', 'equipo_visitante', 'liga')
+
+
+@receiver(pre_save, sender=Evento)
+def vincular_evento(sender, instance, raw=False, update_fields=None, **kwargs):
+    # Las altas masivas llaman a vincular_eventos con índices compartidos; aquí solo
+    # se cubren los guardados individuales (admin, scripts) que no traen referencias
+    # o que cambian los nombres de un evento ya vinculado
+    if raw or (update_fields is not None and not {*CAMPOS_VINCULADOS, 'deporte'} & set(update_fields)):
+        return
+    vinculado = instance.local_id and instance.visitante_id and (instance.competicion_id or not instance.liga)
+    if vinculado:
+        anterior = Evento.objects.filter(pk=instance.pk).values(*CAMPOS_VINCULADOS).first() if instance.pk else None
+        if anterior is None or all(anterior[campo] == getattr(instance, campo) for campo in CAMPOS_VINCULADOS):
+            return
+    # Solo los nombres del evento, por el índice único: nunca la tabla completa
+    vincular_eventos(
+        [instance],
+        IndiceEquipos(instance.deporte_id, [instance.equipo_local, instance.equipo_visitante]),
+        IndiceCompeticiones(instance.deporte_id, [instance.liga] if instance.liga else []),
+    )
+
+
+@receiver(pre_save, sender=Equipo)
+@receiver(pre_save, sender=Competicion)
+def normalizar_referencia(sender, instance, **kwargs):
+    instance.nombre_normalizado = normalizar_nombre(instance.nombre)
+
+
+@receiver(pre_save, sender=AliasEquipo)
+@receiver(pre_save, sender=AliasCompeticion)
+def normalizar_alias(sender, instance, **kwargs):
+    instance.alias = normalizar_nombre(instance.alias)
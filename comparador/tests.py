@@ -1,3 +1,468 @@
-from django.test import TestCase
+import difflib
+import io
+import json
+import random
+import re
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.db.backends.utils import CursorWrapper
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from comparador import referencias
+from comparador.cambios import CLAVE_COMPACTACION, compactar
+from comparador.models import CLAVE_CAMBIOS, CasaApuestas, Cuota, Deporte, Evento, TipoCuota, VersionDatos
+from comparador.normalizacion import vincular_eventos
+from comparador.planificador import LimitadorTasa, PlanificadorRefresco
+from comparador.referencias import CLAVE_REFERENCIAS
+from comparador.versiones import CLAVE_DATOS
+
+# Recorrido completo de una tabla grande (con o sin índice): lo que un plan caliente no debe hacer
+RECORRIDO_COMPLETO = re.compile(r'\bSCAN (comparador_evento|comparador_cuota)\b')
+NUMEROS = re.compile(r'\d+(, \d+)*')
+VALORES = re.compile(r'VALUES .*?( RETURNING|$)')
+VARIAS_FILAS = re.compile(r'VALUES \(.*?\), \(')
+
+
+def crear_datos(eventos, casas=3):
+    """Eventos abiertos con cuotas 1X2 de varias casas, más algunos finalizados (acumulable)"""
+    futbol, _ = Deporte.objects.get_or_create(slug='futbol', defaults={'nombre': 'Fútbol'})
+    tipo, _ = TipoCuota.objects.get_or_create(codigo='1x2', defaults={'nombre': '1X2'})
+    lista_casas = [
+        CasaApuestas.objects.get_or_create(nombre=f'Casa {i}', defaults={'url': f'https://casa{i}.example.com'})[0]
+        for i in range(casas)
+    ]
+    ahora = timezone.now()
+    existentes = Evento.objects.count()
+    lista_eventos = [
+        Evento(
+            deporte=futbol, equipo_local=f'Local {i}', equipo_visitante=f'Visitante {i}', liga='Liga',
+            fecha_evento=ahora + timedelta(hours=i + 1), finalizado=i % 5 == 4,
+        )
+        for i in range(existentes, existentes + eventos)
+    ]
+    # bulk_create no emite pre_save: equipos y competición se vinculan aquí
+    vincular_eventos(lista_eventos)
+    lista_eventos = Evento.objects.bulk_create(lista_eventos)
+    Cuota.objects.bulk_create([
+        Cuota(evento=evento, casa_apuestas=casa, tipo_cuota=tipo, opcion=opcion, valor=1.5 + j * 0.1 + k)
+        for evento in lista_eventos
+        for j, casa in enumerate(lista_casas)
+        for k, opcion in enumerate(['1', 'X', '2'])
+    ])
+    return lista_eventos
+
+
+class PruebaConDatos(TestCase):
+    eventos = 10
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.lista_eventos = crear_datos(cls.eventos)
+
+    def setUp(self):
+        # La caché y la instantánea de referencias sobreviven al rollback entre pruebas
+        cache.clear()
+        referencias._instantanea = None
+
+
+@override_settings(COMPARADOR_CONSULTAS_PARALELAS=False)
+class PlanesConsultaTests(PruebaConDatos):
+    """Las consultas calientes deben resolverse con búsquedas por índice, nunca recorriendo tablas"""
+
+    def planes(self, consultas):
+        planes = {}
+        with connection.cursor() as cursor:
+            for consulta in consultas:
+                sql = consulta['sql']
+                if not sql.startswith('SELECT'):
+                    continue
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+                planes[sql] = [fila[-1] for fila in cursor.fetchall()]
+        return planes
+
+    def assertSinRecorridos(self, consultas):
+        for sql, plan in self.planes(consultas).items():
+            recorridos = [paso for paso in plan if RECORRIDO_COMPLETO.search(paso)]
+            self.assertFalse(recorridos, f'Recorrido completo en:\n{sql}\nPlan:\n' + '\n'.join(plan))
+
+    def capturar_vista(self, url):
+        with CaptureQueriesContext(connection) as consultas:
+            respuesta = self.client.get(url)
+        self.assertEqual(respuesta.status_code, 200)
+        return consultas.captured_queries
+
+    def test_vistas(self):
+        evento = self.lista_eventos[0]
+        urls = [
+            '/',
+            f'/evento/{evento.id}/',
+            '/deporte/futbol/',
+            '/mejores-cuotas/?tipo=1x2',
+            '/buscar/?q=local',
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertSinRecorridos(self.capturar_vista(url))
+
+    def test_mejores_cuotas_usa_indice_de_mejor_precio(self):
+        planes = self.planes(self.capturar_vista('/mejores-cuotas/?tipo=1x2'))
+        self.assertTrue(any('cuota_mejor_precio_idx' in paso for plan in planes.values() for paso in plan))
+
+    def test_eventos_abiertos_usan_indice_parcial(self):
+        planes = self.planes(self.capturar_vista('/'))
+        self.assertTrue(any('evento_abierto_fecha_idx' in paso for plan in planes.values() for paso in plan))
+
+    def test_admin_eventos_usa_indice_de_fecha(self):
+        # Orden por fecha, filtro de estado y jerarquía de fechas sobre todos los eventos, no solo los abiertos
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'clave'))
+        for url in ['/admin/comparador/evento/', '/admin/comparador/evento/?finalizado__exact=1']:
+            with self.subTest(url=url):
+                for sql, plan in self.planes(self.capturar_vista(url)).items():
+                    if 'comparador_evento' in sql and 'MAX(rowid)' not in sql:
+                        self.assertTrue(any('evento_fecha_idx' in paso for paso in plan), f'{sql}\nPlan:\n' + '\n'.join(plan))
+                        self.assertFalse(any('TEMP B-TREE FOR ORDER BY' in paso for paso in plan), sql)
+
+    def test_admin_busqueda_por_prefijo_usa_indices(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'clave'))
+        planes = self.planes(self.capturar_vista('/admin/comparador/evento/?q=local'))
+        for indice in ('evento_local_busqueda_idx', 'evento_visitante_busqueda_idx'):
+            self.assertTrue(any(indice in paso for plan in planes.values() for paso in plan), indice)
+
+    def test_actualizar_cuotas(self):
+        with CaptureQueriesContext(connection) as consultas:
+            call_command('actualizar_cuotas', stdout=io.StringIO())
+        # Solo las consultas del ciclo de refresco sobre eventos y cuotas
+        calientes = [
+            consulta for consulta in consultas.captured_queries
+            if 'comparador_margenmercado' not in consulta['sql']
+        ]
+        self.assertSinRecorridos(calientes)
+
+
+def rondas(consultas):
+    """
+    SQL normalizado de cada consulta, sin literales (ids, fechas, savepoints).
+
+    Cuentan todas, lecturas y escrituras: un INSERT/UPDATE por fila es un N+1 igual que
+    una lectura por fila. Solo se agrupan los lotes de bulk_create: tras un INSERT de
+    varias filas, las repeticiones seguidas de la misma sentencia son el resto del lote
+    (el motor limita los parámetros por sentencia), no una consulta por fila.
+    """
+    resultado = []
+    en_lote = False
+    for consulta in consultas:
+        sql = NUMEROS.sub('N', VALORES.sub(r'VALUES (...)\1', consulta['sql']))
+        if en_lote and sql == resultado[-1]:
+            continue
+        en_lote = VARIAS_FILAS.search(consulta['sql']) is not None
+        resultado.append(sql)
+    return resultado
+
+
+class EjecutorEnLinea:
+    """Sustituto de ThreadPoolExecutor que ejecuta cada tarea en el hilo que la pide"""
+
+    def __init__(self, max_workers=None):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def map(self, funcion, *iterables):
+        return map(funcion, *iterables)
+
+
+@contextmanager
+def contar_filas():
+    """Cuenta las filas leídas de la base de datos por cualquier cursor (ORM o SQL directo)"""
+    contador = {'filas': 0}
+
+    def fetchone(self):
+        fila = self.cursor.fetchone()
+        contador['filas'] += fila is not None
+        return fila
+
+    def fetchmany(self, *args, **kwargs):
+        filas = self.cursor.fetchmany(*args, **kwargs)
+        contador['filas'] += len(filas)
+        return filas
+
+    def fetchall(self):
+        filas = self.cursor.fetchall()
+        contador['filas'] += len(filas)
+        return filas
+
+    def iterar(self):
+        for fila in self.cursor:
+            contador['filas'] += 1
+            yield fila
+
+    # CursorWrapper delega fetch* con __getattr__: los atributos de clase tienen prioridad
+    with mock.patch.object(CursorWrapper, 'fetchone', fetchone, create=True), \
+            mock.patch.object(CursorWrapper, 'fetchmany', fetchmany, create=True), \
+            mock.patch.object(CursorWrapper, 'fetchall', fetchall, create=True), \
+            mock.patch.object(CursorWrapper, '__iter__', iterar):
+        yield contador
+
+
+@override_settings(COMPARADOR_CONSULTAS_PARALELAS=False, COMPARADOR_TOKEN_INGESTA='prueba')
+class PresupuestoConsultasTests(PruebaConDatos):
+    """
+    Las consultas de cada vista y comando no dependen del tamaño de los datos.
+
+    Cada prueba mide con el conjunto pequeño, amplía los datos hasta el grande y vuelve
+    a medir: el número de consultas debe coincidir y las filas leídas y el tiempo deben
+    quedar por debajo de su cota. Los fallos muestran el SQL ejecutado. Entre ambos
+    conjuntos hay veinte veces más eventos, así que un patrón por fila no pasa inadvertido.
+    """
+    eventos = 10
+    eventos_ampliados = 200
+    segundos_maximos = 2.0
+
+    # Cota de filas leídas con el conjunto grande: páginas limitadas o ligadas a un evento
+    # (las vistas que recorren todos los eventos abiertos quedan fuera)
+    vistas = {
+        'index': ('/', 100),
+        'evento_detalle': (None, 30),
+        'comparacion': (None, 150),
+        'buscar': ('/buscar/?q=local', 100),
+        'casas_apuestas': ('/casas-apuestas/', 20),
+        'cambios': ('/api/cambios/?desde=0&limite=50', 60),
+    }
+    # Vistas que recorren todos los eventos abiertos: mismo número de consultas y como
+    # mucho tantas filas por evento (cada evento de crear_datos tiene 9 cuotas)
+    vistas_agregadas = {
+        'eventos_por_deporte': ('/deporte/futbol/', 1),
+        'mejores_cuotas': ('/mejores-cuotas/?tipo=1x2', 4),
+        'apuestas_valor': ('/apuestas-valor/', 9),
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        # Los contadores se crean en su primer uso: que ninguna medición pague ese alta
+        for clave in (CLAVE_DATOS, CLAVE_REFERENCIAS, CLAVE_CAMBIOS, CLAVE_COMPACTACION):
+            VersionDatos.objects.get_or_create(clave=clave)
+
+    def setUp(self):
+        super().setUp()
+        random.seed(0)
+        temporal = tempfile.TemporaryDirectory()
+        self.addCleanup(temporal.cleanup)
+        self.directorio = Path(temporal.name)
+
+    def medir(self, ejecutar):
+        """(consultas, filas leídas, segundos) de una ejecución con las cachés vacías"""
+        cache.clear()
+        referencias._instantanea = None
+        with CaptureQueriesContext(connection) as consultas, contar_filas() as filas:
+            inicio = time.perf_counter()
+            ejecutar()
+            segundos = time.perf_counter() - inicio
+        return consultas.captured_queries, filas['filas'], segundos
+
+    def get(self, url):
+        def ejecutar():
+            respuesta = self.client.get(url)
+            self.assertEqual(respuesta.status_code, 200, url)
+        return ejecutar
+
+    def ampliar(self):
+        crear_datos(self.eventos_ampliados - self.eventos)
+
+    def assertPresupuesto(self, nombre, pequeno, grande, filas_maximas=None):
+        consultas, filas, segundos = grande
+        listado = '\n'.join(f'  {consulta["sql"][:300]}' for consulta in consultas)
+        antes, despues = rondas(pequeno[0]), rondas(consultas)
+        diferencias = '\n'.join(linea[:300] for linea in difflib.unified_diff(
+            antes, despues, f'{self.eventos} eventos', f'{self.eventos_ampliados} eventos', lineterm='', n=0,
+        ))
+        self.assertEqual(
+            len(antes), len(despues),
+            f'{nombre}: {len(antes)} consultas con {self.eventos} eventos y {len(despues)} '
+            f'con {self.eventos_ampliados}:\n{diferencias}'
+        )
+        if filas_maximas is not None:
+            self.assertLessEqual(filas, filas_maximas, f'{nombre}: {filas} filas leídas:\n{listado}')
+        self.assertLessEqual(segundos, self.segundos_maximos, f'{nombre}: {segundos:.2f}s:\n{listado}')
+
+    def test_vistas(self):
+        urls = {nombre: url for nombre, (url, _) in self.vistas.items()}
+        urls['evento_detalle'] = f'/evento/{self.lista_eventos[0].id}/'
+        urls['comparacion'] = '/api/comparacion/?eventos=' + ','.join(str(evento.id) for evento in self.lista_eventos)
+        urls.update((nombre, url) for nombre, (url, _) in self.vistas_agregadas.items())
+        pequeno = {nombre: self.medir(self.get(url)) for nombre, url in urls.items()}
+        self.ampliar()
+        for nombre, url in urls.items():
+            with self.subTest(vista=nombre):
+                if nombre in self.vistas:
+                    filas_maximas = self.vistas[nombre][1]
+                else:
+                    filas_maximas = self.vistas_agregadas[nombre][1] * self.eventos_ampliados
+                self.assertPresupuesto(nombre, pequeno[nombre], self.medir(self.get(url)), filas_maximas)
+
+    def test_comparacion_desde_cache(self):
+        url = '/api/comparacion/?tipos=1x2&eventos=' + ','.join(str(evento.id) for evento in self.lista_eventos)
+        esperado = self.client.get(url).json()
+        # Con las comparaciones ya en caché, la lista completa solo lee la versión de datos
+        with self.assertNumQueries(1):
+            respuesta = self.client.get(url)
+        self.assertEqual(respuesta.json(), esperado)
+        self.assertEqual([evento['id'] for evento in esperado['eventos']], [evento.id for evento in self.lista_eventos])
+
+    def test_ingesta(self):
+        def ingesta(eventos, valor):
+            # Un valor nuevo en cada medición: todas las cuotas se escriben, no solo las nuevas
+            cuerpo = '\n'.join(
+                json.dumps({'evento': evento.id, 'casa': 'Casa 0', 'tipo': '1x2', 'opcion': '1', 'valor': valor})
+                for evento in eventos
+            )
+
+            def ejecutar():
+                respuesta = self.client.post(
+                    '/api/cuotas/', cuerpo, content_type='application/x-ndjson',
+                    headers={'authorization': 'Bearer prueba'},
+                )
+                self.assertEqual(respuesta.status_code, 200)
+            return ejecutar
+
+        pequeno = self.medir(ingesta(self.lista_eventos, 3.5))
+        self.ampliar()
+        self.assertPresupuesto('ingesta', pequeno, self.medir(ingesta(Evento.objects.all(), 4.5)))
+
+    def test_comandos(self):
+        instantanea = str(self.directorio / 'instantanea.npz')
+        # En orden: importar_cuotas carga la instantánea recién exportada
+        comandos = {
+            'actualizar_cuotas': ([], {'dias': 30}),
+            'calcular_margenes': ([], {}),
+            'recalcular_estadisticas': ([], {}),
+            'exportar_cuotas': ([instantanea], {}),
+            'importar_cuotas': ([instantanea], {}),
+            # Número fijo de páginas de detalle: más eventos no deben encarecer cada página
+            'prerenderizar': ([], {'eventos': 5}),
+        }
+
+        def ejecutar(nombre):
+            argumentos, opciones = comandos[nombre]
+            return lambda: call_command(nombre, *argumentos, stdout=io.StringIO(), **opciones)
+
+        # Los hilos del pool usarían otras conexiones: ni se capturarían sus consultas ni
+        # verían los datos de la transacción de la prueba
+        with self.settings(COMPARADOR_PRERENDER_DIR=self.directorio / 'prerenderizado'), \
+                mock.patch('comparador.prerenderizado.ThreadPoolExecutor', EjecutorEnLinea), \
+                mock.patch('comparador.prerenderizado.close_old_connections'):
+            pequeno = {nombre: self.medir(ejecutar(nombre)) for nombre in comandos}
+            self.ampliar()
+            for nombre in comandos:
+                with self.subTest(comando=nombre):
+                    self.assertPresupuesto(nombre, pequeno[nombre], self.medir(ejecutar(nombre)))
+
+    def test_daemon(self):
+        refrescos = 5
+
+        def ejecutar():
+            # Mismos valores aleatorios en ambas mediciones: las cuotas que cambian, y con
+            # ellas las escrituras, son las mismas
+            random.seed(0)
+            # El limitador deja pasar un número fijo de refrescos y después detiene el bucle
+            with mock.patch.object(LimitadorTasa, 'adquirir', side_effect=[True] * refrescos + [False]), \
+                    mock.patch('signal.signal'):
+                call_command('actualizar_cuotas', daemon=True, dias=30, jitter=0, stdout=io.StringIO())
+
+        with self.settings(COMPARADOR_METRICAS_PLANIFICADOR=self.directorio / 'metricas.json'):
+            # Se deshace para que la segunda medición refresque los mismos eventos con los mismos valores
+            with transaction.atomic():
+                pequeno = self.medir(ejecutar)
+                transaction.set_rollback(True)
+            self.ampliar()
+            self.assertPresupuesto('actualizar_cuotas --daemon', pequeno, self.medir(ejecutar))
+            self.assertTrue((self.directorio / 'metricas.json').is_file())
+
+
+@override_settings(COMPARADOR_TOKEN_INGESTA='prueba')
+class IngestaTests(PruebaConDatos):
+    eventos = 1
+
+    def ingerir(self, cuerpo, content_type='application/x-ndjson'):
+        respuesta = self.client.post(
+            '/api/cuotas/', cuerpo, content_type=content_type, headers={'authorization': 'Bearer prueba'},
+        )
+        self.assertEqual(respuesta.status_code, 200)
+        return respuesta.json()
+
+    def registro(self, **campos):
+        return {'evento': self.lista_eventos[0].id, 'casa': 'Casa 0', 'tipo': '1x2', 'opcion': '1', 'valor': 2.5, **campos}
+
+    def test_valores_no_finitos(self):
+        # NaN de JSON y como texto; infinito de JSON
+        cuerpo = '\n'.join(
+            [json.dumps(self.registro(valor=valor)) for valor in ['NaN', float('nan'), float('inf')]]
+            + [json.dumps(self.registro())]
+        )
+        resultado = self.ingerir(cuerpo)
+        self.assertEqual(resultado['lotes'][0]['motivos'], {'valor_invalido': 3})
+        self.assertEqual(resultado['escritas'], 1)
+
+    def test_identificadores_no_escalares(self):
+        registros = [
+            self.registro(casa=[1]), self.registro(casa={'id': 1}), self.registro(casa=True),
+            self.registro(tipo=[1]), self.registro(tipo={'codigo': '1x2'}),
+        ]
+        resultado = self.ingerir(json.dumps(registros), content_type='application/json')
+        self.assertEqual(resultado['lotes'][0]['motivos'], {'casa_invalida': 3, 'tipo_invalido': 2})
+        self.assertEqual(resultado['escritas'], 0)
+
+
+class PlanificadorTests(SimpleTestCase):
+    def test_arranque_por_nivel(self):
+        # Al arrancar todos los eventos se deben a la vez: primero los más próximos, no los de menor id
+        ahora = timezone.now()
+        planificador = PlanificadorRefresco()
+        planificador.sincronizar([
+            Evento(id=1, fecha_evento=ahora + timedelta(days=10)),
+            Evento(id=2, fecha_evento=ahora + timedelta(minutes=20)),
+            Evento(id=3, fecha_evento=ahora + timedelta(hours=5)),
+        ], ahora)
+        orden = []
+        while (entrada := planificador.siguiente()[1]) is not None:
+            orden.append(entrada.evento.id)
+            del planificador.entradas[entrada.evento.id]
+        self.assertEqual(orden, [2, 3, 1])
+
+    def test_tasa_positiva(self):
+        with self.assertRaises(ValueError):
+            LimitadorTasa(0)
+
+
+class CambiosTests(PruebaConDatos):
+    eventos = 1
+
+    def test_resincronizacion_tras_borrado(self):
+        # bulk_create no numera: cada cuota se guarda una vez para recibir su secuencia
+        for cuota in Cuota.objects.order_by('id'):
+            cuota.save()
+        anterior = cuota.secuencia
+        Cuota.objects.exclude(pk=cuota.pk).first().delete()
+        compactar()
+
+        # Anterior al borrado: 410 para resincronizar
+        self.assertEqual(self.client.get(f'/api/cambios/?desde={anterior}').status_code, 410)
+        # Desde 0: la tabla completa de cuotas vigentes, sin la borrada
+        respuesta = self.client.get('/api/cambios/?desde=0')
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(len(respuesta.json()['cambios']), Cuota.objects.count())
@@ -9,5 +9,9 @@ urlpatterns = [
     path('deporte/<slug:deporte_slug>/', views.eventos_por_deporte, name='eventos_por_deporte'),
     path('mejores-cuotas/', views.mejores_cuotas, name='mejores_cuotas'),
     path('buscar/', views.buscar, name='buscar'),
+    path('apuestas-valor/', views.apuestas_valor, name='apuestas_valor'),
+    path('api/cuotas/', views.ingesta_cuotas, name='ingesta_cuotas'),
+    path('api/cambios/', views.cambios_cuotas, name='cambios_cuotas'),
+    path('api/comparacion/', views.comparacion_eventos, name='comparacion_eventos'),
     path('casas-apuestas/', views.casas_apuestas, name='casas_apuestas'),
 ]
@@ -0,0 +1,165 @@
+"""
+Versión global de los datos y validadores HTTP (ETag/Last-Modified) derivados de ella
+"""
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone as dt_timezone
+from functools import wraps
+from inspect import iscoroutinefunction
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+from django.views.decorators.http import condition
+
+from .models import CLAVE_REFERENCIAS, VersionDatos
+
+CLAVE_DATOS = 'datos'
+
+_local = threading.local()
+
+
+def obtener_version(clave=CLAVE_DATOS):
+    """
+    Retorna (version, fecha_actualizacion) con una lectura por clave primaria.
+
+    No se cachea: la caché por defecto es local a cada proceso y las escrituras llegan
+    desde otros (actualizar_cuotas, ingesta, admin), así que una copia local serviría
+    validadores y claves de caché obsoletos sin nada que la invalide.
+    """
+    valor = VersionDatos.objects.filter(clave=clave).values_list('version', 'fecha_actualizacion').first()
+    if valor is None:
+        registro, _ = VersionDatos.objects.get_or_create(clave=clave)
+        valor = (registro.version, registro.fecha_actualizacion)
+    return valor
+
+
+def incrementar_version(clave=CLAVE_DATOS):
+    """Incrementa la versión; dentro de lote_escritura() se difiere hasta el final del lote"""
+    pendientes = getattr(_local, 'pendientes', None)
+    if pendientes is not None:
+        pendientes.add(clave)
+        return
+
+    ahora = timezone.now()
+    actualizados = VersionDatos.objects.filter(clave=clave).update(
+        version=F('version') + 1,
+        fecha_actualizacion=ahora,
+    )
+    if not actualizados:
+        VersionDatos.objects.get_or_create(clave=clave, defaults={'version': 1, 'fecha_actualizacion': ahora})
+
+
+def fijar_version(clave, version):
+    """Fija el valor de una clave usada como marca (no como contador)"""
+    VersionDatos.objects.update_or_create(
+        clave=clave, defaults={'version': version, 'fecha_actualizacion': timezone.now()}
+    )
+
+
+def diferir(funcion):
+    """Dentro de lote_escritura() aplaza la función hasta el final del lote (una vez); fuera, la ejecuta ya"""
+    pendientes = getattr(_local, 'pendientes', None)
+    if pendientes is None:
+        funcion()
+    else:
+        pendientes.add(funcion)
+
+
+@contextmanager
+def lote_escritura():
+    """Agrupa todas las escrituras del bloque en un único incremento de versión"""
+    if getattr(_local, 'pendientes', None) is not None:
+        # Lote anidado: el lote externo aplica el incremento
+        yield
+        return
+
+    _local.pendientes = set()
+    try:
+        yield
+    finally:
+        pendientes, _local.pendientes = _local.pendientes, None
+        for pendiente in pendientes:
+            # Claves de versión o funciones aplazadas con diferir()
+            pendiente() if callable(pendiente) else incrementar_version(pendiente)
+
+
+def _inicio_ventana():
+    """
+    Inicio de la ventana temporal vigente.
+
+    Las vistas filtran por fecha_evento >= ahora, así que su contenido cambia con
+    el tiempo aunque los datos no cambien; la ventana acota cuánto vale un validador.
+    """
+    ventana = settings.COMPARADOR_VENTANA_VALIDADOR
+    return int(time.time() // ventana * ventana)
+
+
+def _validador(request):
+    # Se calcula una vez por petición aunque lo pidan ambas funciones del decorador; la
+    # versión de referencias llega en la misma consulta para que las vistas no la relean
+    if not hasattr(request, '_validador_datos'):
+        versiones = {
+            clave: (version, fecha)
+            for clave, version, fecha in VersionDatos.objects.filter(
+                clave__in=[CLAVE_DATOS, CLAVE_REFERENCIAS]
+            ).values_list('clave', 'version', 'fecha_actualizacion')
+        }
+        version, fecha = versiones.get(CLAVE_DATOS) or obtener_version()
+        request._validador_datos = (version, fecha, _inicio_ventana())
+        request._version_referencias = versiones.get(CLAVE_REFERENCIAS, (None,))[0]
+    return request._validador_datos
+
+
+def version_peticion(request):
+    """(version, fecha_actualizacion) leída una sola vez por petición, la misma del validador HTTP"""
+    version, fecha, _ = _validador(request)
+    return version, fecha
+
+
+def _etag(version, ventana):
+    return f'W/"{CLAVE_DATOS}-{version}-{ventana}"'
+
+
+def _ultima_modificacion(fecha, ventana):
+    return max(fecha, datetime.fromtimestamp(ventana, tz=dt_timezone.utc))
+
+
+def validadores_version(version, fecha):
+    """(ETag, Last-Modified) de una versión ya conocida, sin leer la base de datos"""
+    ventana = _inicio_ventana()
+    return _etag(version, ventana), _ultima_modificacion(fecha, ventana)
+
+
+def version_referencias_peticion(request):
+    """Versión de referencias leída con el validador HTTP, o None si aún no existe"""
+    _validador(request)
+    return request._version_referencias
+
+
+def etag_datos(request, *args, **kwargs):
+    version, _, ventana = _validador(request)
+    return _etag(version, ventana)
+
+
+def ultima_modificacion_datos(request, *args, **kwargs):
+    _, fecha, ventana = _validador(request)
+    return _ultima_modificacion(fecha, ventana)
+
+
+def condicional(vista):
+    """Decorador para vistas (síncronas o async) cuyo contenido depende de la versión global"""
+    vista_condicional = condition(etag_func=etag_datos, last_modified_func=ultima_modificacion_datos)(vista)
+    if not iscoroutinefunction(vista):
+        return vista_condicional
+
+    @wraps(vista)
+    async def envoltura(request, *args, **kwargs):
+        # condition() llama a las funciones de validación de forma síncrona: en una vista
+        # async se precalcula aquí el validador, que puede requerir la base de datos
+        await sync_to_async(_validador)(request)
+        return await vista_condicional(request, *args, **kwargs)
+
+    return envoltura
@@ -1,44 +1,96 @@
-from django.shortcuts import render, get_object_or_404
-from django.db.models import Q, Min, Max, Count
+import asyncio
+import hmac
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from django.http import Http404, JsonResponse
+from django.shortcuts import render
+from django.db.models import Q, Min, Max, Count, F, Window
+from django.db.models.functions import RowNumber
 from django.utils import timezone
-from .models import Evento, Cuota, Deporte, CasaApuestas, TipoCuota
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+from .models import Evento, Cuota, CasaApuestas, EstadisticaMargen, Competicion, Equipo
+from .normalizacion import normalizar_nombre
+from .referencias import obtener_referencias
+from .cambios import ResincronizacionNecesaria, cambios_desde
+from .comparacion import obtener_comparaciones
+from .consenso import obtener_apuestas_valor
+from .ingesta import ingerir, leer_array_json, leer_ndjson
+from .versiones import condicional, version_peticion, version_referencias_peticion
+
+
+async def _en_paralelo(*consultas):
+    """
+    Ejecuta funciones de consulta independientes a la vez y retorna sus resultados.
+
+    Los métodos async del ORM pasan todos por el mismo hilo, así que no se solapan;
+    con COMPARADOR_CONSULTAS_PARALELAS cada consulta corre en su propio hilo y
+    conexión, y la latencia total es la de la consulta más lenta.
+    """
+    if not settings.COMPARADOR_CONSULTAS_PARALELAS:
+        return [await sync_to_async(consulta)() for consulta in consultas]
+
+    def aislar(consulta):
+        def ejecutar():
+            try:
+                return consulta()
+            finally:
+                close_old_connections()
+        return sync_to_async(ejecutar, thread_sensitive=False)()
+
+    return await asyncio.gather(*(aislar(consulta) for consulta in consultas))
 
 
-def index(view):
+@condicional
+async def index(request):
     """Vista principal - Dashboard con eventos próximos"""
-    # Obtener eventos activos (no finalizados y futuros)
-    eventos_proximos = Evento.objects.filter(
-        finalizado=False,
-        fecha_evento__gte=timezone.now()
-    ).select_related('deporte').prefetch_related('cuotas')[:20]
+    ahora = timezone.now()
+    
+    def eventos_proximos():
+        # Obtener eventos activos (no finalizados y futuros)
+        return list(Evento.objects.filter(
+            finalizado=False,
+            fecha_evento__gte=ahora
+        ).select_related('deporte')[:20])
     
-    # Obtener deportes disponibles
-    deportes = Deporte.objects.all()
+    version_referencias = version_referencias_peticion(request)
+    eventos, referencias = await _en_paralelo(eventos_proximos, lambda: obtener_referencias(version_referencias))
     
-    # Obtener estadísticas
-    total_eventos = eventos_proximos.count()
-    total_casas = CasaApuestas.objects.filter(activa=True).count()
+    # Número de cuotas por evento en una sola consulta agrupada
+    ids = [evento.id for evento in eventos]
+    totales = dict(await sync_to_async(lambda: list(
+        Cuota.objects.filter(evento_id__in=ids).order_by().values_list('evento_id').annotate(total=Count('id'))
+    ))())
+    for evento in eventos:
+        evento.total_cuotas = totales.get(evento.id, 0)
     
     context = {
-        'eventos': eventos_proximos,
-        'deportes': deportes,
-        'total_eventos': total_eventos,
-        'total_casas': total_casas,
+        'eventos': eventos,
+        'deportes': referencias.deportes,
+        'total_eventos': len(eventos),
+        'total_casas': len(referencias.casas_activas),
     }
-    return render(view, 'comparador/index.html', context)
+    return render(request, 'comparador/index.html', context)
 
 
-def evento_detalle(request, evento_id):
+@condicional
+async def evento_detalle(request, evento_id):
     """Vista detallada de un evento con comparación de cuotas"""
-    evento = get_object_or_404(
-        Evento.objects.select_related('deporte'),
-        id=evento_id
-    )
+    def obtener_evento():
+        return Evento.objects.select_related('deporte').filter(id=evento_id).first()
     
-    # Obtener todas las cuotas agrupadas por tipo
-    cuotas = Cuota.objects.filter(evento=evento).select_related(
-        'casa_apuestas', 'tipo_cuota'
-    ).order_by('tipo_cuota', 'opcion', '-valor')
+    def obtener_cuotas():
+        # Obtener todas las cuotas agrupadas por tipo
+        return list(Cuota.objects.filter(evento_id=evento_id).select_related(
+            'casa_apuestas', 'tipo_cuota'
+        ).order_by('tipo_cuota', 'opcion', '-valor'))
+    
+    # Evento y cuotas no dependen entre sí: se consultan a la vez
+    evento, cuotas = await _en_paralelo(obtener_evento, obtener_cuotas)
+    if evento is None:
+        raise Http404('No existe el evento solicitado')
     
     # Organizar cuotas por tipo
     cuotas_por_tipo = {}
@@ -62,6 +114,8 @@ def evento_detalle(request, evento_id):
         key = f"{cuota.tipo_cuota.codigo}_{cuota.opcion}"
         if key not in mejores_cuotas or cuota.valor > mejores_cuotas[key].valor:
             mejores_cuotas[key] = cuota
+    for cuota in mejores_cuotas.values():
+        cuota.es_mejor = True
     
     context = {
         'evento': evento,
@@ -71,85 +125,89 @@ def evento_detalle(request, evento_id):
     return render(request, 'comparador/evento_detalle.html', context)
 
 
+@condicional
 def eventos_por_deporte(request, deporte_slug):
     """Vista de eventos filtrados por deporte"""
-    deporte = get_object_or_404(Deporte, slug=deporte_slug)
+    deporte = obtener_referencias(version_referencias_peticion(request)).deporte(deporte_slug)
+    if deporte is None:
+        raise Http404('No existe el deporte solicitado')
     
     eventos = Evento.objects.filter(
         deporte=deporte,
         finalizado=False,
         fecha_evento__gte=timezone.now()
-    ).select_related('deporte').prefetch_related('cuotas')
+    ).select_related('deporte')
+    
+    # Las competiciones del deporte sirven de filtro por clave entera
+    competiciones = list(Competicion.objects.filter(deporte=deporte))
     
     # Filtros adicionales
-    liga = request.GET.get('liga')
-    if liga:
-        eventos = eventos.filter(liga__icontains=liga)
+    liga = request.GET.get('liga', '')
+    if liga.isdigit():
+        eventos = eventos.filter(competicion_id=int(liga))
     
     pais = request.GET.get('pais')
     if pais:
+        # Sobre el texto del evento: también filtra los eventos sin competición vinculada
         eventos = eventos.filter(pais__icontains=pais)
     
-    # Obtener ligas y países únicos para filtros
-    ligas = Evento.objects.filter(
-        deporte=deporte,
-        finalizado=False
-    ).values_list('liga', flat=True).distinct()
-    
-    paises = Evento.objects.filter(
-        deporte=deporte,
-        finalizado=False
-    ).values_list('pais', flat=True).distinct()
-    
     context = {
         'deporte': deporte,
         'eventos': eventos,
-        'ligas': [l for l in ligas if l],
-        'paises': [p for p in paises if p],
-        'liga_seleccionada': liga,
+        'ligas': competiciones,
+        'paises': sorted({c.pais for c in competiciones if c.pais}),
+        'liga_seleccionada': int(liga) if liga.isdigit() else None,
         'pais_seleccionado': pais,
     }
     return render(request, 'comparador/eventos_por_deporte.html', context)
 
 
+@condicional
 def mejores_cuotas(request):
     """Vista con las mejores cuotas disponibles"""
     # Obtener el tipo de cuota seleccionado (por defecto 1X2)
     tipo_codigo = request.GET.get('tipo', '1x2')
     
-    try:
-        tipo_cuota = TipoCuota.objects.get(codigo=tipo_codigo)
-    except TipoCuota.DoesNotExist:
-        tipo_cuota = TipoCuota.objects.first()
+    referencias = obtener_referencias(version_referencias_peticion(request))
+    tipo_cuota = referencias.tipo_cuota(tipo_codigo)
+    if tipo_cuota is None:
+        tipo_cuota = referencias.tipos_cuota[0] if referencias.tipos_cuota else None
     
     # Obtener eventos con sus mejores cuotas
+    ahora = timezone.now()
     eventos = Evento.objects.filter(
         finalizado=False,
-        fecha_evento__gte=timezone.now()
+        fecha_evento__gte=ahora
     ).select_related('deporte')
     
-    # Para cada evento, encontrar la mejor cuota
-    eventos_con_mejores_cuotas = []
-    for evento in eventos:
-        cuotas = Cuota.objects.filter(
-            evento=evento,
-            tipo_cuota=tipo_cuota
-        ).select_related('casa_apuestas').order_by('opcion', '-valor')
-        
-        if cuotas.exists():
-            # Agrupar por opción
-            opciones = {}
-            for cuota in cuotas:
-                if cuota.opcion not in opciones:
-                    opciones[cuota.opcion] = cuota
-            
-            eventos_con_mejores_cuotas.append({
-                'evento': evento,
-                'cuotas': opciones
-            })
+    # La mejor cuota de cada (evento, opción) en una sola consulta, resuelta sobre
+    # el índice cuota_mejor_precio_idx en lugar de una consulta por evento
+    mejores = Cuota.objects.filter(
+        tipo_cuota=tipo_cuota,
+        evento__finalizado=False,
+        evento__fecha_evento__gte=ahora
+    ).annotate(
+        posicion=Window(
+            RowNumber(),
+            partition_by=[F('evento_id'), F('opcion')],
+            order_by=[F('valor').desc(), F('casa_apuestas_id')]
+        )
+    ).filter(posicion=1).select_related('casa_apuestas').only(
+        'evento_id', 'opcion', 'valor', 'casa_apuestas__nombre', 'casa_apuestas__url'
+    ).order_by('opcion')
+    
+    por_evento = {}
+    for cuota in mejores:
+        por_evento.setdefault(cuota.evento_id, {})[cuota.opcion] = cuota
+    
+    eventos_con_mejores_cuotas = [
+        {'evento': evento, 'cuotas': por_evento[evento.id]}
+        for evento in eventos
+        if evento.id in por_evento
+    ]
     
     # Obtener todos los tipos de cuota disponibles
-    tipos_cuota = TipoCuota.objects.all()
+    tipos_cuota = referencias.tipos_cuota
     
     context = {
         'eventos_cuotas': eventos_con_mejores_cuotas,
@@ -159,16 +217,26 @@ def mejores_cuotas(request):
     return render(request, 'comparador/mejores_cuotas.html', context)
 
 
+@condicional
 def buscar(request):
     """Vista de búsqueda de eventos"""
     query = request.GET.get('q', '')
     resultados = []
     
-    if query:
+    if query and normalizar_nombre(query):
+        # Se busca en las tablas pequeñas de nombres normalizados (y alias) y los eventos
+        # se filtran por clave entera, sin LIKE sobre la tabla de eventos
+        normalizado = normalizar_nombre(query)
+        equipos = Equipo.objects.filter(
+            Q(nombre_normalizado__contains=normalizado) | Q(alias__alias__contains=normalizado)
+        ).values('id')
+        competiciones = Competicion.objects.filter(
+            Q(nombre_normalizado__contains=normalizado) | Q(alias__alias__contains=normalizado)
+        ).values('id')
         resultados = Evento.objects.filter(
-            Q(equipo_local__icontains=query) |
-            Q(equipo_visitante__icontains=query) |
-            Q(liga__icontains=query),
+            Q(local__in=equipos) |
+            Q(visitante__in=equipos) |
+            Q(competicion__in=competiciones),
             finalizado=False,
             fecha_evento__gte=timezone.now()
         ).select_related('deporte')[:50]
@@ -180,13 +248,130 @@ def buscar(request):
     return render(request, 'comparador/buscar.html', context)
 
 
+@condicional
+def apuestas_valor(request):
+    """Vista de cuotas que superan la probabilidad justa del consenso, ordenadas por ventaja"""
+    # Calculadas una vez por versión de los datos sobre todos los mercados abiertos
+    candidatas = obtener_apuestas_valor()
+    
+    cuotas = Cuota.objects.filter(
+        id__in=[cuota_id for cuota_id, _, _, _ in candidatas],
+        evento__fecha_evento__gte=timezone.now()
+    ).select_related('evento__deporte', 'casa_apuestas', 'tipo_cuota').in_bulk()
+    
+    apuestas = []
+    for cuota_id, probabilidad, ventaja, casas in candidatas:
+        cuota = cuotas.get(cuota_id)
+        if cuota is None:
+            continue
+        cuota.probabilidad_pct = probabilidad * 100
+        cuota.cuota_justa = 1 / probabilidad
+        cuota.ventaja_pct = ventaja * 100
+        cuota.casas_consenso = casas
+        apuestas.append(cuota)
+        if len(apuestas) == 100:
+            break
+    
+    context = {
+        'apuestas': apuestas,
+        'umbral_pct': settings.COMPARADOR_UMBRAL_VALOR * 100,
+    }
+    return render(request, 'comparador/apuestas_valor.html', context)
+
+
+@condicional
 def casas_apuestas(request):
-    """Vista de todas las casas de apuestas"""
-    casas = CasaApuestas.objects.filter(activa=True).annotate(
-        total_cuotas=Count('cuotas')
-    )
+    """Vista de todas las casas de apuestas, ordenadas por margen medio"""
+    # Contadores mantenidos por los procesos de escritura: sin recorrer la tabla de cuotas
+    casas = list(CasaApuestas.objects.filter(activa=True).select_related('estadisticas'))
+    
+    # Márgenes precalculados por el job de márgenes (deporte nulo = global)
+    estadisticas = EstadisticaMargen.objects.filter(
+        casa_apuestas__activa=True
+    ).select_related('deporte').order_by('deporte__nombre')
+    
+    por_casa = {}
+    for estadistica in estadisticas:
+        margenes = por_casa.setdefault(estadistica.casa_apuestas_id, {'global': None, 'deportes': []})
+        # Expresar en puntos porcentuales para la plantilla
+        estadistica.margen_medio_pct = estadistica.margen_medio * 100
+        estadistica.margen_p50_pct = estadistica.margen_p50 * 100
+        estadistica.margen_p90_pct = estadistica.margen_p90 * 100
+        if estadistica.deporte_id is None:
+            margenes['global'] = estadistica
+        else:
+            margenes['deportes'].append(estadistica)
+    
+    for casa in casas:
+        casa.stats = getattr(casa, 'estadisticas', None)
+        margenes = por_casa.get(casa.id, {'global': None, 'deportes': []})
+        casa.margen = margenes['global']
+        casa.margenes_deporte = margenes['deportes']
+    
+    # Las casas sin estadísticas van al final
+    casas.sort(key=lambda casa: (casa.margen is None, casa.margen.margen_medio if casa.margen else 0))
     
     context = {
         'casas': casas,
     }
     return render(request, 'comparador/casas_apuestas.html', context)
+
+
+@csrf_exempt
+@require_POST
+def ingesta_cuotas(request):
+    """Upsert de cuotas desde un cuerpo NDJSON (o array JSON) leído en streaming"""
+    token = settings.COMPARADOR_TOKEN_INGESTA
+    if not token:
+        return JsonResponse({'error': 'Ingesta desactivada'}, status=403)
+    autorizacion = request.headers.get('Authorization', '')
+    if not hmac.compare_digest(autorizacion.encode(), f'Bearer {token}'.encode()):
+        respuesta = JsonResponse({'error': 'Token no válido'}, status=401)
+        respuesta['WWW-Authenticate'] = 'Bearer'
+        return respuesta
+
+    # Nunca request.body: el cuerpo se consume por lotes a medida que llega
+    if request.content_type == 'application/json':
+        registros = leer_array_json(request)
+    else:
+        registros = leer_ndjson(request)
+    resultado = ingerir(registros, settings.COMPARADOR_LOTE_INGESTA)
+    return JsonResponse(resultado, status=400 if 'error' in resultado else 200)
+
+
+def cambios_cuotas(request):
+    """Cuotas cambiadas después de la secuencia `desde`, para clientes que consultan por sondeo"""
+    try:
+        desde = int(request.GET['desde'])
+        limite = min(int(request.GET.get('limite', settings.COMPARADOR_LIMITE_CAMBIOS)), settings.COMPARADOR_LIMITE_CAMBIOS)
+    except (KeyError, ValueError):
+        return JsonResponse({'error': 'Parámetros desde/limite no válidos'}, status=400)
+    if desde < 0 or limite < 1:
+        return JsonResponse({'error': 'Parámetros desde/limite no válidos'}, status=400)
+
+    try:
+        return JsonResponse(cambios_desde(desde, limite))
+    except ResincronizacionNecesaria as exc:
+        # 410: recargar el estado completo y seguir desde la secuencia actual
+        minimo, actual = exc.args
+        return JsonResponse({'error': 'resincronizar', 'minimo': minimo, 'actual': actual}, status=410)
+
+
+@condicional
+def comparacion_eventos(request):
+    """Comparación de cuotas de varios eventos a la vez (?eventos=1,2,3&tipos=1x2,over_under)"""
+    try:
+        # Sin repetidos y en el orden pedido
+        eventos_ids = list(dict.fromkeys(int(valor) for valor in request.GET.get('eventos', '').split(',') if valor))
+    except ValueError:
+        eventos_ids = []
+    if not eventos_ids or len(eventos_ids) > settings.COMPARADOR_MAXIMO_COMPARACION:
+        return JsonResponse(
+            {'error': f'Indica entre 1 y {settings.COMPARADOR_MAXIMO_COMPARACION} ids de evento en eventos='},
+            status=400,
+        )
+    tipos = {codigo for codigo in request.GET.get('tipos', '').split(',') if codigo}
+
+    version, _ = version_peticion(request)
+    eventos, no_encontrados = obtener_comparaciones(eventos_ids, tipos, version)
+    return JsonResponse({'eventos': eventos, 'no_encontrados': no_encontrados})
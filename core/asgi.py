@@ -3,6 +3,11 @@ ASGI config for core project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+The dashboard and event detail views are async and run their independent
+queries concurrently; serve them with an ASGI server, e.g.
+``uvicorn core.asgi:application``, to avoid the per-request sync/async
+adaptation of a WSGI deployment.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.0/howto/deployment/asgi/
 """
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.0/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -48,6 +49,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'comparador.middleware.PrerenderizadoMiddleware',
 ]
 
 ROOT_URLCONF = 'core.urls'
@@ -122,3 +124,43 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/5.0/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# Comparador
+# Segundos durante los que un ETag/Last-Modified sigue siendo válido sin cambios
+# en los datos (las vistas filtran por fecha_evento >= ahora)
+COMPARADOR_VENTANA_VALIDADOR = 60
+
+# Las vistas async ejecutan sus consultas independientes en hilos y conexiones
+# separadas (desactivar en pruebas dentro de una transacción)
+COMPARADOR_CONSULTAS_PARALELAS = True
+
+# Apuestas de valor: valor esperado mínimo frente a la probabilidad justa de consenso,
+# casas mínimas que deben cotizar la selección y pesos por casa (el resto pesa 1)
+COMPARADOR_UMBRAL_VALOR = 0.02
+COMPARADOR_MINIMO_CASAS_CONSENSO = 3
+COMPARADOR_PESOS_CONSENSO = {'Pinnacle': 3.0}
+COMPARADOR_MAXIMO_APUESTAS_VALOR = 500
+COMPARADOR_CACHE_APUESTAS_VALOR = 3600
+
+# Páginas pre-renderizadas por `prerenderizar`: directorio, segundos que un archivo
+# se considera vigente y número de próximos eventos con detalle pre-renderizado
+COMPARADOR_PRERENDER_DIR = BASE_DIR / 'prerenderizado'
+COMPARADOR_PRERENDER_VIGENCIA = 300
+COMPARADOR_PRERENDER_EVENTOS = 50
+
+# Métricas de cola y antigüedad por nivel que publica `actualizar_cuotas --daemon`
+COMPARADOR_METRICAS_PLANIFICADOR = BASE_DIR / 'metricas_planificador.json'
+
+# Ingesta de cuotas por POST (api/cuotas/): token Bearer requerido (vacío desactiva
+# el endpoint) y registros por lote, cada lote en su propia transacción
+COMPARADOR_TOKEN_INGESTA = os.environ.get('COMPARADOR_TOKEN_INGESTA', '')
+COMPARADOR_LOTE_INGESTA = 5000
+
+# Máximo de cambios por respuesta del registro de cambios (api/cambios/)
+COMPARADOR_LIMITE_CAMBIOS = 1000
+
+# Comparación por lotes (api/comparacion/): eventos por petición y segundos en caché
+# de la comparación de cada evento (la clave incluye la versión de los datos)
+COMPARADOR_MAXIMO_COMPARACION = 50
+COMPARADOR_CACHE_COMPARACION = 3600
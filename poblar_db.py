@@ -1,17 +1,30 @@
 #!/usr/bin/env python
 """
 Script para poblar la base de datos con datos de ejemplo
+
+Sin argumentos crea un conjunto pequeño de ejemplo. Con --eventos (y el resto de
+parámetros) genera un conjunto masivo y reproducible para pruebas de capacidad:
+
+    python poblar_db.py --eventos 100000 --casas 12 --semilla 42
 """
+import argparse
 import os
 import django
 import random
-from datetime import datetime, timedelta
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
 
 # Configurar Django
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
 django.setup()
 
+from django.db import transaction
+from django.utils import timezone
+from comparador.estadisticas import recalcular_estadisticas
+from comparador.instantaneas import upsert_cuotas
 from comparador.models import CasaApuestas, Deporte, Evento, TipoCuota, Cuota
+from comparador.normalizacion import IndiceCompeticiones, IndiceEquipos, vincular_eventos
+from comparador.versiones import lote_escritura
 
 
 def poblar_casas_apuestas():
@@ -167,16 +180,23 @@ def poblar_eventos():
     ]
 
     deportes = {d.slug: d for d in Deporte.objects.all()}
+    equipos = IndiceEquipos()
+    competiciones = IndiceCompeticiones()
 
     for evento_data in eventos_data:
         deporte_slug = evento_data.pop('deporte')
         if deporte_slug in deportes:
             evento_data['deporte'] = deportes[deporte_slug]
+            deporte_id = evento_data['deporte'].id
+            evento_data['competicion_id'] = competiciones.resolver(
+                deporte_id, evento_data['liga'], pais=evento_data['pais']
+            )
 
+            # Deduplicación por claves enteras: distintas grafías del mismo equipo coinciden
             evento, created = Evento.objects.get_or_create(
                 deporte=evento_data['deporte'],
-                equipo_local=evento_data['equipo_local'],
-                equipo_visitante=evento_data['equipo_visitante'],
+                local_id=equipos.resolver(deporte_id, evento_data['equipo_local']),
+                visitante_id=equipos.resolver(deporte_id, evento_data['equipo_visitante']),
                 fecha_evento=evento_data['fecha_evento'],
                 defaults=evento_data
             )
@@ -256,8 +276,220 @@ def generar_cuota_aleatoria(tipo_cuota):
     return round(random.uniform(min_val, max_val), 2)
 
 
+# --- Modo masivo ---------------------------------------------------------
+
+DEPORTES_MASIVO = [
+    ('Fútbol', 'futbol', 'fas fa-futbol'),
+    ('Baloncesto', 'baloncesto', 'fas fa-basketball-ball'),
+    ('Tenis', 'tenis', 'fas fa-table-tennis'),
+    ('Fútbol Americano', 'futbol-americano', 'fas fa-football-ball'),
+    ('Golf', 'golf', 'fas fa-golf-ball'),
+    ('Hockey', 'hockey', 'fas fa-hockey-puck'),
+    ('Béisbol', 'beisbol', 'fas fa-baseball-ball'),
+    ('Voleibol', 'voleibol', 'fas fa-volleyball-ball'),
+]
+
+CASAS_MASIVO = ['Bet365', 'William Hill', 'Pinnacle', 'Betfair', 'Bwin']
+
+TIPOS_MASIVO = [
+    ('1X2', '1x2', 'Resultado final del partido'),
+    ('Over/Under', 'over_under', 'Más o menos de una cantidad'),
+    ('Handicap', 'handicap', 'Ventaja o desventaja'),
+    ('Doble Oportunidad', 'double_chance', 'Dos resultados posibles'),
+]
+
+PAISES_MASIVO = ['España', 'Inglaterra', 'Italia', 'Francia', 'Alemania', 'Estados Unidos', 'Argentina', 'Brasil']
+
+# Horas de inicio habituales y su peso relativo
+HORAS_INICIO = [(12, 1), (14, 2), (16, 3), (17, 2), (18, 4), (19, 3), (20, 5), (21, 4), (22, 1)]
+
+
+def crear_referencias_masivo(args):
+    """Crea (o reutiliza) casas, deportes y tipos de cuota para el modo masivo"""
+    casas = []
+    for i in range(args.casas):
+        nombre = CASAS_MASIVO[i] if i < len(CASAS_MASIVO) else f'Casa {i + 1}'
+        slug = nombre.lower().replace(' ', '')
+        casa, _ = CasaApuestas.objects.get_or_create(
+            nombre=nombre,
+            defaults={'url': f'https://www.{slug}.com'}
+        )
+        casas.append(casa)
+
+    deportes = []
+    for i in range(args.deportes):
+        if i < len(DEPORTES_MASIVO):
+            nombre, slug, icono = DEPORTES_MASIVO[i]
+        else:
+            nombre, slug, icono = f'Deporte {i + 1}', f'deporte-{i + 1}', ''
+        deporte, _ = Deporte.objects.get_or_create(
+            slug=slug,
+            defaults={'nombre': nombre, 'icono': icono}
+        )
+        deportes.append(deporte)
+
+    tipos = []
+    for i in range(args.tipos):
+        if i < len(TIPOS_MASIVO):
+            nombre, codigo, descripcion = TIPOS_MASIVO[i]
+        else:
+            nombre, codigo, descripcion = f'Mercado {i + 1}', f'mercado_{i + 1}', ''
+        tipo, _ = TipoCuota.objects.get_or_create(
+            codigo=codigo,
+            defaults={'nombre': nombre, 'descripcion': descripcion}
+        )
+        tipos.append(tipo)
+
+    return casas, deportes, tipos
+
+
+def generar_fecha_evento(rng, fecha_base, dias):
+    """Fecha de inicio realista: más partidos en fin de semana y a horas habituales"""
+    pesos_dia = [3 if (fecha_base + timedelta(days=d)).weekday() >= 5 else 1 for d in range(dias)]
+    dia = rng.choices(range(dias), weights=pesos_dia)[0]
+    hora = rng.choices([h for h, _ in HORAS_INICIO], weights=[p for _, p in HORAS_INICIO])[0]
+    minuto = rng.choice([0, 0, 0, 15, 30, 45])
+    return fecha_base + timedelta(days=dia, hours=hora, minutes=minuto)
+
+
+def probabilidades_mercado(rng, opciones):
+    """Probabilidades 'reales' de las opciones de un mercado (suman 1)"""
+    if len(opciones) == 3 and opciones[1] == 'X':
+        # 1X2: fuerza relativa del local con ventaja de campo y empate acotado
+        local = rng.betavariate(2.2, 1.8)
+        empate = rng.uniform(0.18, 0.32)
+        return [local * (1 - empate), empate, (1 - local) * (1 - empate)]
+    pesos = [rng.gammavariate(4, 1) for _ in opciones]
+    total = sum(pesos)
+    return [peso / total for peso in pesos]
+
+
+def generar_cuotas_evento(rng, evento_id, casas, tipos, margenes):
+    """Cuotas de todas las casas para un evento: mismo mercado, margen y ruido por casa"""
+    for tipo, opciones in tipos:
+        probabilidades = probabilidades_mercado(rng, opciones)
+        for casa in casas:
+            margen = margenes[casa.id]
+            for opcion, probabilidad in zip(opciones, probabilidades):
+                ruido = rng.gauss(1, 0.02)
+                valor = 1 / (probabilidad * (1 + margen) * ruido)
+                valor = round(max(1.01, min(100.0, valor)), 2)
+                yield (evento_id, casa.id, tipo.id, opcion, valor, None)
+
+
+def poblar_masivo(args):
+    """Genera un conjunto de datos grande y reproducible a partir de una semilla"""
+    rng = random.Random(args.semilla)
+    fecha_base = args.fecha_base
+
+    print(f'🚀 Modo masivo: {args.eventos} eventos, {args.casas} casas, {args.deportes} deportes, '
+          f'{args.ligas} ligas/deporte, {args.tipos} tipos, semilla {args.semilla}\n')
+
+    casas, deportes, tipos = crear_referencias_masivo(args)
+    tipos = [(tipo, obtener_opciones_por_tipo(tipo)) for tipo in tipos]
+    # Las casas con margen bajo (tipo Pinnacle) conviven con otras más caras
+    margenes = {casa.id: rng.uniform(0.02, 0.09) for casa in casas}
+
+    ligas = {
+        deporte.id: [
+            (f'Liga {deporte.nombre} {j + 1}', rng.choice(PAISES_MASIVO),
+             [f'{deporte.nombre[:3].upper()} {j + 1}-{k + 1:02d}' for k in range(20)])
+            for j in range(args.ligas)
+        ]
+        for deporte in deportes
+    }
+    # El fútbol concentra la mayor parte de los eventos
+    pesos_deporte = [1 / (i + 1) for i in range(len(deportes))]
+
+    # Índices de nombres cargados una vez: la resolución por evento no consulta la base de datos
+    indice_equipos = IndiceEquipos()
+    indice_competiciones = IndiceCompeticiones()
+
+    inicio = time.perf_counter()
+    total_eventos = total_cuotas = 0
+    with lote_escritura():
+        while total_eventos < args.eventos:
+            cantidad = min(args.lote_eventos, args.eventos - total_eventos)
+            eventos = []
+            for _ in range(cantidad):
+                deporte = rng.choices(deportes, weights=pesos_deporte)[0]
+                liga, pais, equipos = rng.choice(ligas[deporte.id])
+                local, visitante = rng.sample(equipos, 2)
+                eventos.append(Evento(
+                    deporte=deporte,
+                    equipo_local=local,
+                    equipo_visitante=visitante,
+                    fecha_evento=generar_fecha_evento(rng, fecha_base, args.dias),
+                    liga=liga,
+                    pais=pais,
+                ))
+
+            with transaction.atomic():
+                vincular_eventos(eventos, indice_equipos, indice_competiciones)
+                Evento.objects.bulk_create(eventos, batch_size=args.lote)
+                total_cuotas += upsert_cuotas(
+                    (
+                        cuota
+                        for evento in eventos
+                        for cuota in generar_cuotas_evento(rng, evento.id, casas, tipos, margenes)
+                    ),
+                    args.lote,
+                )
+            total_eventos += cantidad
+
+            duracion = time.perf_counter() - inicio
+            print(f'  {total_eventos} eventos, {total_cuotas} cuotas '
+                  f'({total_cuotas / max(duracion, 1e-9):,.0f} cuotas/s)')
+
+        recalcular_estadisticas()
+
+    duracion = time.perf_counter() - inicio
+    print(f'\n🎉 {total_eventos} eventos y {total_cuotas} cuotas en {duracion:.1f}s '
+          f'({total_cuotas / max(duracion, 1e-9):,.0f} cuotas/s)')
+
+
+def fecha_utc(valor):
+    """Fecha ISO en UTC: sin zona se toma como UTC; con zona se convierte conservando el instante"""
+    fecha = datetime.fromisoformat(valor)
+    if timezone.is_naive(fecha):
+        return timezone.make_aware(fecha, dt_timezone.utc)
+    return fecha.astimezone(dt_timezone.utc)
+
+
+def parsear_argumentos(argv=None):
+    """Parámetros del modo masivo; sin --eventos se usa el conjunto de ejemplo"""
+    hoy = datetime.now(dt_timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+    parser = argparse.ArgumentParser(description='Pobla la base de datos con datos de ejemplo')
+    parser.add_argument('--eventos', type=int, help='Número de eventos a generar (activa el modo masivo)')
+    parser.add_argument('--casas', type=int, default=5, help='Número de casas de apuestas (por defecto: 5)')
+    parser.add_argument('--deportes', type=int, default=3, help='Número de deportes (por defecto: 3)')
+    parser.add_argument('--ligas', type=int, default=4, help='Ligas por deporte (por defecto: 4)')
+    parser.add_argument('--tipos', type=int, default=4, help='Tipos de cuota (por defecto: 4)')
+    parser.add_argument('--semilla', type=int, default=42, help='Semilla aleatoria (por defecto: 42)')
+    parser.add_argument('--dias', type=int, default=14, help='Horizonte de fechas en días (por defecto: 14)')
+    parser.add_argument(
+        '--fecha-base',
+        type=fecha_utc,
+        default=hoy,
+        help='Fecha inicial (ISO; UTC si no lleva zona) de los eventos; fíjala para resultados idénticos entre días',
+    )
+    parser.add_argument('--lote', type=int, default=10000, help='Filas por sentencia INSERT (por defecto: 10000)')
+    parser.add_argument(
+        '--lote-eventos',
+        type=int,
+        default=2000,
+        help='Eventos por transacción (por defecto: 2000)',
+    )
+    return parser.parse_args(argv)
+
+
 def main():
     """Función principal"""
+    args = parsear_argumentos()
+    if args.eventos:
+        poblar_masivo(args)
+        return
+
     print('🚀 Iniciando población de base de datos...\n')
 
     try:
@@ -279,6 +511,7 @@ def main():
 
         print('💰 Creando cuotas...')
         poblar_cuotas()
+        recalcular_estadisticas()
 
         total_cuotas = Cuota.objects.count()
         print(f'✓ {total_cuotas} cuotas totales\n')